@@ -1,289 +1,3346 @@
 import re
 import requests
-from urllib.parse import urljoin, urlparse
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit, SplitResult
+from bs4 import BeautifulSoup, NavigableString
+from html.parser import HTMLParser
 from tqdm import tqdm
 import hashlib
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from config import *
 from config import IMPORTER_ASSETS_EXTENSIONS
+import config
 import csv
 import os
-from dataclasses import dataclass
 from enum import Enum
 from rich.live import Live
 from rich.table import Table
 import copy
 import argparse
+import array
+import asyncio
+import bisect
+import codecs
+import collections
+import email.utils
+from datetime import datetime, timezone
+import functools
+import gzip
+import heapq
+import http.client
+import io
+import itertools
+import json
+import mimetypes
+import fcntl
+import mmap
+import multiprocessing
+import operator
+import queue
+import random
+import shutil
+import socket
+import tempfile
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import urllib.request
+import urllib.robotparser
+import xml.etree.ElementTree as ElementTree
 
 class Status(Enum):
     NEW = "new"
     DOWNLOADED = "downloaded"
     IGNORED = "ignored"
     ERROR = "error"
+    RETRY = "retry"
+    DISCOVERY = "discovery"  # queued to be fetched for its links only
+    VISITED = "visited"  # fetched for its links, HTML not stored
+    IN_PROGRESS = "in-progress"  # handed to a worker until lease_until, see IMPORTER_LEASE_DURATION
+    DUPLICATE = "duplicate"  # near-duplicate of the page duplicate_of, not stored, links not followed
+    ASSET = "asset"  # served a non-HTML body, stored as an asset under the same url
+
+
+class ErrorKind(Enum):
+    DNS = "dns"
+    CONNECT_TIMEOUT = "connect-timeout"
+    CONNECTION = "connection"
+    READ_TIMEOUT = "read-timeout"
+    THROTTLED = "429"
+    CLIENT_ERROR = "4xx"
+    SERVER_ERROR = "5xx"
+    PARSE_ERROR = "parse"
+    TOO_LARGE = "too-large"  # over IMPORTER_ASSET_MAX_SIZE
+    OTHER = "other"
+
+
+RETRYABLE_ERRORS = {
+    ErrorKind.DNS, ErrorKind.CONNECT_TIMEOUT, ErrorKind.CONNECTION, ErrorKind.READ_TIMEOUT,
+    ErrorKind.THROTTLED, ErrorKind.SERVER_ERROR,
+}
+
+
+class AssetTooLarge(Exception):
+    pass
+
+
+class RangeMismatch(ValueError):
+    """The bytes a PartialContentWriter kept cannot be resumed, they were discarded."""
+
+
+def default_file_mode() -> int:
+    """Mode open() gives new files under the current umask."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# mkstemp() creates files readable by their owner only, renamed into place they get the usual mode
+FILE_MODE = default_file_mode()
+
+
+def exception_chain(e: BaseException):
+    seen = set()
+    pending = [e]
+    while pending:
+        current = pending.pop()
+        if current is None or id(current) in seen:
+            continue
+        seen.add(id(current))
+        yield current
+        pending.extend([current.__cause__, current.__context__])
+        # urllib3 and aiohttp keep the underlying error in reason and os_error, ssl.SSLError's reason is a str
+        pending.extend(cause for cause in (getattr(current, "reason", None), getattr(current, "os_error", None))
+                       if isinstance(cause, BaseException))
+
+
+def response_status(e: Exception) -> int:
+    """Status code of a requests.HTTPError or aiohttp.ClientResponseError."""
+    response = getattr(e, "response", None)
+    if response is not None:
+        return response.status_code
+    return getattr(e, "status", None)
+
+
+def classify_error(e: Exception) -> ErrorKind:
+    if isinstance(e, AssetTooLarge):
+        return ErrorKind.TOO_LARGE
+    status = response_status(e)
+    if status is not None:
+        if status == 429:
+            return ErrorKind.THROTTLED
+        return ErrorKind.SERVER_ERROR if status >= 500 else ErrorKind.CLIENT_ERROR
+    chain = list(exception_chain(e))
+    if any(isinstance(cause, socket.gaierror) for cause in chain):
+        return ErrorKind.DNS
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return ErrorKind.CONNECT_TIMEOUT
+    if isinstance(e, (requests.exceptions.ReadTimeout, asyncio.TimeoutError)):
+        return ErrorKind.READ_TIMEOUT
+    aiohttp = sys.modules.get("aiohttp")
+    # a body cut off by a dropped connection is a connection error as well
+    if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError, ConnectionError)) \
+            or (aiohttp is not None and isinstance(e, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError))) \
+            or any(isinstance(cause, (ConnectionError, http.client.IncompleteRead)) for cause in chain):
+        return ErrorKind.CONNECTION
+    return ErrorKind.OTHER
+
+
+def retry_after(e: Exception) -> float:
+    """Seconds requested by a Retry-After header (delta-seconds or HTTP-date), or 0."""
+    response = getattr(e, "response", None)
+    headers = response.headers if response is not None else getattr(e, "headers", None)
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return 0.0
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def content_range(value: str) -> tuple[int, int]:
+    """First byte and complete length of a Content-Range header, None for what it does not give."""
+    match = re.fullmatch(r"bytes (\d+)-\d+/(\d+|\*)", (value or "").strip())
+    if match is None:
+        return None, None
+    return int(match[1]), int(match[2]) if match[2] != "*" else None
+
+
+def backoff_delay(attempts: int) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(IMPORTER_RETRY_MAX_DELAY, IMPORTER_RETRY_BASE_DELAY * 2 ** (attempts - 1)))
+
 
-@dataclass
 class SitemapEntry:
-    status: Status = None
-    hash: str = None
-    path: str = None
-    mimetype: str = None
-    error: str = None
+    """
+    Compact sitemap row: the sha256 is kept as 32 raw bytes (exposed as hex through `hash`),
+    content-addressed paths only keep their interned extension and mimetypes are interned,
+    so a million entries share a handful of extension and mimetype strings.
+    """
+    __slots__ = ("status", "digest", "stored_path", "mimetype", "error", "etag", "last_modified",
+                 "error_kind", "attempts", "next_attempt_at", "lease_until", "simhash", "duplicate_of")
+    fields = ("status", "hash", "path", "mimetype", "error", "etag", "last_modified",
+              "error_kind", "attempts", "next_attempt_at", "lease_until", "simhash", "duplicate_of")
+
+    def __init__(self, status: Status = None, hash: str = None, path: str = None, mimetype: str = None,
+                 error: str = None, etag: str = None, last_modified: str = None, error_kind: ErrorKind = None,
+                 attempts: int = 0, next_attempt_at: float = 0.0, lease_until: float = 0.0, simhash: int = None,
+                 duplicate_of: str = None):
+        self.status = status
+        self.hash = hash
+        self.path = path
+        self.mimetype = sys.intern(mimetype) if mimetype else mimetype
+        self.error = error
+        self.etag = etag
+        self.last_modified = last_modified
+        self.error_kind = error_kind
+        self.attempts = attempts
+        self.next_attempt_at = next_attempt_at
+        self.lease_until = lease_until
+        self.simhash = simhash
+        self.duplicate_of = duplicate_of
+
+    @property
+    def hash(self) -> str:
+        return self.digest.hex() if self.digest is not None else None
+
+    @hash.setter
+    def hash(self, value: str):
+        self.digest = bytes.fromhex(value) if value else None
+
+    @property
+    def path(self) -> str:
+        if self.stored_path and self.stored_path.startswith("."):
+            return self.hash + self.stored_path
+        return self.stored_path
+
+    @path.setter
+    def path(self, value: str):
+        checksum = self.hash
+        if value and checksum and value.startswith(checksum + "."):
+            value = sys.intern(value[len(checksum):])
+        self.stored_path = value
+
+    def __copy__(self):
+        entry = SitemapEntry.__new__(SitemapEntry)
+        for name in self.__slots__:
+            setattr(entry, name, getattr(self, name))
+        return entry
+
+    def __eq__(self, other):
+        if not isinstance(other, SitemapEntry):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"SitemapEntry({', '.join(f'{name}={getattr(self, name)!r}' for name in self.fields)})"
+
+class Sitemap(dict[str, SitemapEntry]):
+    """
+    State of a crawl: url -> SitemapEntry. Every status is counted, the urls of the statuses the
+    frontiers read are also indexed. Those are few next to the downloaded and finished urls of a
+    large state, which are found with a scan of the entries.
+    """
+
+    indexed_statuses = (Status.NEW, Status.DISCOVERY, Status.RETRY, Status.IN_PROGRESS)
+    file_path: str = None
+    changed: set[str] = None  # when set, collects the urls put since it was last emptied
+    fieldnames = ["url", "status", "hash", "path", "mimetype", "error", "etag", "last_modified",
+                  "error_kind", "attempts", "next_attempt_at", "lease_until", "simhash", "duplicate_of"]
+
+    def __init__(self, file_path: str, start_url: str, flush_interval: float = IMPORTER_STATE_FLUSH_INTERVAL):
+        super().__init__()
+        self.file_path = file_path
+        self.lock = threading.RLock()
+        self.by_status: dict[Status, dict[str, None]] = {status: {} for status in self.indexed_statuses}
+        self.counts = dict.fromkeys(Status, 0)
+        self.dirty: set[str] = set()  # urls put since the last persist()
+        self.flush_interval = flush_interval
+        self.flushed_at = time.monotonic()
+
+        self.load()
+        if not self and start_url:
+            self.add_new(start_url)
+
+    @staticmethod
+    def entry_from_row(row: dict) -> SitemapEntry:
+        return SitemapEntry(
+            Status(row.get("status")),
+            row.get("hash"),
+            row.get("path"),
+            row.get("mimetype", ""),
+            row.get("error", ""),
+            row.get("etag") or None,
+            row.get("last_modified") or None,
+            ErrorKind(row["error_kind"]) if row.get("error_kind") else None,
+            int(row.get("attempts") or 0),
+            float(row.get("next_attempt_at") or 0),
+            float(row.get("lease_until") or 0),
+            int(row["simhash"], 16) if row.get("simhash") else None,
+            row.get("duplicate_of") or None,
+        )
+
+    @staticmethod
+    def entry_to_row(url: str, data: SitemapEntry) -> dict:
+        return {
+            "url": url,
+            "status": data.status.value,
+            "hash": data.hash,
+            "path": data.path,
+            "mimetype": data.mimetype,
+            "error": data.error,
+            "etag": data.etag,
+            "last_modified": data.last_modified,
+            "error_kind": data.error_kind.value if data.error_kind else None,
+            "attempts": data.attempts or None,
+            "next_attempt_at": data.next_attempt_at or None,
+            "lease_until": data.lease_until or None,
+            "simhash": f"{data.simhash:016x}" if data.simhash is not None else None,
+            "duplicate_of": data.duplicate_of
+        }
+
+    def __setitem__(self, url: str, entry: SitemapEntry):
+        previous = self.get(url)
+        if previous is not None:
+            self.counts[previous.status] -= 1
+            if previous.status in self.by_status:
+                self.by_status[previous.status].pop(url, None)
+        super().__setitem__(url, entry)
+        self.counts[entry.status] += 1
+        if entry.status in self.by_status:
+            self.by_status[entry.status][url] = None
+        if self.changed is not None:
+            self.changed.add(url)
+
+    def __delitem__(self, url: str):
+        entry = self[url]
+        super().__delitem__(url)
+        self.counts[entry.status] -= 1
+        if entry.status in self.by_status:
+            self.by_status[entry.status].pop(url, None)
+
+    def clear(self):
+        super().clear()
+        for urls in self.by_status.values():
+            urls.clear()
+        self.counts = dict.fromkeys(Status, 0)
+
+    def count(self, status: Status) -> int:
+        return self.counts[status]
+
+    def urls(self, status: Status):
+        """The urls with status, from the index or a scan of the entries."""
+        if status in self.by_status:
+            return self.by_status[status]
+        return (url for url, entry in self.items() if entry.status is status)
+
+    def read_csv(self, file_path: str):
+        with open(file_path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield row["url"], self.entry_from_row(row)
+
+    def write_csv(self, file_path: str):
+        """
+        Write the state next to file_path and rename it over file_path once it is on disk, so a run
+        killed halfway through a write leaves the previous state instead of a truncated file.
+        """
+        directory = os.path.dirname(os.path.abspath(file_path))
+        # held for the whole write, so an older snapshot is never renamed over a newer one
+        with self.lock:
+            rows = [self.entry_to_row(url, data) for url, data in self.items()]
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(file_path) + ".",
+                                             suffix=".tmp")
+            try:
+                os.fchmod(fd, FILE_MODE)
+                with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+                    writer = csv.DictWriter(f, fieldnames=self.fieldnames)
+                    writer.writeheader()
+                    writer.writerows(rows)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, file_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            # make the rename itself durable
+            directory_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+
+    def load(self):
+        if os.path.exists(self.file_path):
+            with self.lock:
+                for url, entry in self.read_csv(self.file_path):
+                    self[url] = entry
+        return self
+
+    def persist(self):
+        with self.lock:
+            self.write_csv(self.file_path)
+            self.dirty.clear()
+            self.flushed_at = time.monotonic()
+
+    def close(self):
+        self.persist()
+
+    def checkpoint(self):
+        """
+        persist() once flush_interval seconds have passed since the last write. Every write rewrites
+        the whole file, so a killed run loses at most that much work instead of every change costing a rewrite.
+        """
+        with self.lock:
+            if self.dirty and time.monotonic() - self.flushed_at >= self.flush_interval:
+                self.persist()
+
+    def put(self, url: str, entry: SitemapEntry, persist=True):
+        with self.lock:
+            self[url] = entry
+            self.dirty.add(url)
+            # persist=False leaves the write to the caller, e.g. once for a bulk insert
+            if persist:
+                self.checkpoint()
+
+    def print_summary(self, extra_rows: dict = None):
+        with Live(refresh_per_second=4) as live:
+            table = Table()
+            table.add_column("Metric")
+            table.add_column("Value")
+
+            for status in Status:
+                count = self.count(status)
+                if count:
+                    table.add_row(str(status).capitalize(), f"{count}")
+            for metric, value in (extra_rows or {}).items():
+                table.add_row(metric, value)
+
+            live.update(table)
+
+    def add_new(self, url, persist=True):
+        self.put(url, SitemapEntry(Status.NEW), persist)
+
+    def add_downloaded(self, url: str, hash: str, path: str, mimetype: str, etag: str = None,
+                       last_modified: str = None, simhash: int = None):
+        self.put(url, SitemapEntry(Status.DOWNLOADED, hash, path, mimetype, etag=etag, last_modified=last_modified,
+                                   simhash=simhash))
+
+    def add_new_many(self, urls, persist=True) -> list[str]:
+        """Add the unknown urls as NEW with a single checkpoint. Returns the urls that were added."""
+        with self.lock:
+            added = [url for url in dict.fromkeys(urls) if url not in self]
+            for url in added:
+                self.put(url, SitemapEntry(Status.NEW), persist=False)
+            if added and persist:
+                self.checkpoint()
+        return added
+
+    def add_ignored(self, url):
+        self.put(url, SitemapEntry(Status.IGNORED))
+
+    def add_discovery(self, url):
+        self.put(url, SitemapEntry(Status.DISCOVERY))
+
+    def add_visited(self, url: str, mimetype: str):
+        self.put(url, SitemapEntry(Status.VISITED, mimetype=mimetype))
+
+    def add_duplicate(self, url: str, duplicate_of: str, mimetype: str, simhash: int):
+        self.put(url, SitemapEntry(Status.DUPLICATE, mimetype=mimetype, simhash=simhash, duplicate_of=duplicate_of))
+
+    def add_asset(self, url: str, mimetype: str):
+        self.put(url, SitemapEntry(Status.ASSET, mimetype=mimetype))
+
+    def add_error(self, url: str, e: Exception, kind: ErrorKind = None, attempts: int = 0):
+        self.put(url, SitemapEntry(Status.ERROR, error=str(e), error_kind=kind, attempts=attempts))
+
+    def add_retry(self, url: str, e: Exception, kind: ErrorKind, attempts: int, next_attempt_at: float):
+        self.put(url, SitemapEntry(Status.RETRY, error=str(e), error_kind=kind, attempts=attempts,
+                                   next_attempt_at=next_attempt_at))
+
+    def lease(self, url: str, statuses: tuple) -> bool:
+        """
+        Mark the url IN_PROGRESS for IMPORTER_LEASE_DURATION seconds when it has one of the given
+        statuses or an expired lease. The lease is saved with the next persist, together with the
+        outcome of an earlier fetch. Returns False when the url cannot be fetched now.
+        """
+        with self.lock:
+            entry = self.get(url)
+            if entry is None:
+                return False
+            now = time.time()
+            leased = copy.copy(entry)
+            if entry.status is Status.IN_PROGRESS:
+                if entry.lease_until > now:
+                    return False
+                # the run holding the lease was killed, possibly by this url, so it counts as an attempt
+                leased.attempts += 1
+                if leased.attempts >= IMPORTER_MAX_ATTEMPTS:
+                    self.add_error(url, "Lease expired before the fetch finished", ErrorKind.OTHER, leased.attempts)
+                    return False
+            elif entry.status not in statuses:
+                return False
+            leased.status = Status.IN_PROGRESS
+            leased.lease_until = now + IMPORTER_LEASE_DURATION
+            self.put(url, leased, persist=False)
+            return True
+
+    def renew_lease(self, url: str):
+        """Extend the lease of an IN_PROGRESS url once half of it has passed, for fetches that outlast it."""
+        with self.lock:
+            entry = self.get(url)
+            now = time.time()
+            if entry is None or entry.status is not Status.IN_PROGRESS \
+                    or entry.lease_until - now > IMPORTER_LEASE_DURATION / 2:
+                return
+            renewed = copy.copy(entry)
+            renewed.lease_until = now + IMPORTER_LEASE_DURATION
+            self.put(url, renewed)
+
+    def copy_entry(self, from_url: str, to_url: str):
+        with self.lock:
+            existing_entry: SitemapEntry = copy.copy(self[from_url])
+            self.put(to_url, existing_entry)
+
+    def get_entries(self, status: Status, limit: int = None, where=None):
+        with self.lock:
+            return list(itertools.islice(filter(where, self.urls(status)), limit))
+
+    def get_new_entries(self, limit: int = None):
+        return self.get_entries(Status.NEW, limit)
+
+    def get_downloaded_entries(self):
+        with self.lock:
+            return [(url, entry) for url, entry in self.items() if entry.status is Status.DOWNLOADED]
+
+
+class SqliteSitemap(Sitemap):
+    """
+    Sitemap kept in a WAL-mode SQLite database. Changes are collected in memory and committed
+    in batches of IMPORTER_STATE_BATCH_SIZE rows, or after IMPORTER_STATE_FLUSH_INTERVAL seconds,
+    so a change costs one row write instead of a full rewrite of the CSV file and a killed run
+    loses at most a few seconds of work. Call persist() to commit the pending batch.
+    """
+
+    def __init__(self, file_path: str, start_url: str, csv_path: str = None,
+                 batch_size: int = IMPORTER_STATE_BATCH_SIZE, flush_interval: float = IMPORTER_STATE_FLUSH_INTERVAL,
+                 read_only: bool = False):
+        self.csv_path = csv_path
+        self.batch_size = batch_size
+        if read_only:
+            # for consumers of the state, e.g. the transformer: no schema changes and no CSV import
+            uri = f"file:{urllib.request.pathname2url(os.path.abspath(file_path))}?mode=ro"
+            self.connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            self.connection = sqlite3.connect(file_path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS entries (url TEXT PRIMARY KEY, status TEXT NOT NULL)"
+                )
+                self.connection.execute("CREATE INDEX IF NOT EXISTS entries_status ON entries(status)")
+                # databases created by older versions get the columns added since
+                columns = {row[1] for row in self.connection.execute("PRAGMA table_info(entries)")}
+                for name in self.fieldnames:
+                    if name not in columns:
+                        self.connection.execute(f"ALTER TABLE entries ADD COLUMN {name} TEXT")
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(entries)")}
+        self.columns = [name for name in self.fieldnames if name in columns]
+        super().__init__(file_path, start_url, flush_interval)
+
+    def load(self):
+        with self.lock:
+            self.persist()
+            cursor = self.connection.execute(f"SELECT {', '.join(self.columns)} FROM entries")
+            for row in cursor:
+                row = dict(zip(self.columns, row))
+                self[row["url"]] = self.entry_from_row(row)
+            if not self and self.csv_path and os.path.exists(self.csv_path):
+                print(f'Importing {self.csv_path} into {self.file_path}...')
+                self.import_csv(self.csv_path)
+        return self
+
+    def persist(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            rows = [self.entry_to_row(url, self[url]) for url in self.dirty]
+            with self.connection:
+                self.connection.executemany(
+                    f"INSERT OR REPLACE INTO entries ({', '.join(self.fieldnames)}) "
+                    f"VALUES ({', '.join(':' + name for name in self.fieldnames)})",
+                    rows
+                )
+            self.dirty.clear()
+            self.flushed_at = time.monotonic()
+
+    def checkpoint(self):
+        with self.lock:
+            if len(self.dirty) >= self.batch_size:
+                self.persist()
+            else:
+                super().checkpoint()
+
+    def import_csv(self, csv_path: str):
+        with self.lock:
+            for url, entry in self.read_csv(csv_path):
+                self[url] = entry
+                self.dirty.add(url)
+            self.persist()
+
+    def export_csv(self, csv_path: str):
+        self.write_csv(csv_path)
+
+    def close(self):
+        self.persist()
+        self.connection.close()
+
+
+STATE_FILES = [
+    (INPUT_SITE_MAP_CSV, INPUT_SITE_MAP_DB),
+    (INPUT_ASSETS_MAP_CSV, INPUT_ASSETS_MAP_DB),
+]
+
+
+def open_sitemap(csv_path: str, db_path: str, start_url: str, read_only: bool = False) -> Sitemap:
+    """
+    The state in the IMPORTER_STATE_BACKEND format. The importer moves a CSV state into a new database,
+    read_only leaves both as they are and reads the CSV while there is no database yet.
+    """
+    if IMPORTER_STATE_BACKEND == "sqlite":
+        if not read_only:
+            return SqliteSitemap(db_path, start_url, csv_path)
+        if os.path.exists(db_path):
+            return SqliteSitemap(db_path, start_url, read_only=True)
+    return Sitemap(csv_path, start_url)
+
+
+def import_state():
+    for csv_path, db_path in STATE_FILES:
+        if not os.path.exists(csv_path):
+            continue
+        site_map = SqliteSitemap(db_path, IMPORTER_START_URL)
+        site_map.import_csv(csv_path)
+        site_map.close()
+        print(f'Imported {csv_path} into {db_path}.')
+
+
+def export_state():
+    for csv_path, db_path in STATE_FILES:
+        if not os.path.exists(db_path):
+            continue
+        site_map = SqliteSitemap(db_path, IMPORTER_START_URL)
+        site_map.export_csv(csv_path)
+        site_map.close()
+        print(f'Exported {db_path} into {csv_path}.')
+
+class PageLinks:
+    """
+    Raw href values of <a> tags and src values of media tags in document order, and the text of
+    the main_tag elements (of the whole page when it has none) for near-duplicate detection.
+    """
+    media_tags = ("img", "video", "audio", "source")
+    skipped_text_tags = ("script", "style")
+
+    def __init__(self, main_tag: str = "main"):
+        self.links: list[str] = []
+        self.media: list[str] = []
+        self.main_tag = main_tag
+        self.page_text: list[str] = []
+        self.main_text: list[str] = []
+        self.main_depth = 0
+        self.skipped_depth = 0
+
+    def add(self, tag: str, attrs: dict):
+        if tag == "a":
+            if attrs.get("href"):
+                self.links.append(attrs["href"])
+        elif tag in self.media_tags:
+            if attrs.get("src"):
+                self.media.append(attrs["src"])
+
+    def open(self, tag: str):
+        if tag == self.main_tag:
+            self.main_depth += 1
+        elif tag in self.skipped_text_tags:
+            self.skipped_depth += 1
+
+    def close(self, tag: str):
+        if tag == self.main_tag:
+            self.main_depth = max(self.main_depth - 1, 0)
+        elif tag in self.skipped_text_tags:
+            self.skipped_depth = max(self.skipped_depth - 1, 0)
+
+    def data(self, text: str):
+        if not self.skipped_depth:
+            self.page_text.append(text)
+            if self.main_depth:
+                self.main_text.append(text)
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.main_text or self.page_text)
+
+
+class LinkExtractor(HTMLParser):
+    """Streaming extractor on the tokenizer BeautifulSoup's html.parser uses, without building a tree."""
+
+    def __init__(self, main_tag: str = "main"):
+        super().__init__(convert_charrefs=True)
+        self.page_links = PageLinks(main_tag)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a" or tag in PageLinks.media_tags:
+            # duplicated attributes: the last one wins, as in BeautifulSoup
+            self.page_links.add(tag, dict(attrs))
+        self.page_links.open(tag)
+
+    def handle_endtag(self, tag):
+        self.page_links.close(tag)
+
+    def handle_data(self, data):
+        self.page_links.data(data)
+
+
+class LxmlLinkTarget:
+    def __init__(self, main_tag: str = "main"):
+        self.page_links = PageLinks(main_tag)
+
+    def start(self, tag, attrib):
+        self.page_links.add(tag, attrib)
+        self.page_links.open(tag)
+
+    def end(self, tag):
+        self.page_links.close(tag)
+
+    def data(self, data):
+        self.page_links.data(data)
+
+    def close(self):
+        return self.page_links
+
+
+def extract_with_html_parser(html: str, main_tag: str = "main") -> PageLinks:
+    extractor = LinkExtractor(main_tag)
+    extractor.feed(html)
+    extractor.close()
+    return extractor.page_links
+
+
+def extract_with_lxml(html: str, main_tag: str = "main") -> PageLinks:
+    from lxml import etree
+
+    parser = etree.HTMLParser(target=LxmlLinkTarget(main_tag))
+    parser.feed(html)
+    return parser.close()
+
+
+def extract_with_bs4(html: str, main_tag: str = "main") -> PageLinks:
+    soup = BeautifulSoup(html, "html.parser")
+    page_links = PageLinks(main_tag)
+    page_links.links = [a.get("href") for a in soup.find_all("a") if a.get("href")]
+    page_links.media = [tag.get("src") for tag in soup.find_all(list(PageLinks.media_tags)) if tag.get("src")]
+    page_links.page_text = [str(text) for text in soup.find_all(string=True)
+                            if type(text) is NavigableString and text.parent.name not in PageLinks.skipped_text_tags]
+    page_links.main_text = [str(text) for main in soup.find_all(main_tag) for text in main.find_all(string=True)
+                            if type(text) is NavigableString and text.parent.name not in PageLinks.skipped_text_tags]
+    return page_links
+
+
+PARSER_BACKENDS = {
+    "html.parser": extract_with_html_parser,
+    "lxml": extract_with_lxml,
+    "bs4": extract_with_bs4,
+}
+
+
+def parse_sitemap_xml(content: bytes, max_size: int = IMPORTER_SITEMAP_MAX_SIZE) -> tuple[bool, list[str]]:
+    """
+    The <loc> values of a sitemap, gzipped or not, and whether it is a sitemap index
+    listing further sitemaps rather than pages. Raises ValueError when the sitemap is
+    larger than max_size bytes once decompressed.
+    """
+    if content[:2] == b"\x1f\x8b":
+        with gzip.GzipFile(fileobj=io.BytesIO(content)) as f:
+            content = f.read(max_size + 1)
+    if len(content) > max_size:
+        raise ValueError(f"Sitemap larger than {max_size} bytes")
+    root = ElementTree.fromstring(content)
+    # tags carry the sitemaps.org namespace, match on the local name
+    locs = [element.text.strip() for element in root.iter() if element.tag.rsplit("}", 1)[-1] == "loc"
+            and element.text and element.text.strip()]
+    return root.tag.rsplit("}", 1)[-1] == "sitemapindex", locs
+
+
+PAGE_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+CHARSET_PARAM = re.compile(r"""charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+META_CHARSET = re.compile(rb"""<meta[^>]*?charset\s*=\s*["']?\s*([\w.:-]+)""", re.IGNORECASE)
+META_PRESCAN_BYTES = 1024  # browsers only look for <meta charset> this far into a page
+BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+UTF8_CODECS = {"utf-8", "ascii"}  # stored as received
+HTML_MIMETYPES = {"text/html", "application/xhtml+xml", ""}  # without a Content-Type a body is parsed as before
+CONTENT_DISPOSITION_FILENAME = re.compile(r"""filename\*?\s*=\s*(?:[\w-]+'[\w-]*')?["']?([^"';]+)""", re.IGNORECASE)
+
+
+def is_html(content_type: str) -> bool:
+    return content_type.split(";", 1)[0].strip().lower() in HTML_MIMETYPES
+
+
+def codec_name(label) -> str:
+    if isinstance(label, bytes):
+        label = label.decode("ascii", errors="ignore")
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+
+def declared_encoding(content: bytes, content_type: str) -> str:
+    """Encoding named by the byte order mark, the Content-Type charset or an early <meta charset>, or None."""
+    for bom, encoding in BOMS:
+        if content.startswith(bom):
+            return encoding
+    match = CHARSET_PARAM.search(content_type or "")
+    encoding = codec_name(match[1]) if match else None
+    if encoding is None:
+        match = META_CHARSET.search(content, 0, META_PRESCAN_BYTES)
+        encoding = codec_name(match[1]) if match else None
+    return encoding
+
+
+def decode_page(content: bytes, content_type: str) -> tuple[str, bytes]:
+    """
+    Text of a page body and the UTF-8 bytes stored for it. A valid UTF-8 body is stored as received,
+    anything else is transcoded once. Charset detection only runs for undeclared bodies that are not UTF-8.
+    """
+    encoding = declared_encoding(content, content_type)
+    if encoding is None or encoding in UTF8_CODECS:
+        try:
+            return str(content, "utf-8"), content
+        except UnicodeDecodeError:
+            if encoding is None:
+                encoding = requests.compat.chardet.detect(content)["encoding"] or "utf-8"
+    html = str(content, encoding, errors="replace")
+    return html, html.encode("utf-8")
+
+
+def encode_page(html: str, name: str) -> bytes:
+    """Bytes of a stored page, compressed according to the suffix of its name."""
+    return compress_page(html.encode("utf-8"), name)
+
+
+def compress_page(data: bytes, name: str) -> bytes:
+    if name.endswith(".gz"):
+        return gzip.compress(data, compresslevel=6)
+    if name.endswith(".zst"):
+        import zstandard
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def read_page(store: "FileStore", name: str) -> str:
+    data = store.read(name)
+    if name.endswith(".gz"):
+        data = gzip.decompress(data)
+    elif name.endswith(".zst"):
+        import zstandard
+        data = zstandard.ZstdDecompressor().decompress(data)
+    html = str(data, "utf-8")
+    # pages used to be read in text mode, keep its newline translation
+    if "\r" in html:
+        html = html.replace("\r\n", "\n").replace("\r", "\n")
+    return html
+
+
+def page_file_name(checksum: str) -> str:
+    return f"{checksum}.html{PAGE_SUFFIXES[IMPORTER_PAGE_COMPRESSION]}"
+
+
+SIMHASH_MASK = (1 << 64) - 1
+# BIT_TABLES[bit] maps a byte to 1 when that bit is set in it, for bytes.translate()
+BIT_TABLES = [bytes((value >> bit) & 1 for value in range(256)) for bit in range(8)]
+
+
+def stable_hash(text: str) -> int:
+    """64-bit hash that, unlike hash(), is the same in every process."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+@functools.lru_cache(maxsize=1 << 17)
+def word_hashes(word: str) -> tuple[int, int, int]:
+    """64-bit hash of a word, and the hash rotated by 1 and by 2 bits."""
+    h = stable_hash(word)
+    return h, ((h << 1) | (h >> 63)) & SIMHASH_MASK, ((h << 2) | (h >> 62)) & SIMHASH_MASK
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash of the 3-shingles of the whitespace separated words of a text, None when it
+    has fewer than IMPORTER_SIMHASH_MIN_WORDS words. Every shingle votes for the bits of its hash
+    and a bit is set when it gets the majority of the votes.
+    """
+    words = text.lower().split()
+    if len(words) < IMPORTER_SIMHASH_MIN_WORDS:
+        return None
+    # a shingle hash xors the hashes of its words rotated by their position. The words of a site repeat
+    # from page to page, so most of them are hashed once per run.
+    hashed = list(map(word_hashes, words))
+    shingles = array.array("Q", map(operator.xor,
+                                    map(operator.xor, map(operator.itemgetter(0), hashed),
+                                        map(operator.itemgetter(1), itertools.islice(hashed, 1, None))),
+                                    map(operator.itemgetter(2), itertools.islice(hashed, 2, None))))
+    if sys.byteorder == "big":
+        shingles.byteswap()
+    # byte `index` of every shingle hash, counted per bit without a Python loop over the shingles
+    data = shingles.tobytes()
+    majority = len(shingles) / 2
+    fingerprint = 0
+    for index in range(8):
+        column = data[index::8]
+        for bit, table in enumerate(BIT_TABLES):
+            if column.translate(table).count(b"\x01") > majority:
+                fingerprint |= 1 << (index * 8 + bit)
+    return fingerprint
+
+
+class SimHashIndex:
+    """
+    SimHash fingerprints of the stored pages. Two fingerprints at most `distance` bits apart are
+    equal on at least one of distance + 1 blocks of bits, so every block is a dict key and a
+    lookup only compares the pages that share a block with the new one.
+    """
+
+    def __init__(self, distance: int):
+        self.distance = distance
+        bounds = [64 * i // (distance + 1) for i in range(distance + 2)]
+        self.blocks = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self.tables: list[dict[int, list[tuple[int, str]]]] = [{} for _ in self.blocks]
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_sitemap(cls, site_map: Sitemap, distance: int) -> "SimHashIndex":
+        index = cls(distance)
+        for url, entry in site_map.get_downloaded_entries():
+            if entry.simhash is not None:
+                index.add(entry.simhash, url)
+        return index
+
+    def add(self, fingerprint: int, url: str):
+        for (shift, mask), table in zip(self.blocks, self.tables):
+            table.setdefault((fingerprint >> shift) & mask, []).append((fingerprint, url))
+
+    def find(self, fingerprint: int, url: str) -> str:
+        """Another page within distance bits of the fingerprint, or None."""
+        for (shift, mask), table in zip(self.blocks, self.tables):
+            for other, other_url in table.get((fingerprint >> shift) & mask, ()):
+                if other_url != url and (fingerprint ^ other).bit_count() <= self.distance:
+                    return other_url
+        return None
+
+    def find_or_add(self, fingerprint: int, url: str) -> str:
+        """The page url duplicates, or None after indexing url as an original."""
+        with self.lock:
+            original = self.find(fingerprint, url)
+            if original is None:
+                self.add(fingerprint, url)
+            return original
+
+
+def compile_patterns(patterns: list[str]) -> re.Pattern:
+    """One alternation of all patterns, so a URL is checked with a single regex search."""
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns) or r"(?!)")
+
+
+class UrlCanonicalizer:
+    """Normalizes URL variants that point to the same resource, following IMPORTER_CANONICAL_RULES."""
+
+    default_ports = {"http": ":80", "https": ":443"}
+
+    def __init__(self, start_url: str, rules: dict = None):
+        start = urlsplit(start_url)
+        self.scheme = start.scheme.lower()
+        self.domain = self.host(self.scheme, start.netloc)
+        self.rules = IMPORTER_CANONICAL_RULES if rules is None else rules
+        self.dropped_params = set(self.rules.get("drop_query_params", []))
+
+    def host(self, scheme: str, netloc: str) -> str:
+        """netloc as compared with the start host: lowercased and without the default port of the scheme."""
+        netloc = netloc.lower()
+        port = self.default_ports.get(scheme)
+        return netloc[:-len(port)] if port and netloc.endswith(port) else netloc
+
+    def is_internal(self, parts: SplitResult) -> bool:
+        return self.host(parts.scheme.lower(), parts.netloc) in ("", self.domain)
+
+    def split(self, url: str) -> SplitResult:
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        scheme = scheme.lower()
+        if self.rules.get("lowercase_host"):
+            netloc = netloc.lower()
+        if self.rules.get("drop_default_port") and netloc.endswith(self.default_ports.get(scheme, "\0")):
+            netloc = netloc[:-len(self.default_ports[scheme])]
+        if self.rules.get("unify_internal_scheme") and scheme in ("http", "https") \
+                and self.host(scheme, netloc) == self.domain:
+            # an explicit default port belongs to the scheme being replaced
+            if netloc.endswith(self.default_ports[scheme]):
+                netloc = netloc[:-len(self.default_ports[scheme])]
+            scheme = self.scheme
+        if query and (self.rules.get("sort_query") or self.dropped_params):
+            params = [param for param in query.split("&")
+                      if param and param.split("=", 1)[0] not in self.dropped_params]
+            query = "&".join(sorted(params) if self.rules.get("sort_query") else params)
+        trailing_slash = self.rules.get("trailing_slash", "keep")
+        if trailing_slash == "add" and not path.endswith("/") and "." not in path.rsplit("/", 1)[-1]:
+            path += "/"
+        elif trailing_slash == "strip" and len(path) > 1 and path.endswith("/"):
+            path = path.rstrip("/") or "/"
+        if self.rules.get("drop_fragment"):
+            fragment = ""
+        return SplitResult(scheme, netloc, path, query, fragment)
+
+    def __call__(self, url: str) -> str:
+        return urlunsplit(self.split(url))
+
+
+IGNORE_PATTERN = compile_patterns(IMPORTER_IGNORE_PATTERNS)
+PRUNE_PATTERN = compile_patterns(TRANSFORMED_IGNORED_URLS)
+ASSET_EXTENSIONS = frozenset(IMPORTER_ASSETS_EXTENSIONS)
+LARGE_ASSET_EXTENSIONS = frozenset(IMPORTER_LARGE_ASSET_EXTENSIONS)
+
+
+def url_extension(path: str) -> str:
+    return os.path.splitext(path)[1].lower()
+
+
+class Frontier:
+    """
+    Bounded queue of URLs waiting to be fetched. URLs that do not fit stay NEW in the sitemap
+    and are pulled back in by refill() once the queue runs dry. The low_priority frontier is
+    only served when this one has nothing to hand out. With accepts, only the URLs it returns
+    True for are loaded from the state, so several frontiers can share one sitemap.
+    """
+    status = Status.NEW
+
+    def __init__(self, site_map: Sitemap, maxsize: int = IMPORTER_FRONTIER_SIZE, low_priority: "Frontier" = None,
+                 accepts=None):
+        self.site_map = site_map
+        self.accepts = accepts
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = True  # the first get() loads NEW entries from the state
+        self.delayed = []  # heap of (next_attempt_at, url) waiting for a retry
+        self.delayed_lock = threading.Lock()
+        self.low_priority = low_priority
+        self.load_retries()
+
+    def load_retries(self):
+        with self.site_map.lock:
+            for url in filter(self.accepts, self.site_map.by_status[Status.RETRY]):
+                self.defer(url, self.site_map[url].next_attempt_at)
+            # left behind by a killed run, fetched again once their lease has expired
+            for url in filter(self.accepts, self.site_map.by_status[Status.IN_PROGRESS]):
+                self.defer(url, self.site_map[url].lease_until)
+
+    def defer(self, url: str, next_attempt_at: float):
+        with self.delayed_lock:
+            heapq.heappush(self.delayed, (next_attempt_at, url))
+
+    def pop_due(self) -> str:
+        with self.delayed_lock:
+            if self.delayed and self.delayed[0][0] <= time.time():
+                return heapq.heappop(self.delayed)[1]
+        return None
+
+    def next_due_in(self) -> float:
+        """Seconds until the next deferred retry is due, or None when nothing is deferred."""
+        with self.delayed_lock:
+            if not self.delayed:
+                return None
+            return max(self.delayed[0][0] - time.time(), 0.0)
+
+    def put(self, url: str):
+        try:
+            self.queue.put_nowait(url)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, in_flight: set = frozenset()) -> str:
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            if not self.overflowed:
+                return None
+        self.refill(in_flight)
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def __len__(self):
+        return self.queue.qsize() + (len(self.low_priority) if self.low_priority is not None else 0)
+
+    def next(self, in_flight: dict) -> str:
+        """
+        Next NEW url, a retry that is due or an expired lease, that is not being fetched already.
+        The url is leased to the caller. None when nothing can be fetched right now.
+        """
+        fetching = set(in_flight.values())
+        while True:
+            url = self.pop_due() or self.get(fetching)
+            if url is None:
+                return self.low_priority.next(in_flight) if self.low_priority is not None else None
+            if url not in fetching and self.site_map.lease(url, (self.status, Status.RETRY)):
+                return url
+
+    def refill(self, in_flight: set = frozenset()):
+        # the oldest entries include the URLs that are being fetched right now, those are not queued again
+        self.overflowed = False
+        for url in self.site_map.get_entries(self.status, self.queue.maxsize + len(in_flight), self.accepts):
+            if url not in in_flight:
+                self.put(url)
+        if self.queue.full():
+            self.overflowed = True
+
+
+class DiscoveryFrontier(Frontier):
+    """Pages fetched only for their links, see IMPORTER_PRUNE_MODE."""
+    status = Status.DISCOVERY
+
+    def load_retries(self):
+        # failed discovery pages are retried through the page frontier
+        pass
+
+
+class RequestSample:
+    """
+    Outcome and phase timings of one request. The fetch code reports the response, the
+    connection hooks add the time spent resolving and connecting.
+    """
+    current = threading.local()  # sample of the request the calling thread is sending
+
+    def __init__(self):
+        self.status: int = None
+        self.started = time.monotonic()
+        self.dns = 0.0
+        self.connect = 0.0  # includes DNS with the threads engine, urllib3 resolves inside connect
+        self.ttfb: float = None
+        self.size = 0
+        self.content_type = ""
+
+    def headers_received(self, status: int, headers, elapsed: float = None):
+        """
+        Record the response status and headers. elapsed is the time from sending the request to
+        the headers when the client measured it, like requests' Response.elapsed.
+        """
+        self.status = status
+        self.content_type = headers.get("Content-Type", "")
+        if elapsed is None:
+            elapsed = time.monotonic() - self.started
+        self.ttfb = max(elapsed - self.dns - self.connect, 0.0)
+
+
+class HostConcurrency:
+    """
+    AIMD concurrency limit for a single host. The limit grows by one for every window of
+    healthy requests and is cut by IMPORTER_CONCURRENCY_BACKOFF on 429/5xx responses, on an
+    error rate above IMPORTER_CONCURRENCY_MAX_ERROR_RATE or when p95 latency rises above the
+    best p95 seen times IMPORTER_CONCURRENCY_LATENCY_TOLERANCE. Latencies are kept per kind of
+    request, a multi-MB asset must not make the pages of the same host look slow.
+    """
+
+    def __init__(self, max_limit: int):
+        self.limit = float(min(IMPORTER_INITIAL_CONCURRENCY, max_limit))
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self.latencies: dict[str, collections.deque] = {}  # kind -> latency window
+        self.best_p95: dict[str, float] = {}
+        self.failures = collections.deque(maxlen=IMPORTER_CONCURRENCY_WINDOW)
+        self.async_condition: asyncio.Condition = None
+        self.async_loop: asyncio.AbstractEventLoop = None
+        self.since_change = 0
+        self.backing_off = False
+        self.completed = 0
+        self.started = time.monotonic()
+        self.crawl_delay = 0.0  # robots.txt Crawl-delay, minimum seconds between request starts
+        self.next_start = 0.0
+
+    def wait_time(self) -> float:
+        """Seconds until a request may start, 0 when one can start now and None when the limit is reached."""
+        if self.in_flight >= int(self.limit):
+            return None
+        return max(self.next_start - time.monotonic(), 0.0)
+
+    def start(self):
+        self.in_flight += 1
+        self.next_start = time.monotonic() + self.crawl_delay
+
+    def try_acquire(self) -> bool:
+        with self.condition:
+            if self.wait_time() != 0.0:
+                return False
+            self.start()
+            return True
+
+    def acquire(self):
+        with self.condition:
+            while (wait := self.wait_time()) != 0.0:
+                self.condition.wait(wait)
+            self.start()
+
+    def get_async_condition(self) -> asyncio.Condition:
+        # every asyncio.run() has its own loop, and an asyncio.Condition can only be used from one
+        loop = asyncio.get_running_loop()
+        if self.async_loop is not loop:
+            self.async_condition = asyncio.Condition()
+            self.async_loop = loop
+        return self.async_condition
+
+    async def acquire_async(self):
+        condition = self.get_async_condition()
+        async with condition:
+            while True:
+                with self.condition:
+                    wait = self.wait_time()
+                    if wait == 0.0:
+                        self.start()
+                        return
+                try:
+                    await asyncio.wait_for(condition.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def notify_async(self):
+        condition = self.get_async_condition()
+        async with condition:
+            condition.notify_all()
+
+    def release(self, sample: RequestSample, failed: bool, kind: str = "page"):
+        latency = time.monotonic() - sample.started
+        overloaded = sample.status == 429 or (sample.status or 0) >= 500
+        with self.condition:
+            self.in_flight -= 1
+            self.completed += 1
+            self.since_change += 1
+            latencies = self.latencies.setdefault(kind, collections.deque(maxlen=IMPORTER_CONCURRENCY_WINDOW))
+            latencies.append(latency)
+            self.failures.append(failed or overloaded)
+            if overloaded:
+                self.decrease()
+            elif len(latencies) == latencies.maxlen and self.since_change >= int(self.limit):
+                self.adjust(kind)
+            self.condition.notify_all()
+
+    def p95(self, kind: str = "page") -> float:
+        latencies = sorted(self.latencies.get(kind, ()))
+        return latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+
+    def adjust(self, kind: str):
+        p95 = self.p95(kind)
+        best_p95 = self.best_p95[kind] = min(self.best_p95.get(kind, p95), p95)
+        error_rate = sum(self.failures) / len(self.failures)
+        if error_rate > IMPORTER_CONCURRENCY_MAX_ERROR_RATE \
+                or p95 > best_p95 * IMPORTER_CONCURRENCY_LATENCY_TOLERANCE:
+            self.decrease()
+        else:
+            self.limit = min(self.limit + 1, self.max_limit)
+            self.since_change = 0
+            self.backing_off = False
+
+    def decrease(self):
+        # responses to requests sent before the last decrease must not shrink the limit again
+        if self.backing_off and self.since_change < int(self.limit):
+            return
+        self.limit = max(self.limit * IMPORTER_CONCURRENCY_BACKOFF, IMPORTER_MIN_CONCURRENCY)
+        self.since_change = 0
+        self.backing_off = True
+
+    def throughput(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.completed / elapsed if elapsed else 0.0
+
+
+class HostTracker:
+    def __init__(self, limiter: "ConcurrencyLimiter", url: str, kind: str, leases: Sitemap = None):
+        self.host = limiter.host(url)
+        self.url = url
+        self.kind = kind
+        self.leases = leases
+        self.netloc = urlparse(url).netloc
+        self.telemetry = limiter.telemetry
+        self.sample = RequestSample()
+
+    def __enter__(self) -> RequestSample:
+        self.host.acquire()
+        self.renew_lease()
+        self.sample.started = time.monotonic()
+        RequestSample.current.sample = self.sample
+        return self.sample
+
+    def __exit__(self, exc_type, exc, tb):
+        RequestSample.current.sample = None
+        # HTTP errors are judged by their status code, only network failures count as failed here
+        self.host.release(self.sample, exc_type is not None and self.sample.status is None, self.kind)
+        if self.telemetry is not None:
+            self.telemetry.observe_request(self.netloc, self.sample)
+        return False
+
+    async def __aenter__(self) -> RequestSample:
+        await self.host.acquire_async()
+        self.renew_lease()
+        self.sample.started = time.monotonic()
+        return self.sample
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.host.release(self.sample, exc_type is not None and self.sample.status is None, self.kind)
+        await self.host.notify_async()
+        if self.telemetry is not None:
+            self.telemetry.observe_request(self.netloc, self.sample)
+        return False
+
+    def renew_lease(self):
+        # the url was leased when it was handed out, waiting for the slot or the Crawl-delay may have used it up
+        if self.leases is not None:
+            self.leases.renew_lease(self.url)
+
+
+class ConcurrencyLimiter:
+    """
+    Per-host AIMD limits shared by page and asset downloads. Finished requests are reported to telemetry.
+    max_concurrency caps the limit of every host, see IMPORTER_MAX_CONCURRENCY.
+    """
+
+    def __init__(self, telemetry: "Telemetry" = None, max_concurrency: int = IMPORTER_MAX_CONCURRENCY["threads"]):
+        self.hosts: dict[str, HostConcurrency] = {}
+        self.lock = threading.Lock()
+        self.telemetry = telemetry
+        self.max_concurrency = max_concurrency
+
+    def host(self, url: str) -> HostConcurrency:
+        netloc = urlparse(url).netloc
+        with self.lock:
+            if netloc not in self.hosts:
+                self.hosts[netloc] = HostConcurrency(self.max_concurrency)
+            return self.hosts[netloc]
+
+    def track(self, url: str, kind: str = "page", leases: Sitemap = None) -> HostTracker:
+        """
+        kind is "page" or "asset", each kind of request has its own latency window. With leases, the
+        lease of the url in that sitemap is renewed once the request gets its slot.
+        """
+        return HostTracker(self, url, kind, leases)
+
+    def set_crawl_delay(self, url: str, delay: float):
+        host = self.host(url)
+        with host.condition:
+            host.crawl_delay = delay
+
+    def summary(self) -> dict:
+        rows = {}
+        with self.lock:
+            hosts = list(self.hosts.items())
+        for netloc, host in hosts:
+            p95 = ", ".join(f"{kind} p95 {host.p95(kind):.2f}s" for kind in sorted(host.latencies))
+            rows[f"Concurrency {netloc}"] = f"{int(host.limit)} ({p95})" if p95 else f"{int(host.limit)}"
+            if host.crawl_delay:
+                rows[f"Crawl-delay {netloc}"] = f"{host.crawl_delay:g}s"
+            rows[f"Throughput {netloc}"] = f"{host.throughput():.1f} req/s"
+        return rows
+
+
+class Histogram:
+    """Cumulative bucket counts, as Prometheus histograms keep them, with interpolated quantiles."""
+    durations = tuple(0.001 * 2 ** i for i in range(18))  # 1 ms .. 131 s
+    sizes = tuple(1024 * 4 ** i for i in range(11))  # 1 KB .. 1 GB
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Telemetry:
+    """
+    Request phase timings (dns, connect, ttfb, transfer, total), response sizes, statuses and
+    parse times, kept as histograms per host and content type. write() stores a JSON summary
+    with p50/p95/p99 per host and per content type plus a throughput timeline, and a Prometheus
+    textfile snapshot. start() rewrites both every IMPORTER_TELEMETRY_INTERVAL seconds.
+    """
+    phases = ("dns", "connect", "ttfb", "transfer", "total")
+
+    def __init__(self, json_path: str = INPUT_TELEMETRY_JSON, prom_path: str = INPUT_TELEMETRY_PROM):
+        self.json_path = json_path
+        self.prom_path = prom_path
+        self.lock = threading.Lock()
+        self.histograms: dict[tuple[str, str, str], Histogram] = {}  # (host, content type, metric)
+        self.statuses = collections.Counter()  # (host, status)
+        self.started = time.time()
+        self.timeline = collections.deque(maxlen=IMPORTER_TELEMETRY_TIMELINE)
+        self.stopped = threading.Event()
+        self.writer: threading.Thread = None
+
+    @staticmethod
+    def content_type(value: str) -> str:
+        return value.split(";", 1)[0].strip().lower() or "none"
+
+    @staticmethod
+    def label(value: str) -> str:
+        """Prometheus label value, hosts and content types come from the network."""
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def histogram(self, host: str, content_type: str, metric: str) -> Histogram:
+        key = (host, content_type, metric)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(Histogram.sizes if metric == "size" else Histogram.durations)
+        return self.histograms[key]
+
+    def observe_request(self, host: str, sample: RequestSample):
+        total = time.monotonic() - sample.started
+        content_type = self.content_type(sample.content_type)
+        phases = {"total": total}
+        # only requests that resolved a name or opened a connection have these phases
+        if sample.dns:
+            phases["dns"] = sample.dns
+        if sample.connect:
+            phases["connect"] = sample.connect
+        if sample.ttfb is not None:
+            phases["ttfb"] = sample.ttfb
+            phases["transfer"] = max(total - sample.dns - sample.connect - sample.ttfb, 0.0)
+        with self.lock:
+            for phase, seconds in phases.items():
+                self.histogram(host, content_type, phase).observe(seconds)
+            self.histogram(host, content_type, "size").observe(sample.size)
+            self.statuses[(host, str(sample.status or "error"))] += 1
+
+    def observe_parse(self, host: str, content_type: str, seconds: float):
+        with self.lock:
+            self.histogram(host, self.content_type(content_type), "parse").observe(seconds)
+
+    def totals(self) -> tuple[int, int]:
+        """Requests and bytes so far. Callers hold the lock."""
+        requests = received = 0
+        for (_, _, metric), histogram in self.histograms.items():
+            if metric == "size":
+                requests += histogram.count
+                received += int(histogram.sum)
+        return requests, received
+
+    def statuses_by_host(self) -> dict:
+        statuses = collections.defaultdict(dict)
+        for (host, status), count in sorted(self.statuses.items()):
+            statuses[host][status] = count
+        return statuses
+
+    def aggregate(self, dimension: int) -> dict:
+        merged = collections.defaultdict(dict)
+        for key, histogram in self.histograms.items():
+            group = merged[key[dimension]]
+            if key[2] not in group:
+                group[key[2]] = Histogram(histogram.bounds)
+            group[key[2]].merge(histogram)
+        return {
+            label: {
+                "requests": metrics["size"].count if "size" in metrics else 0,
+                "bytes": int(metrics["size"].sum) if "size" in metrics else 0,
+                **{metric: histogram.summary() for metric, histogram in metrics.items()},
+            }
+            for label, metrics in merged.items()
+        }
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.time() - self.started
+            requests, received = self.totals()
+            previous = self.timeline[-1] if self.timeline else {"elapsed": 0.0, "requests": 0, "bytes": 0}
+            interval = (elapsed - previous["elapsed"]) or 1.0
+            self.timeline.append({
+                "elapsed": round(elapsed, 3),
+                "requests": requests,
+                "bytes": received,
+                "requests_per_second": (requests - previous["requests"]) / interval,
+                "bytes_per_second": (received - previous["bytes"]) / interval,
+            })
+            summary = {
+                "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                "elapsed": elapsed,
+                "requests": requests,
+                "bytes": received,
+                "requests_per_second": requests / elapsed if elapsed else 0.0,
+                "statuses": self.statuses_by_host(),
+                "by_host": self.aggregate(0),
+                "by_content_type": self.aggregate(1),
+                "timeline": list(self.timeline),
+            }
+            prometheus = self.prometheus()
+        return summary, prometheus
+
+    def prometheus(self) -> str:
+        """Textfile collector format. Callers hold the lock."""
+        lines = []
+        families = (
+            ("importer_request_duration_seconds", "Request phase durations.", set(self.phases)),
+            ("importer_response_size_bytes", "Response body sizes.", {"size"}),
+            ("importer_parse_duration_seconds", "Time spent extracting links from pages.", {"parse"}),
+        )
+        for name, help_text, metrics in families:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for (host, content_type, metric), histogram in sorted(self.histograms.items()):
+                if metric not in metrics:
+                    continue
+                labels = f'host="{self.label(host)}",content_type="{self.label(content_type)}"'
+                if name == "importer_request_duration_seconds":
+                    labels += f',phase="{metric}"'
+                cumulative = 0
+                for bound, count in zip(histogram.bounds + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum:g}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        lines += ["# HELP importer_responses_total Responses by status, error for network failures.",
+                  "# TYPE importer_responses_total counter"]
+        for (host, status), count in sorted(self.statuses.items()):
+            lines.append(f'importer_responses_total{{host="{self.label(host)}",status="{self.label(status)}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        summary, prometheus = self.snapshot()
+        for path, content in ((self.json_path, json.dumps(summary, indent=2)), (self.prom_path, prometheus)):
+            # written aside and renamed, so dashboards never scrape a half-written file
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+
+    def run(self):
+        while not self.stopped.wait(IMPORTER_TELEMETRY_INTERVAL):
+            self.write()
+
+    def start(self):
+        if self.writer is not None:
+            return
+        self.writer = threading.Thread(target=self.run, daemon=True)
+        self.writer.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.writer is not None:
+            self.writer.join()
+        self.write()
+
+
+class ParsedPage:
+    """What parse_page() hands back to the importer, small enough to send from a parser process."""
+    __slots__ = ("links", "assets", "simhash", "checksum", "file_name", "data", "seconds")
+
+    def __init__(self):
+        self.simhash = None
+        self.checksum = None
+        self.file_name = None
+        self.data = None
+
+
+def parse_page(content: bytes, content_type: str, base_url: str, main_selector: str = "main",
+               fingerprint: bool = True, keep: bool = True) -> ParsedPage:
+    """
+    The CPU-bound part of processing a page: decode it, extract its links, asset candidates and
+    SimHash, and with keep, checksum and encode it for the store. It does not touch the state,
+    so it runs on the fetching thread or in a parser process, see IMPORTER_PARSER_PROCESSES.
+    """
+    started = time.monotonic()
+    page = ParsedPage()
+    html, data = decode_page(content, content_type)
+    links, assets, main_text = Importer.extract_links(html, base_url, main_selector)
+    # the importer skips repeated URLs anyway, and only keeps assets with a known extension
+    page.links = list(dict.fromkeys(links))
+    page.assets = [url for url in dict.fromkeys(assets) if url_extension(urlsplit(url).path) in ASSET_EXTENSIONS]
+    if fingerprint:
+        page.simhash = simhash(main_text)
+    page.seconds = time.monotonic() - started
+    if keep:
+        page.checksum = Importer.get_checksum(data)
+        page.file_name = page_file_name(page.checksum)
+        page.data = compress_page(data, page.file_name)
+    return page
+
+
+# built from config.py settings when the module is imported
+DERIVED_SETTINGS = ("ASSET_EXTENSIONS", "LARGE_ASSET_EXTENSIONS", "IGNORE_PATTERN", "PRUNE_PATTERN")
+
+
+def settings_snapshot() -> dict:
+    """
+    Every config.py setting as this module sees it, which may differ from config.py, and what is
+    built from them. Functions, such as the transformer's title adjuster, are left out.
+    """
+    names = [name for name in vars(config) if name.isupper()] + list(DERIVED_SETTINGS)
+    return {name: globals()[name] for name in names if name in globals() and not callable(globals()[name])}
+
+
+def configure_parser_process(settings: dict):
+    """Parser process initializer: use the settings of the importer, see settings_snapshot()."""
+    globals().update(settings)
+
+
+class RecrawlFrontier(Frontier):
+    """Hands out a snapshot of the DOWNLOADED pages, each of them once."""
+
+    def __init__(self, site_map: Sitemap):
+        self.site_map = site_map
+        self.urls = collections.deque(url for url, _ in site_map.get_downloaded_entries())
+
+    def __len__(self):
+        return len(self.urls)
+
+    def next(self, in_flight: dict) -> str:
+        return self.urls.popleft() if self.urls else None
+
+    def next_due_in(self) -> float:
+        return None
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that counts requests sent and TCP connections opened, including reconnects
+    of pooled connections that the server closed, to report keep-alive reuse.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.requests = 0
+        self.connections = 0
+        self.stats_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        def counting(connection_cls):
+            class CountingConnection(connection_cls):
+                def connect(self):
+                    with adapter.stats_lock:
+                        adapter.connections += 1
+                    started = time.monotonic()
+                    try:
+                        super().connect()
+                    finally:
+                        sample = getattr(RequestSample.current, "sample", None)
+                        if sample is not None:
+                            sample.connect += time.monotonic() - started
+            return CountingConnection
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            ConnectionCls = counting(HTTPConnectionPool.ConnectionCls)
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            ConnectionCls = counting(HTTPSConnectionPool.ConnectionCls)
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
 
-class Sitemap(dict[str, SitemapEntry]):
+    def send(self, request, *args, **kwargs):
+        with self.stats_lock:
+            self.requests += 1
+        return super().send(request, *args, **kwargs)
 
-    file_path: str = None
 
-    def __init__(self, file_path: str, start_url: str):
-        super().__init__()
-        self.file_path = file_path
+class FileStore:
+    """Pages and assets as one file per content address `<sha256><ext>` in a single directory."""
 
-        self.load()
-        if not self:
-            self.add_new(start_url)
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
 
-    def load(self):
-        if os.path.exists(self.file_path):
-            with open(self.file_path, newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    url = row["url"]
-                    status = Status(row.get("status"))
-                    hash = row.get("hash")
-                    path = row.get("path")
-                    mimetype = row.get("mimetype", "")
-                    error = row.get("error", "")
-                    self[url] = SitemapEntry(status, hash, path, mimetype, error)
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def read(self, name: str) -> bytes:
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+    def write(self, name: str, data: bytes):
+        with open(self.path(name), "wb") as f:
+            f.write(data)
+
+    def add_file(self, name: str, temp_path: str):
+        # same content, same name: an existing file is kept
+        if self.exists(name):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, self.path(name))
+
+    def copy_to(self, name: str, target_path: str):
+        shutil.copy2(self.path(name), target_path)
+
+    def names(self) -> list[str]:
+        return [name for name in os.listdir(self.directory) if not name.endswith(".tmp")]
+
+    def close(self):
+        pass
+
+
+class PackStore(FileStore):
+    """
+    Append-only pack of content-addressed blobs. Blobs are appended to segment files of up to
+    IMPORTER_PACK_SEGMENT_SIZE bytes and an index record (name, segment, offset, length) is
+    appended once the blob is written, so a torn write never shows up in the index. Reads are
+    memoryviews of the mmapped segment, without a copy. Names missing from the pack are read
+    from the fallback store, e.g. files stored before the pack was enabled. Every process that has
+    the pack open holds a shared lock on it, compact() needs it exclusively.
+    """
+    record = struct.Struct("<IQQH")  # segment, offset, length, name length, followed by the name
+
+    def __init__(self, directory: str, fallback: FileStore = None, segment_size: int = IMPORTER_PACK_SEGMENT_SIZE):
+        super().__init__(directory)
+        self.fallback = fallback
+        self.segment_size = segment_size
+        self.lock = threading.Lock()
+        self.index: dict[str, tuple[int, int, int]] = {}
+        self.maps: dict[int, mmap.mmap] = {}
+        self.index_path = os.path.join(directory, "index")
+        self.lock_file = open(os.path.join(directory, "lock"), "ab")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_file.close()
+            raise RuntimeError(f"{directory} is being compacted") from None
+        self.load_index()
+        segments = [segment for segment, _, _ in self.index.values()]
+        self.segment = max(segments, default=0)
+        self.segment_file = open(self.segment_path(self.segment), "ab")
+        self.index_file = open(self.index_path, "ab")
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:05d}.pack")
+
+    def load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        position = 0
+        while position + self.record.size <= len(data):
+            segment, offset, length, name_length = self.record.unpack_from(data, position)
+            end = position + self.record.size + name_length
+            if end > len(data):
+                break
+            self.index[data[position + self.record.size:end].decode("utf-8")] = (segment, offset, length)
+            position = end
+        if position < len(data):
+            # an interrupted append left a partial record, later records must start at a boundary
+            with open(self.index_path, "r+b") as f:
+                f.truncate(position)
+
+    def exists(self, name: str) -> bool:
+        return name in self.index or (self.fallback is not None and self.fallback.exists(name))
+
+    def read(self, name: str) -> memoryview:
+        with self.lock:
+            location = self.index.get(name)
+            if location is None:
+                if self.fallback is None:
+                    raise FileNotFoundError(name)
+                return self.fallback.read(name)
+            segment, offset, length = location
+            mapped = self.maps.get(segment)
+            if mapped is None or len(mapped) < offset + length:
+                # segments grow, map again to cover blobs appended since; views of the old map stay valid
+                with open(self.segment_path(segment), "rb") as f:
+                    mapped = self.maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(mapped)[offset:offset + length]
+
+    def append(self, name: str, source):
+        """Append a blob read from the binary file-like source, unless the pack already has it."""
+        with self.lock:
+            if name in self.index:
+                return
+            offset = self.segment_file.tell()
+            if offset and offset >= self.segment_size:
+                self.segment_file.close()
+                self.segment += 1
+                self.segment_file = open(self.segment_path(self.segment), "ab")
+                offset = self.segment_file.tell()
+            shutil.copyfileobj(source, self.segment_file, IMPORTER_CHUNK_SIZE)
+            self.segment_file.flush()
+            length = self.segment_file.tell() - offset
+            encoded_name = name.encode("utf-8")
+            self.index_file.write(self.record.pack(self.segment, offset, length, len(encoded_name)) + encoded_name)
+            self.index_file.flush()
+            self.index[name] = (self.segment, offset, length)
+
+    def write(self, name: str, data: bytes):
+        self.append(name, io.BytesIO(data))
+
+    def add_file(self, name: str, temp_path: str):
+        with open(temp_path, "rb") as f:
+            self.append(name, f)
+        os.remove(temp_path)
+
+    def copy_to(self, name: str, target_path: str):
+        if name not in self.index and self.fallback is not None:
+            return self.fallback.copy_to(name, target_path)
+        with open(target_path, "wb") as f:
+            f.write(self.read(name))
+
+    def names(self) -> list[str]:
+        return list(self.index)
+
+    def close(self):
+        with self.lock:
+            self.segment_file.close()
+            self.index_file.close()
+            self.maps.clear()
+            self.lock_file.close()
+
+    def compact(self, referenced: set[str]) -> tuple[int, int]:
+        """
+        Rewrite the pack with only the referenced blobs. Returns the number of blobs dropped
+        and the bytes reclaimed. Raises RuntimeError while another process has the pack open.
+        """
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise RuntimeError(f"{self.directory} is open in another process, e.g. a running crawl") from None
+        compacted_path = self.directory.rstrip(os.sep) + ".compacting"
+        shutil.rmtree(compacted_path, ignore_errors=True)
+        compacted = PackStore(compacted_path, segment_size=self.segment_size)
+        for name in tqdm(sorted(self.index, key=self.index.get), desc="Compacting pack", unit="blob"):
+            if name in referenced:
+                compacted.write(name, self.read(name))
+        dropped = len(self.index) - len(compacted.index)
+        reclaimed = sum(length for _, _, length in self.index.values()) - \
+            sum(length for _, _, length in compacted.index.values())
+        compacted.close()
+        previous_path = self.directory.rstrip(os.sep) + ".previous"
+        os.replace(self.directory, previous_path)
+        os.replace(compacted_path, self.directory)
+        # the lock is held until the compacted pack is in place
+        self.close()
+        shutil.rmtree(previous_path)
+        return dropped, reclaimed
+
+
+def open_content_store() -> FileStore:
+    files = FileStore(INPUT_ASSETS_PATH)
+    if IMPORTER_CONTENT_STORE == "pack":
+        return PackStore(INPUT_PACK_PATH, fallback=files)
+    return files
+
+
+def referenced_content() -> set[str]:
+    """Stored names the state refers to. Raises RuntimeError when it refers to none, e.g. without a state."""
+    names = set()
+    for csv_path, db_path in STATE_FILES:
+        site_map = open_sitemap(csv_path, db_path, None, read_only=True)
+        names.update(entry.path for entry in site_map.values() if entry.path)
+        if isinstance(site_map, SqliteSitemap):
+            site_map.close()
+    if not names:
+        raise RuntimeError(f"No stored pages or assets in {', '.join(path for paths in STATE_FILES for path in paths)}")
+    return names
+
+
+def export_pack():
+    """Unpack every blob of the pack into INPUT_ASSETS_PATH, the layout used without a pack."""
+    pack = PackStore(INPUT_PACK_PATH)
+    files = FileStore(INPUT_ASSETS_PATH)
+    for name in tqdm(pack.names(), desc="Exporting pack", unit="blob"):
+        if not files.exists(name):
+            files.write(name, pack.read(name))
+    pack.close()
+
+
+def compact_pack():
+    # before the pack is opened: a state that cannot be read must not empty it
+    referenced = referenced_content()
+    pack = PackStore(INPUT_PACK_PATH)
+    dropped, reclaimed = pack.compact(referenced)
+    print(f'Dropped {dropped} unreferenced blobs, reclaimed {reclaimed / 2 ** 20:.1f} MB.')
+
+
+class ContentWriter:
+    """
+    Streams a body into a temporary file while hashing it, then hands it to the content store
+    under its content address `<sha256><ext>`. When the store already has that name the
+    temporary copy is dropped. Leaving the context without commit() removes the temporary file.
+    """
+
+    def __init__(self, store: FileStore):
+        self.store = store
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        fd, self.temp_path = tempfile.mkstemp(dir=store.directory, suffix=".tmp")
+        os.fchmod(fd, FILE_MODE)
+        self.file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes):
+        self.sha256.update(chunk)
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self, ext: str) -> tuple[str, str]:
+        self.file.close()
+        checksum = self.sha256.hexdigest()
+        file_name = f"{checksum}{ext}"
+        self.store.add_file(file_name, self.temp_path)
+        return checksum, file_name
+
+    def __enter__(self):
         return self
 
-    def persist(self):
-        with open(self.file_path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=["url", "status", "hash", "path", "mimetype", "error"])
-            writer.writeheader()
-            for url, data in self.items():
-                writer.writerow({
-                    "url": url,
-                    "status": data.status.value,
-                    "hash": data.hash,
-                    "path": data.path,
-                    "mimetype": data.mimetype,
-                    "error": data.error
-                })
-
-    def print_summary(self):
-        with Live(refresh_per_second=4) as live:
-            table = Table()
-            table.add_column("Metric")
-            table.add_column("Value")
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        return False
 
-            summary = {}
-            for entry in self.values():
-                summary[entry.status] = summary.get(entry.status, 0) + 1
-            for status, count in summary.items():
-                table.add_row(str(status).capitalize(), f"{count}")
 
-            live.update(table)
+class PartialContentWriter(ContentWriter):
+    """
+    ContentWriter for the body of one URL, kept in INPUT_PARTIAL_PATH/<sha256 of the url>.part with the
+    validator of the response in a .json next to it. A failed download leaves both behind and the next
+    attempt asks only for the missing bytes with Range and If-Range. The server sends the whole body
+    again when the validator no longer matches. Bodies without a strong ETag or a Last-Modified date,
+    and encoded bodies, whose ranges do not match the decoded bytes, are not kept. With leases, the
+    lease of the url in that sitemap is renewed while the body is written.
+    """
 
-    def add_new(self, url, persist=True):
-        self[url] = SitemapEntry(Status.NEW)
-        if persist:
-            self.persist()
+    def __init__(self, store: FileStore, url: str, max_size: int = None, directory: str = INPUT_PARTIAL_PATH,
+                 leases: Sitemap = None):
+        self.store = store
+        self.url = url
+        self.max_size = max_size
+        self.leases = leases
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.offset = 0  # bytes kept from an earlier attempt
+        self.file = None
+        os.makedirs(directory, exist_ok=True)
+        self.temp_path, self.meta_path = self.paths(url, directory)
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.validator = json.load(f)["validator"]
+            self.resumable = os.path.getsize(self.temp_path)
+        except (OSError, ValueError, KeyError):
+            self.validator = None
+            self.resumable = 0
 
-    def add_downloaded(self, url: str, hash: str, path: str, mimetype: str):
-        self[url] = SitemapEntry(Status.DOWNLOADED, hash, path, mimetype)
-        self.persist()
+    @staticmethod
+    def paths(url: str, directory: str = INPUT_PARTIAL_PATH) -> tuple[str, str]:
+        """The .part and .json files of url."""
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(directory, f"{key}.part"), os.path.join(directory, f"{key}.json")
 
-    def add_ignored(self, url):
-        self[url] = SitemapEntry(Status.IGNORED)
-        self.persist()
+    @classmethod
+    def kept(cls, url: str, directory: str = INPUT_PARTIAL_PATH) -> bool:
+        """Whether an earlier attempt left bytes of url behind."""
+        return os.path.exists(cls.paths(url, directory)[0])
 
-    def add_error(self, url: str, e: Exception):
-        self[url] = SitemapEntry(Status.ERROR, error=str(e))
-        self.persist()
+    def request_headers(self) -> dict:
+        if not self.resumable or not self.validator:
+            return {}
+        return {"Range": f"bytes={self.resumable}-", "If-Range": self.validator}
 
-    def copy_entry(self, from_url: str, to_url: str):
-        existing_entry: SitemapEntry = copy.copy(self[from_url])
-        self[to_url] = existing_entry
-        self.persist()
+    def check_status(self, status: int):
+        """
+        Called before raise_for_status(): a 416 to the Range of request_headers(), e.g. for a .part that is
+        already complete, discards the kept bytes and raises RangeMismatch, to ask for the whole body again.
+        """
+        if status == 416 and self.request_headers():
+            resumable = self.resumable
+            self.discard()
+            raise RangeMismatch(f"Range bytes={resumable}- not satisfiable")
+
+    def start(self, status: int, headers):
+        """
+        Prepare for the body of a response: a 206 continues the kept bytes, anything else starts over.
+        Raises AssetTooLarge when the announced size is over max_size and RangeMismatch when a 206 does
+        not continue the kept bytes.
+        """
+        offset = 0
+        if status == 206:
+            offset, total = content_range(headers.get("Content-Range"))
+            if offset != self.resumable:
+                self.discard()
+                raise RangeMismatch(f"Unexpected Content-Range {headers.get('Content-Range')!r}")
+        else:
+            length = headers.get("Content-Length")
+            total = int(length) if length and length.isdigit() else None
+        if self.max_size is not None and total is not None and total > self.max_size:
+            raise AssetTooLarge(f"{total} bytes, the limit is {self.max_size} bytes")
 
-    def get_new_entries(self):
-        return [url for url, entry in self.items() if entry.status == Status.NEW]
+        self.file = open(self.temp_path, "r+b" if offset else "wb")
+        remaining = offset
+        while remaining:
+            chunk = self.file.read(min(IMPORTER_CHUNK_SIZE, remaining))
+            self.sha256.update(chunk)
+            remaining -= len(chunk)
+        self.file.truncate()
+        self.size = self.offset = offset
+
+        etag = headers.get("ETag")
+        self.validator = etag if etag and not etag.startswith("W/") else headers.get("Last-Modified")
+        if headers.get("Content-Encoding", "identity") != "identity":
+            self.validator = None
+        if self.validator:
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump({"url": self.url, "validator": self.validator}, f)
+        elif os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+
+    def write(self, chunk: bytes):
+        if self.max_size is not None and self.size + len(chunk) > self.max_size:
+            raise AssetTooLarge(f"more than {self.max_size} bytes")
+        super().write(chunk)
+        self.renew_lease()
+
+    def renew_lease(self):
+        if self.leases is not None:
+            self.leases.renew_lease(self.url)
+
+    def commit(self, ext: str) -> tuple[str, str]:
+        result = super().commit(ext)
+        self.discard()
+        return result
+
+    def save(self, status: int, headers, chunks, ext: str) -> tuple[str, str]:
+        """Write a whole response body, see start(), and commit it."""
+        with self:
+            self.start(status, headers)
+            for chunk in chunks:
+                self.write(chunk)
+            return self.commit(ext)
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+        for path in (self.temp_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.resumable = 0
+        self.validator = None
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.file is not None:
+            self.file.close()
+        if not self.validator:
+            # nothing a later attempt could resume from
+            self.discard()
+        return False
 
-    def get_downloaded_entries(self):
-        return [(url, entry) for url, entry in self.items() if entry.status == Status.DOWNLOADED]
 
 class Importer:
 
-    def __init__(self):
-        for d in [INPUT_ASSETS_PATH]:
-            os.makedirs(d, exist_ok=True)
+    def __init__(self, engine: str = "threads"):
+        self.engine = engine
+        self.store = open_content_store()
         self.visited = set()
-        self.domain = urlparse(IMPORTER_START_URL).netloc
-        self.site_map = Sitemap(INPUT_SITE_MAP_CSV, IMPORTER_START_URL)
-        self.assets_map = Sitemap(INPUT_ASSETS_MAP_CSV, IMPORTER_START_URL)
+        self.canonicalize = UrlCanonicalizer(IMPORTER_START_URL)
+        self.domain = self.canonicalize.domain
+        self.duplicate_variants = 0  # links skipped as another spelling of a known URL
+        self.site_map, self.assets_map = self.open_state()
+        self.discovery_frontier = DiscoveryFrontier(self.site_map)
+        self.page_frontier = Frontier(self.site_map, low_priority=self.discovery_frontier)
+        self.discovery_depth = {}  # discovery page -> number of chained discovery pages that led to it
+        self.near_duplicates = SimHashIndex.from_sitemap(self.site_map, IMPORTER_SIMHASH_DISTANCE) \
+            if IMPORTER_SIMHASH_DISTANCE is not None else None
+        self.session = self.create_session()
+        self.stats_lock = threading.Lock()
+        # written only by the commands that fetch, see start_telemetry()
+        self.telemetry = Telemetry() if IMPORTER_TELEMETRY else None
+        self.limiter = ConcurrencyLimiter(self.telemetry, IMPORTER_MAX_CONCURRENCY[engine])
+        self.recrawl_stats = collections.Counter()
+        # huge files get their own small pool, see IMPORTER_LARGE_ASSET_EXTENSIONS
+        self.asset_frontier = Frontier(self.assets_map, accepts=lambda url: not self.is_large_asset(url))
+        self.large_asset_frontier = Frontier(self.assets_map, accepts=self.is_large_asset)
+        self.robots: urllib.robotparser.RobotFileParser = None
+        self.seeded = False  # robots.txt and the sitemaps were read by this run
+        self.seed_path = INPUT_SEED_JSON
+        self.parser_pool = self.create_parser_pool() if IMPORTER_PARSER_PROCESSES else None
+
+    @staticmethod
+    def open_state() -> tuple[Sitemap, Sitemap]:
+        return (open_sitemap(INPUT_SITE_MAP_CSV, INPUT_SITE_MAP_DB, IMPORTER_START_URL),
+                open_sitemap(INPUT_ASSETS_MAP_CSV, INPUT_ASSETS_MAP_DB, IMPORTER_START_URL))
+
+    def start_telemetry(self):
+        if self.telemetry is not None:
+            self.telemetry.start()
+
+    def close(self):
+        if self.parser_pool is not None:
+            self.parser_pool.shutdown()
+        self.site_map.close()
+        self.assets_map.close()
+        self.session.close()
+        self.store.close()
+        if self.telemetry is not None:
+            self.telemetry.stop()
+
+    @staticmethod
+    def create_session() -> requests.Session:
+        """
+        One session shared by all worker threads. The adapter keeps up to IMPORTER_MAX_WORKERS
+        keep-alive connections per host, so each worker reuses its TCP+TLS connection.
+        """
+        session = requests.Session()
+        session.headers.update(IMPORTER_HEADERS)
+        adapter = CountingHTTPAdapter(pool_connections=IMPORTER_POOL_CONNECTIONS, pool_maxsize=IMPORTER_MAX_WORKERS)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @staticmethod
+    def create_parser_pool() -> ProcessPoolExecutor:
+        # spawned rather than forked: the importer already runs threads that may hold locks
+        return ProcessPoolExecutor(
+            IMPORTER_PARSER_PROCESSES, mp_context=multiprocessing.get_context("spawn"),
+            initializer=configure_parser_process,
+            initargs=(settings_snapshot(),)
+        )
+
+    def parse(self, content: bytes, headers, base_url: str, main_selector: str, keep: bool) -> ParsedPage:
+        args = (content, headers.get("Content-Type", ""), base_url, main_selector, self.near_duplicates is not None,
+                keep)
+        pool = self.parser_pool
+        if pool is None:
+            return parse_page(*args)
+        try:
+            return pool.submit(parse_page, *args).result()
+        except BrokenProcessPool:
+            # a parser process was killed, e.g. out of memory on this page, the other pages get a new pool
+            with self.stats_lock:
+                if self.parser_pool is pool:
+                    pool.shutdown(wait=False)
+                    self.parser_pool = self.create_parser_pool()
+            raise
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.session.get(url, timeout=IMPORTER_TIMEOUT, **kwargs)
+
+    def get_connection_stats(self) -> dict:
+        stats = {"requests": 0, "connections": 0}
+        for adapter in set(self.session.adapters.values()):
+            stats["requests"] += adapter.requests
+            stats["connections"] += adapter.connections
+        stats["reused"] = max(stats["requests"] - stats["connections"], 0)
+        return stats
+
+    def print_connection_stats(self):
+        stats = self.get_connection_stats()
+        reuse_rate = stats["reused"] / stats["requests"] if stats["requests"] else 0
+        print(f'HTTP requests: {stats["requests"]}, connections opened: {stats["connections"]}, '
+              f'reused: {stats["reused"]} ({reuse_rate:.1%})')
 
     def is_internal(self, url: str) -> bool:
-        return urlparse(url).netloc in ("", self.domain)
+        return self.canonicalize.is_internal(urlsplit(url))
 
     @staticmethod
-    def get_checksum(html: str) -> str:
-        return hashlib.sha256(html.encode("utf-8")).hexdigest()
+    def get_checksum(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
 
     @staticmethod
     def is_ignored_file(url: str) -> bool:
-        path = urlparse(url).path.lower()
-        return any(path.endswith(ext) for ext in IMPORTER_ASSETS_EXTENSIONS)
+        return url_extension(urlparse(url).path) in ASSET_EXTENSIONS
+
+    @staticmethod
+    def is_large_asset(url: str) -> bool:
+        return url_extension(urlparse(url).path) in LARGE_ASSET_EXTENSIONS
+
+    def asset_lane(self, url: str) -> Frontier:
+        return self.large_asset_frontier if self.is_large_asset(url) else self.asset_frontier
 
     @staticmethod
     def matches_ignore_patterns(url: str) -> bool:
-        for pattern in IMPORTER_IGNORE_PATTERNS:
-            if re.search(pattern, url):
-                return True
-        return False
+        return IGNORE_PATTERN.search(url) is not None
 
-    def crawl_page(self, url: str, main_selector: str = "main"):
+    @staticmethod
+    def fail(site_map: Sitemap, frontier: Frontier, url: str, e: Exception, kind: ErrorKind = None):
+        """
+        Record a failed fetch. Retryable errors are deferred with jittered exponential backoff,
+        or for as long as a Retry-After header asks, until IMPORTER_MAX_ATTEMPTS is reached.
+        """
+        kind = kind or classify_error(e)
+        entry = site_map.get(url)
+        attempts = (entry.attempts if entry is not None else 0) + 1
+        if kind in RETRYABLE_ERRORS and attempts < IMPORTER_MAX_ATTEMPTS:
+            next_attempt_at = time.time() + max(backoff_delay(attempts), retry_after(e))
+            site_map.add_retry(url, e, kind, attempts, next_attempt_at)
+            frontier.defer(url, next_attempt_at)
+        else:
+            site_map.add_error(url, e, kind, attempts)
+
+    def load_robots(self) -> list[str]:
+        """
+        Fetch robots.txt. With IMPORTER_OBEY_ROBOTS its disallow rules filter discovered links and
+        its Crawl-delay spaces requests to the start host. Returns the sitemaps it names.
+        """
+        robots_url = urljoin(IMPORTER_START_URL, "/robots.txt")
         try:
-            r = requests.get(url, headers=IMPORTER_HEADERS, timeout=20, allow_redirects=True)
+            r = self.get(robots_url)
             r.raise_for_status()
-            final_url = r.url
         except Exception as e:
-            self.site_map.add_error(url, e)
+            print(f'No robots.txt at {robots_url}: {e}')
+            return []
+        robots = urllib.robotparser.RobotFileParser(robots_url)
+        robots.parse(r.text.splitlines())
+        if IMPORTER_OBEY_ROBOTS:
+            self.robots = robots
+            delay = robots.crawl_delay(IMPORTER_HEADERS.get("User-Agent", "*"))
+            if delay:
+                self.limiter.set_crawl_delay(IMPORTER_START_URL, float(delay))
+                print(f'Honouring Crawl-delay of {delay}s from {robots_url}')
+        return [urljoin(robots_url, url) for url in robots.site_maps() or []]
+
+    def read_sitemaps(self, sitemap_urls: list[str]) -> list[str]:
+        """
+        Page URLs of the sitemaps, following sitemap indexes up to IMPORTER_SITEMAP_MAX_DEPTH levels.
+        Stops after IMPORTER_SITEMAP_MAX_URLS entries, sitemaps over IMPORTER_SITEMAP_MAX_SIZE are skipped.
+        """
+        pages = []
+        seen = set()
+        pending = [(url, 0) for url in sitemap_urls]
+        while pending and len(pages) < IMPORTER_SITEMAP_MAX_URLS:
+            sitemap_url, depth = pending.pop()
+            if sitemap_url in seen:
+                continue
+            seen.add(sitemap_url)
+            try:
+                with self.get(sitemap_url, stream=True) as r:
+                    r.raise_for_status()
+                    # one byte more than allowed tells a sitemap at the limit from one over it
+                    content = r.raw.read(IMPORTER_SITEMAP_MAX_SIZE + 1, decode_content=True)
+                is_index, locs = parse_sitemap_xml(content)
+            except Exception as e:
+                print(f'Skipping sitemap {sitemap_url}: {e}')
+                continue
+            locs = [urljoin(sitemap_url, loc) for loc in locs]
+            if not is_index:
+                pages.extend(locs[:IMPORTER_SITEMAP_MAX_URLS - len(pages)])
+            elif depth < IMPORTER_SITEMAP_MAX_DEPTH:
+                pending.extend((loc, depth + 1) for loc in locs)
+        if len(pages) >= IMPORTER_SITEMAP_MAX_URLS:
+            print(f'Stopped reading sitemaps after {IMPORTER_SITEMAP_MAX_URLS} entries.')
+        return pages
+
+    def sitemaps_read_at(self) -> float:
+        """When a seed() of an earlier run read the sitemaps, None when none did."""
+        try:
+            with open(self.seed_path, "r", encoding="utf-8") as f:
+                return float(json.load(f)["read_at"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def seed(self, from_sitemaps: bool = None):
+        """
+        With IMPORTER_SEED_FROM_SITEMAPS (or from_sitemaps), queue every page listed in the site's sitemaps,
+        so the crawl starts with a full frontier and finds pages no other page links to. robots.txt is read
+        once per run when it names the sitemaps or IMPORTER_OBEY_ROBOTS is set, the sitemaps once every
+        IMPORTER_SEED_MAX_AGE seconds, the pages they listed are in the state already.
+        """
+        if from_sitemaps is None:
+            from_sitemaps = IMPORTER_SEED_FROM_SITEMAPS
+        if self.seeded or not (from_sitemaps or IMPORTER_OBEY_ROBOTS):
             return
+        self.seeded = True
+        sitemap_urls = self.load_robots() or [urljoin(IMPORTER_START_URL, "/sitemap.xml")]
+        if not from_sitemaps:
+            return
+        read_at = self.sitemaps_read_at()
+        if read_at is not None and (IMPORTER_SEED_MAX_AGE is None or time.time() - read_at < IMPORTER_SEED_MAX_AGE):
+            print(f'Sitemaps were read {(time.time() - read_at) / 3600:.1f} hours ago, not reading them again.')
+            return
+        listed = self.read_sitemaps(sitemap_urls)
+        # pruned pages only serve link discovery, which the sitemap already did
+        urls = [url for url in map(self.canonical_page_url, listed)
+                if url is not None and self.is_crawlable(url) and not self.is_pruned(url)]
+        added = self.queue_pages(urls)
+        print(f'Seeded {len(added)} new URLs from {len(listed)} sitemap entries.')
+        if listed:
+            # sites without sitemaps are asked again, that is a request or two
+            with open(self.seed_path, "w", encoding="utf-8") as f:
+                json.dump({"read_at": time.time(), "entries": len(listed)}, f)
 
-        if final_url not in self.site_map:
-            self.site_map.add_new(final_url)
-        else:
+    def queue_pages(self, urls: list[str]) -> list[str]:
+        """Add canonical, crawlable page urls as NEW and queue them. Returns the urls that were added."""
+        added = self.site_map.add_new_many(urls)
+        for url in added:
+            self.page_frontier.put(url)
+        return added
+
+    def crawl_page(self, url: str, main_selector: str = "main"):
+        try:
+            try:
+                final_url, headers, content, routed = self.fetch_page(url)
+            except RangeMismatch:
+                # the kept bytes are gone, once more for the whole body
+                final_url, headers, content, routed = self.fetch_page(url)
+        except Exception as e:
+            self.fail_download(self.site_map, self.page_frontier, url, e)
+            return
+
+        if routed is not None:
+            self.add_routed_asset(url, final_url, *routed, headers.get("Content-Type", ""))
+            return
+        self.process_page(url, final_url, content, headers, main_selector)
+
+    def fetch_page(self, url: str) -> tuple:
+        """
+        Final url, headers and either the body of an HTML page or the checksum and file name of a non-HTML
+        body, stored as an asset, see add_routed_asset(). Only such a body leaves bytes to resume behind.
+        """
+        writer = PartialContentWriter(self.store, url, leases=self.site_map) if PartialContentWriter.kept(url) \
+            else None
+        with self.limiter.track(url, leases=self.site_map) as sample, self.get(
+                url, allow_redirects=True, stream=True, headers=writer.request_headers() if writer else {}) as r:
+            sample.headers_received(r.status_code, r.headers, r.elapsed.total_seconds())
+            if is_html(r.headers.get("Content-Type", "")):
+                if writer is not None:
+                    self.drop_kept_body(writer, r.status_code)
+                content = r.content
+                sample.size = len(content)
+                r.raise_for_status()
+                return r.url, r.headers, content, None
+            if writer is None:
+                writer = PartialContentWriter(self.store, url, leases=self.site_map)
+            writer.check_status(r.status_code)
+            r.raise_for_status()
+            ext = self.routed_extension(r.url, r.headers)
+            writer.max_size = IMPORTER_ASSET_MAX_SIZE.get(ext)
+            routed = writer.save(r.status_code, r.headers, r.iter_content(IMPORTER_CHUNK_SIZE), ext)
+            sample.size = writer.size - writer.offset
+            return r.url, r.headers, None, routed
+
+    @staticmethod
+    def drop_kept_body(writer: PartialContentWriter, status: int):
+        """The url serves a page now, the bytes kept of its non-HTML body are of no use."""
+        writer.discard()
+        if status in (206, 416):
+            # a part of the page, or none of it
+            raise RangeMismatch(f"{status} response to a Range request for a page")
+
+    @staticmethod
+    def routed_extension(url: str, headers) -> str:
+        """Extension of a non-HTML body served by a page url: its download file name, its url or its mimetype."""
+        match = CONTENT_DISPOSITION_FILENAME.search(headers.get("Content-Disposition", ""))
+        for name in (match[1] if match else "", urlparse(url).path):
+            ext = url_extension(name)
+            if ext in ASSET_EXTENSIONS:
+                return ext
+        mimetype = headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+        return mimetypes.guess_extension(mimetype) or ""
+
+    def add_routed_asset(self, url: str, final_url: str, checksum: str, file_name: str, content_type: str):
+        """
+        A page url served a non-HTML body, e.g. ?download=123 or an attachment endpoint. The body was stored
+        without being parsed, the assets map gets it under the url and the url it redirected to, so the
+        transformer links it like any asset, and both are ASSET in the site map so they are not fetched again.
+        """
+        for routed_url in dict.fromkeys((url, self.canonicalize(final_url))):
+            self.assets_map.add_downloaded(routed_url, checksum, file_name, content_type)
+            self.site_map.add_asset(routed_url, content_type)
+
+    @staticmethod
+    def extract_links(html: str, base_url: str, main_selector: str = "main") -> tuple[list[str], list[str], str]:
+        """
+        Single pass over a page with IMPORTER_PARSER_BACKEND: absolute URLs of every <a href>, and of
+        every img/video/audio/source src followed by every <a href> as asset candidates, and the text
+        of the main_selector elements. Only tag names are supported as selectors here.
+        """
+        page_links = PARSER_BACKENDS[IMPORTER_PARSER_BACKEND](html, main_selector)
+        links = [urljoin(base_url, href) for href in page_links.links]
+        media = [urljoin(base_url, src) for src in page_links.media]
+        return links, media + links, page_links.text
+
+    def count_variant(self, raw_url: str, canonical_url: str, site_map: Sitemap):
+        # a distinct spelling of a known URL that exact-string dedup would have fetched again
+        if raw_url != canonical_url and canonical_url in site_map:
+            with self.stats_lock:
+                self.duplicate_variants += 1
+
+    def canonical_page_url(self, raw_url: str) -> str:
+        """Canonical form of an internal page link, None for external links and assets."""
+        parts = self.canonicalize.split(raw_url)
+        if not self.canonicalize.is_internal(parts) or parts.scheme not in ("http", "https"):
+            return None
+        if url_extension(parts.path) in ASSET_EXTENSIONS:
+            return None
+        return urlunsplit(parts)
+
+    def is_crawlable(self, url: str) -> bool:
+        if IGNORE_PATTERN.search(url):
+            return False
+        return self.robots is None or self.robots.can_fetch(IMPORTER_HEADERS.get("User-Agent", "*"), url)
+
+    @staticmethod
+    def is_pruned(url: str) -> bool:
+        """Whether the transformer will drop the page, which makes storing it pointless."""
+        return IMPORTER_PRUNE_MODE is not None and PRUNE_PATTERN.search(url) is not None
+
+    def add_page_links(self, urls: list[str], depth: int = 0):
+        # Add new links to state if not present. depth is the discovery depth of the linking page.
+        for raw_url in urls:
+            next_url = self.canonical_page_url(raw_url)
+            if next_url is None:
+                continue
+            self.count_variant(raw_url, next_url, self.site_map)
+            if next_url in self.site_map:
+                continue
+            if not self.is_crawlable(next_url):
+                self.site_map.add_ignored(next_url)
+                continue
+            if self.is_pruned(next_url):
+                if IMPORTER_PRUNE_MODE == "skip":
+                    self.site_map.add_ignored(next_url)
+                elif depth < IMPORTER_DISCOVERY_DEPTH:
+                    # past the budget the link stays unknown, a shorter path may still reach it
+                    with self.stats_lock:
+                        self.discovery_depth[next_url] = depth + 1
+                    self.site_map.add_discovery(next_url)
+                    self.discovery_frontier.put(next_url)
+                continue
+            self.site_map.add_new(next_url)
+            self.page_frontier.put(next_url)
+
+    def add_asset_links(self, urls: list[str], persist=True):
+        """Add the unknown assets as NEW, written to the state at once. persist=False leaves that to the caller."""
+        assets = []
+        for raw_url in urls:
+            parts = self.canonicalize.split(raw_url)
+            if url_extension(parts.path) not in ASSET_EXTENSIONS:
+                continue
+            asset_url = urlunsplit(parts)
+            self.count_variant(raw_url, asset_url, self.assets_map)
+            assets.append(asset_url)
+        for asset_url in self.assets_map.add_new_many(assets, persist):
+            self.asset_lane(asset_url).put(asset_url)
+
+    def print_duplicate_stats(self):
+        print(f'Skipped {self.duplicate_variants} duplicate URL variants (fragments, query order, scheme).')
+
+    def process_page(self, url: str, final_url: str, content: bytes, headers, main_selector: str = "main"):
+        base_url = final_url
+        final_url = self.canonicalize(final_url)
+        # an unknown redirect target is only added with the outcome below, a failure is recorded for url alone
+        if final_url != url and final_url in self.site_map:
             self.site_map.copy_entry(final_url, url)
 
         try:
-            html_content = r.text
-            soup = BeautifulSoup(html_content, "html.parser")
+            pruned = IMPORTER_PRUNE_MODE == "discover" and self.is_pruned(final_url)
+            page = self.parse(content, headers, base_url, main_selector, keep=not pruned)
+            if self.telemetry is not None:
+                self.telemetry.observe_parse(urlparse(url).netloc, headers.get("Content-Type", ""), page.seconds)
+            if pruned:
+                self.add_page_links(page.links, self.discovery_depth.get(url, 1))
+                self.site_map.add_visited(final_url, headers.get("Content-Type", ""))
+                if final_url != url:
+                    self.site_map.copy_entry(final_url, url)
+                return
+            original = self.near_duplicates.find_or_add(page.simhash, final_url) \
+                if page.simhash is not None else None
+            if original is not None:
+                # same article under another URL (replytocom, amp, print views...), not stored again
+                if IMPORTER_FOLLOW_DUPLICATE_LINKS:
+                    self.add_page_links(page.links)
+                    self.add_asset_links(page.assets)
+                self.site_map.add_duplicate(final_url, original, headers.get("Content-Type", ""), page.simhash)
+                if final_url != url:
+                    self.site_map.copy_entry(final_url, url)
+                return
 
-            # Add new links to state if not present
-            for a in soup.find_all("a"):
-                href = a.get("href")
-                if not href:
-                    continue
-                next_url = urljoin(final_url, href)
-                parsed = urlparse(next_url)
-                if self.is_internal(next_url) and parsed.scheme in ("http", "https"):
-                    path = urlparse(next_url).path.lower()
-                    if any(path.endswith(ext) for ext in IMPORTER_ASSETS_EXTENSIONS):
-                        continue
-                    if self.matches_ignore_patterns(next_url):
-                        if next_url not in self.site_map:
-                            self.site_map.add_ignored(next_url)
-                        continue
-                    if next_url not in self.site_map:
-                        self.site_map.add_new(next_url)
+            self.add_page_links(page.links)
+            self.add_asset_links(page.assets)
+            self.store.write(page.file_name, page.data)
+
+            self.site_map.add_downloaded(final_url, page.checksum, page.file_name, headers.get("Content-Type", ""),
+                                         headers.get("ETag"), headers.get("Last-Modified"), page.simhash)
+            if final_url != url:
+                self.site_map.copy_entry(final_url, url)
+        except Exception as e:
+            self.site_map.add_error(url, e, ErrorKind.PARSE_ERROR)
+            return
+
+    async def crawl_page_async(self, session, executor: ThreadPoolExecutor, url: str, main_selector: str = "main"):
+        try:
+            try:
+                final_url, headers, content, routed = await self.fetch_page_async(session, executor, url)
+            except RangeMismatch:
+                # the kept bytes are gone, once more for the whole body
+                final_url, headers, content, routed = await self.fetch_page_async(session, executor, url)
+        except Exception as e:
+            self.fail_download(self.site_map, self.page_frontier, url, e)
+            return
 
-            checksum = self.get_checksum(html_content)
-            file_path = f"{checksum}.html"
-            with open(os.path.join(INPUT_ASSETS_PATH, f"{checksum}.html"), "w", encoding="utf-8") as f:
-                f.write(html_content)
+        if routed is not None:
+            self.add_routed_asset(url, final_url, *routed, headers.get("Content-Type", ""))
+            return
+        # parsing is CPU-bound, keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(
+            executor, self.process_page, url, final_url, content, headers, main_selector)
+
+    async def fetch_page_async(self, session, executor: ThreadPoolExecutor, url: str) -> tuple:
+        """See fetch_page()."""
+        loop = asyncio.get_running_loop()
+        writer = PartialContentWriter(self.store, url, leases=self.site_map) if PartialContentWriter.kept(url) \
+            else None
+        async with self.limiter.track(url, leases=self.site_map) as sample, session.get(
+                url, allow_redirects=True, headers=writer.request_headers() if writer else {},
+                trace_request_ctx=sample) as r:
+            sample.headers_received(r.status, r.headers)
+            final_url = str(r.url)
+            if is_html(r.headers.get("Content-Type", "")):
+                if writer is not None:
+                    self.drop_kept_body(writer, r.status)
+                r.raise_for_status()
+                content = await r.read()
+                sample.size = len(content)
+                return final_url, r.headers, content, None
+            if writer is None:
+                writer = PartialContentWriter(self.store, url, leases=self.site_map)
+            writer.check_status(r.status)
+            r.raise_for_status()
+            ext = self.routed_extension(final_url, r.headers)
+            writer.max_size = IMPORTER_ASSET_MAX_SIZE.get(ext)
+            with writer:
+                await loop.run_in_executor(executor, writer.start, r.status, r.headers)
+                async for chunk in r.content.iter_chunked(IMPORTER_CHUNK_SIZE):
+                    await loop.run_in_executor(executor, writer.write, chunk)
+                sample.size = writer.size - writer.offset
+                routed = await loop.run_in_executor(executor, writer.commit, ext)
+            return final_url, r.headers, None, routed
 
-            self.site_map.add_downloaded(final_url, checksum, file_path, r.headers.get("Content-Type", ""))
+    def recrawl_page(self, url: str, main_selector: str = "main"):
+        """
+        Conditional GET of an already downloaded page. The stored copy is only rewritten when the
+        server sends a new body whose checksum differs from the stored one.
+        """
+        entry = self.site_map[url]
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        try:
+            with self.limiter.track(url) as sample:
+                r = self.get(url, headers=headers, allow_redirects=True)
+                sample.headers_received(r.status_code, r.headers, r.elapsed.total_seconds())
+                sample.size = len(r.content)
+            if r.status_code == 304:
+                self.count_recrawl("not modified")
+                return
+            r.raise_for_status()
         except Exception as e:
-            self.site_map.add_error(url, e)
+            # keep the previously downloaded copy
+            print(f"Error recrawling {url}: {e}")
+            self.count_recrawl("error")
+            return
+
+        _, data = decode_page(r.content, r.headers.get("Content-Type", ""))
+        if self.get_checksum(data) == entry.hash:
+            updated = copy.copy(entry)
+            updated.etag = r.headers.get("ETag")
+            updated.last_modified = r.headers.get("Last-Modified")
+            self.site_map.put(url, updated)
+            self.count_recrawl("unchanged")
             return
 
+        self.process_page(url, r.url, r.content, r.headers, main_selector)
+        self.count_recrawl("changed")
+
+    def count_recrawl(self, outcome: str):
+        with self.stats_lock:
+            self.recrawl_stats[outcome] += 1
+
+    def recrawl(self, main_selector: str = "main"):
+        self.recrawl_stats = collections.Counter()
+        self.start_telemetry()
+        frontier = RecrawlFrontier(self.site_map)
+        print(f'Recrawling {len(frontier)} downloaded pages...')
+        self.drain(frontier, functools.partial(self.recrawl_page, main_selector=main_selector), "Recrawling", "page")
+        self.print_connection_stats()
+        stats = self.recrawl_stats
+        print(f'Recrawl finished: {stats["changed"]} changed, {stats["unchanged"]} unchanged, '
+              f'{stats["not modified"]} not modified, {stats["error"]} errors.')
+        if any(self.site_map.count(status) for status in (Status.NEW, Status.DISCOVERY, Status.IN_PROGRESS)):
+            self.crawl_pages(main_selector)
+
+    @staticmethod
+    def drain(frontier: Frontier, task, desc: str, unit: str, producer_done: threading.Event = None,
+              position: int = 0, workers: int = IMPORTER_MAX_WORKERS):
+        """
+        Feed URLs from the frontier to a long-lived worker pool until the frontier is empty
+        and nothing is in flight. At most IMPORTER_SUBMISSION_WINDOW tasks are submitted at
+        once, so URLs discovered by running tasks are picked up as soon as a slot frees up.
+        With producer_done the pool also waits for URLs until that event is set.
+        """
+        in_flight = {}
+        window = min(IMPORTER_SUBMISSION_WINDOW, workers * 2)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            with tqdm(desc=desc, unit=unit, ncols=100, position=position) as pbar:
+                while True:
+                    # read before polling the frontier, the producer fills it before it is done
+                    producing = producer_done is not None and not producer_done.is_set()
+                    while len(in_flight) < window:
+                        url = frontier.next(in_flight)
+                        if url is None:
+                            break
+                        in_flight[executor.submit(task, url)] = url
+                    if len(in_flight) >= window:
+                        # nothing can be submitted before a task finishes, waiting for a due retry would spin
+                        due_in = None
+                    else:
+                        due_in = frontier.next_due_in()
+                        if producing:
+                            due_in = min(due_in or IMPORTER_IDLE_POLL, IMPORTER_IDLE_POLL)
+                    if not in_flight:
+                        if due_in is None:
+                            break
+                        time.sleep(due_in)
+                        continue
+                    done, _ = wait(in_flight, timeout=due_in, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del in_flight[future]
+                    pbar.update(len(done))
+                    pbar.set_postfix(queued=len(frontier), in_flight=len(in_flight))
+
+    @staticmethod
+    async def drain_async(frontier: Frontier, task, desc: str, unit: str, producer_done: threading.Event = None,
+                          position: int = 0, concurrency: int = IMPORTER_ASYNC_CONCURRENCY):
+        """
+        asyncio counterpart of drain(): keeps up to concurrency requests in flight on the event loop.
+        """
+        in_flight = {}
+        with tqdm(desc=desc, unit=unit, ncols=100, position=position) as pbar:
+            while True:
+                producing = producer_done is not None and not producer_done.is_set()
+                while len(in_flight) < concurrency:
+                    url = frontier.next(in_flight)
+                    if url is None:
+                        break
+                    in_flight[asyncio.ensure_future(task(url))] = url
+                if len(in_flight) >= concurrency:
+                    # nothing can be submitted before a task finishes, waiting for a due retry would spin
+                    due_in = None
+                else:
+                    due_in = frontier.next_due_in()
+                    if producing:
+                        due_in = min(due_in or IMPORTER_IDLE_POLL, IMPORTER_IDLE_POLL)
+                if not in_flight:
+                    if due_in is None:
+                        break
+                    await asyncio.sleep(due_in)
+                    continue
+                done, _ = await asyncio.wait(in_flight, timeout=due_in, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    del in_flight[future]
+                pbar.update(len(done))
+                pbar.set_postfix(queued=len(frontier), in_flight=len(in_flight))
+
+    @staticmethod
+    def create_async_session():
+        import aiohttp
+
+        # requests pass their RequestSample as trace_request_ctx to collect DNS and connect times
+        async def dns_start(session, context, params):
+            context.dns_started = time.monotonic()
+
+        async def dns_end(session, context, params):
+            if context.trace_request_ctx is not None:
+                context.trace_request_ctx.dns += time.monotonic() - context.dns_started
+
+        async def connect_start(session, context, params):
+            context.connect_started = time.monotonic()
+            context.dns_before = context.trace_request_ctx.dns if context.trace_request_ctx is not None else 0.0
+
+        async def connect_end(session, context, params):
+            sample = context.trace_request_ctx
+            if sample is not None:
+                # aiohttp resolves inside connection creation, keep DNS out of the connect time
+                sample.connect += time.monotonic() - context.connect_started - (sample.dns - context.dns_before)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_dns_resolvehost_start.append(dns_start)
+        trace_config.on_dns_resolvehost_end.append(dns_end)
+        trace_config.on_connection_create_start.append(connect_start)
+        trace_config.on_connection_create_end.append(connect_end)
+
+        connector = aiohttp.TCPConnector(limit=IMPORTER_ASYNC_CONCURRENCY)
+        return aiohttp.ClientSession(
+            headers=IMPORTER_HEADERS,
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=IMPORTER_TIMEOUT),
+            trace_configs=[trace_config]
+        )
+
+    async def crawl_pages_async(self, main_selector: str = "main"):
+        pages_done = threading.Event()
+        with ThreadPoolExecutor(max_workers=IMPORTER_MAX_WORKERS) as executor:
+            async with self.create_async_session() as session:
+                async def crawl():
+                    try:
+                        await self.drain_async(
+                            self.page_frontier,
+                            functools.partial(self.crawl_page_async, session, executor, main_selector=main_selector),
+                            "Crawling", "page"
+                        )
+                    finally:
+                        pages_done.set()
+
+                drains = [crawl()]
+                if IMPORTER_DOWNLOAD_ASSETS_WHILE_CRAWLING:
+                    drains.extend(self.asset_drains_async(session, executor, pages_done, position=1))
+                await asyncio.gather(*drains)
+
+    async def download_assets_async(self):
+        with ThreadPoolExecutor(max_workers=IMPORTER_MAX_WORKERS) as executor:
+            async with self.create_async_session() as session:
+                await asyncio.gather(*self.asset_drains_async(session, executor))
+
+    def asset_drains_async(self, session, executor: ThreadPoolExecutor, producer_done: threading.Event = None,
+                           position: int = 0) -> list:
+        task = functools.partial(self.download_asset_async, session, executor)
+        return [
+            self.drain_async(self.asset_frontier, task, "Downloading assets", "asset", producer_done, position),
+            self.drain_async(self.large_asset_frontier, task, "Downloading large assets", "asset", producer_done,
+                             position + 1, IMPORTER_LARGE_ASSET_WORKERS),
+        ]
+
     def crawl_pages(self, main_selector: str = "main"):
         print('Starting crawl...')
+        self.start_telemetry()
         print(f'Loaded {len(self.site_map)} URLs from state.')
+        interrupted = self.site_map.count(Status.IN_PROGRESS) + self.assets_map.count(Status.IN_PROGRESS)
+        if interrupted:
+            print(f'{interrupted} URLs were being fetched by an interrupted run, '
+                  f'they are fetched again once their lease expires.')
         print('Directories ensured.')
+        self.seed()
         print('Crawling started...')
-        max_workers = 8  # You can adjust this number based on your needs
-        iteration = 0
-        while True:
-            iteration += 1
-            self.site_map.load()
-            to_process = self.site_map.get_new_entries()
-            if not to_process:
-                break
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = {executor.submit(self.crawl_page, url, main_selector): url for url in to_process}
-                with tqdm(total=len(futures), unit="page", ncols=100) as pbar:
-                    for future in as_completed(futures):
-                        url = futures[future]
-                        pbar.set_description(f"Crawling [{iteration}] {url}")
-                        pbar.update(1)
+        if self.engine == "asyncio":
+            asyncio.run(self.crawl_pages_async(main_selector))
+        else:
+            pages_done = threading.Event()
+            asset_downloads = threading.Thread(target=self.drain_assets, args=(pages_done, 1))
+            if IMPORTER_DOWNLOAD_ASSETS_WHILE_CRAWLING:
+                asset_downloads.start()
+            try:
+                self.drain(self.page_frontier, functools.partial(self.crawl_page, main_selector=main_selector),
+                           "Crawling", "page")
+            finally:
+                pages_done.set()
+                if asset_downloads.is_alive():
+                    asset_downloads.join()
+            self.print_connection_stats()
+        self.print_duplicate_stats()
         print('Crawling finished...')
+        self.site_map.print_summary(self.limiter.summary())
+        if IMPORTER_DOWNLOAD_ASSETS_WHILE_CRAWLING:
+            self.assets_map.print_summary()
 
     def extract_assets(self):
+        """Re-parse stored pages for assets, for crawls made before assets were collected while crawling."""
         for url, entry in tqdm(self.site_map.get_downloaded_entries(), desc="Extracting assets"):
-            html_path = os.path.join(INPUT_ASSETS_PATH, entry.path)
             try:
-                with open(html_path, "r", encoding="utf-8") as f:
-                    soup = BeautifulSoup(f.read(), "html.parser")
-                # Extract assets from media tags
-                for tag in soup.find_all(["img", "video", "audio", "source"]):
-                    src = tag.get("src")
-                    if src:
-                        asset_url = urljoin(url, src)
-                        parsed = urlparse(asset_url)
-                        ext = os.path.splitext(parsed.path)[1].lower()
-                        if ext in IMPORTER_ASSETS_EXTENSIONS and asset_url not in self.assets_map:
-                            self.assets_map.add_new(asset_url, False)
-                # Extract directly linked assets from <a> tags
-                for a in soup.find_all("a"):
-                    href = a.get("href")
-                    if href:
-                        asset_url = urljoin(url, href)
-                        parsed = urlparse(asset_url)
-                        ext = os.path.splitext(parsed.path)[1].lower()
-                        if ext in IMPORTER_ASSETS_EXTENSIONS and asset_url not in self.assets_map:
-                            self.assets_map.add_new(asset_url, False)
+                _, asset_urls, _ = self.extract_links(read_page(self.store, entry.path), url)
+                self.add_asset_links(asset_urls, False)
             except Exception as e:
-                print(f"Error parsing {html_path}: {e}")
+                print(f"Error parsing {entry.path}: {e}")
 
         self.assets_map.persist()
         print('Extracting assets finished...')
 
-
     def download_assets(self):
-        max_workers = 8  # You can adjust this number as needed
-        asset_urls = list(self.assets_map.get_new_entries())
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(self.download_asset, asset_url): asset_url for asset_url in asset_urls}
-            with tqdm(total=len(futures), desc="Downloading assets") as pbar:
-                for future in as_completed(futures):
-                    pbar.update(1)
+        self.start_telemetry()
+        if self.engine == "asyncio":
+            asyncio.run(self.download_assets_async())
+        else:
+            self.drain_assets()
+            self.print_connection_stats()
         print('Extracting assets finished...')
+        self.assets_map.print_summary(self.limiter.summary())
+
+    def drain_assets(self, producer_done: threading.Event = None, position: int = 0):
+        """
+        Download the assets on two pools, IMPORTER_LARGE_ASSET_EXTENSIONS on their own
+        IMPORTER_LARGE_ASSET_WORKERS threads and everything else on the usual pool.
+        """
+        large_downloads = threading.Thread(
+            target=self.drain,
+            args=(self.large_asset_frontier, self.download_asset, "Downloading large assets", "asset", producer_done,
+                  position + 1, IMPORTER_LARGE_ASSET_WORKERS)
+        )
+        large_downloads.start()
+        try:
+            self.drain(self.asset_frontier, self.download_asset, "Downloading assets", "asset", producer_done, position)
+        finally:
+            large_downloads.join()
 
     def download_asset(self, asset_url):
+        writer = PartialContentWriter(self.store, asset_url, self.asset_max_size(asset_url), leases=self.assets_map)
         try:
-            r = requests.get(asset_url, headers=IMPORTER_HEADERS, timeout=20, stream=True)
+            try:
+                self.fetch_asset(asset_url, writer)
+            except RangeMismatch:
+                # the kept bytes are gone, once more for the whole body
+                self.fetch_asset(asset_url, writer)
+        except Exception as e:
+            self.fail_download(self.assets_map, self.asset_lane(asset_url), asset_url, e)
+
+    def fetch_asset(self, asset_url: str, writer: PartialContentWriter):
+        with self.limiter.track(asset_url, "asset", self.assets_map) as sample, \
+                self.get(asset_url, stream=True, headers=writer.request_headers()) as r:
+            sample.headers_received(r.status_code, r.headers, r.elapsed.total_seconds())
+            writer.check_status(r.status_code)
             r.raise_for_status()
-            content = r.content
-            checksum = hashlib.sha256(content).hexdigest()
-            ext = os.path.splitext(urlparse(asset_url).path)[1].lower()
-            file_name = f"{checksum}{ext}"
-            file_path = os.path.join(INPUT_ASSETS_PATH, file_name)
-            with open(file_path, "wb") as f:
-                f.write(content)
-            self.assets_map.add_downloaded(asset_url, checksum, file_name, r.headers.get("Content-Type", ""))
+            checksum, file_name = writer.save(r.status_code, r.headers, r.iter_content(IMPORTER_CHUNK_SIZE),
+                                              self.asset_extension(asset_url))
+            sample.size = writer.size - writer.offset
+        self.assets_map.add_downloaded(asset_url, checksum, file_name, r.headers.get("Content-Type", ""))
+
+    async def download_asset_async(self, session, executor: ThreadPoolExecutor, asset_url: str):
+        writer = PartialContentWriter(self.store, asset_url, self.asset_max_size(asset_url), leases=self.assets_map)
+        try:
+            try:
+                await self.fetch_asset_async(session, executor, asset_url, writer)
+            except RangeMismatch:
+                # the kept bytes are gone, once more for the whole body
+                await self.fetch_asset_async(session, executor, asset_url, writer)
         except Exception as e:
-            self.assets_map.add_error(asset_url, e)
+            self.fail_download(self.assets_map, self.asset_lane(asset_url), asset_url, e)
+
+    async def fetch_asset_async(self, session, executor: ThreadPoolExecutor, asset_url: str,
+                                writer: PartialContentWriter):
+        loop = asyncio.get_running_loop()
+        async with self.limiter.track(asset_url, "asset", self.assets_map) as sample, \
+                session.get(asset_url, headers=writer.request_headers(), trace_request_ctx=sample) as r:
+            sample.headers_received(r.status, r.headers)
+            writer.check_status(r.status)
+            r.raise_for_status()
+            with writer:
+                await loop.run_in_executor(executor, writer.start, r.status, r.headers)
+                async for chunk in r.content.iter_chunked(IMPORTER_CHUNK_SIZE):
+                    await loop.run_in_executor(executor, writer.write, chunk)
+                sample.size = writer.size - writer.offset
+                checksum, file_name = await loop.run_in_executor(
+                    executor, writer.commit, self.asset_extension(asset_url))
+            content_type = r.headers.get("Content-Type", "")
+        self.assets_map.add_downloaded(asset_url, checksum, file_name, content_type)
+
+    def fail_download(self, site_map: Sitemap, frontier: Frontier, url: str, e: Exception):
+        self.fail(site_map, frontier, url, e)
+        if site_map[url].status is Status.ERROR and PartialContentWriter.kept(url):
+            # not retried, so the kept bytes are of no use
+            PartialContentWriter(self.store, url).discard()
+
+    def asset_max_size(self, asset_url: str) -> int:
+        return IMPORTER_ASSET_MAX_SIZE.get(self.asset_extension(asset_url))
+
+    @staticmethod
+    def asset_extension(asset_url: str) -> str:
+        return os.path.splitext(urlparse(asset_url).path)[1].lower()
+
+
+class MessageChannel:
+    """Newline-delimited JSON messages over a socket. send() may be called from several threads."""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.reader = sock.makefile("r", encoding="utf-8", newline="\n")
+        self.lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, address: tuple) -> "MessageChannel":
+        return cls(socket.create_connection(tuple(address)))
+
+    def send(self, message: dict):
+        data = (json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8")
+        with self.lock:
+            self.sock.sendall(data)
+
+    def __iter__(self):
+        for line in self.reader:
+            if not line.endswith("\n"):
+                # cut off by a lost connection, the sender sends the message again
+                return
+            yield json.loads(line)
+
+    def close(self):
+        try:
+            # wakes up a thread still reading from the socket
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.reader.close()
+        self.sock.close()
+
+
+class ShardRing:
+    """
+    Consistent hash ring: every worker owns IMPORTER_SHARD_REPLICAS points and a URL belongs to
+    the worker owning the first point after its hash, so adding a worker only moves the URLs that
+    land next to its points.
+    """
+
+    def __init__(self, names, replicas: int = IMPORTER_SHARD_REPLICAS):
+        points = sorted((stable_hash(f"{name}#{replica}"), name) for name in names for replica in range(replicas))
+        self.points = [point for point, _ in points]
+        self.names = [name for _, name in points]
+
+    def owner(self, url: str) -> str:
+        return self.names[bisect.bisect(self.points, stable_hash(url)) % len(self.points)]
+
+
+class ShardWorker(Importer):
+    """
+    One node of a distributed crawl, see CrawlCoordinator. It fetches the pages and assets its
+    shard owns, forwards the links it finds for other shards to their owners and reports every
+    state change to the coordinator. Its own state lives in INPUT_SHARDS_PATH/<name>, so a
+    restarted worker resumes its shard.
+    """
+
+    def __init__(self, name: str, coordinator_address: tuple = IMPORTER_COORDINATOR_ADDRESS):
+        if IMPORTER_CONTENT_STORE != "files":
+            raise ValueError('Distributed crawls need IMPORTER_CONTENT_STORE = "files", packs have a single writer')
+        self.name = name
+        self.state_dir = os.path.join(INPUT_SHARDS_PATH, name)
+        os.makedirs(self.state_dir, exist_ok=True)
+        super().__init__("threads")
+        if self.telemetry is not None:
+            self.telemetry.json_path = os.path.join(self.state_dir, os.path.basename(INPUT_TELEMETRY_JSON))
+            self.telemetry.prom_path = os.path.join(self.state_dir, os.path.basename(INPUT_TELEMETRY_PROM))
+        self.seed_path = os.path.join(self.state_dir, os.path.basename(INPUT_SEED_JSON))
+        self.site_map.changed = set()
+        self.assets_map.changed = set()
+        self.coordinator_address = coordinator_address
+        self.coordinator: MessageChannel = None
+        self.addresses = {}
+        self.ring: ShardRing = None
+        self.peers: dict[str, MessageChannel] = {}
+        self.peers_lock = threading.Lock()
+        self.outbox = collections.defaultdict(list)  # owner -> [kind, url, depth] not sent yet
+        self.outbox_lock = threading.Lock()
+        self.forwarded = set()
+        self.sent = 0  # forwarded urls, for the coordinator's termination check
+        self.received = 0
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def open_state(self) -> tuple[Sitemap, Sitemap]:
+        # the start url is added by the worker that owns it, see seed()
+        return (open_sitemap(os.path.join(self.state_dir, os.path.basename(INPUT_SITE_MAP_CSV)),
+                             os.path.join(self.state_dir, os.path.basename(INPUT_SITE_MAP_DB)), None),
+                open_sitemap(os.path.join(self.state_dir, os.path.basename(INPUT_ASSETS_MAP_CSV)),
+                             os.path.join(self.state_dir, os.path.basename(INPUT_ASSETS_MAP_DB)), None))
+
+    def owns(self, url: str) -> bool:
+        return self.ring.owner(url) == self.name
+
+    def forward(self, url: str, kind: str, depth: int = 0):
+        with self.outbox_lock:
+            if (kind, url) in self.forwarded:
+                return
+            self.forwarded.add((kind, url))
+            self.outbox[self.ring.owner(url)].append([kind, url, depth])
+
+    def add_page_links(self, urls: list[str], depth: int = 0):
+        own = []
+        for raw_url in urls:
+            url = self.canonical_page_url(raw_url)
+            if url is None:
+                continue
+            if self.owns(url):
+                own.append(raw_url)
+            else:
+                self.forward(url, "page", depth)
+        super().add_page_links(own, depth)
+
+    def add_asset_links(self, urls: list[str], persist=True):
+        own = []
+        for raw_url in urls:
+            parts = self.canonicalize.split(raw_url)
+            if url_extension(parts.path) not in ASSET_EXTENSIONS:
+                continue
+            asset_url = urlunsplit(parts)
+            if self.owns(asset_url):
+                own.append(raw_url)
+            else:
+                self.forward(asset_url, "asset")
+        super().add_asset_links(own, persist)
+
+    def queue_pages(self, urls: list[str]) -> list[str]:
+        own = []
+        for url in urls:
+            if self.owns(url):
+                own.append(url)
+            else:
+                self.forward(url, "page")
+        return super().queue_pages(own)
+
+    def load_robots(self) -> list[str]:
+        sitemap_urls = super().load_robots()
+        if self.robots is not None:
+            delay = self.robots.crawl_delay(IMPORTER_HEADERS.get("User-Agent", "*"))
+            if delay:
+                # every worker fetches from the same host
+                self.limiter.set_crawl_delay(IMPORTER_START_URL, float(delay) * len(self.addresses))
+        return sitemap_urls
+
+    def seed(self):
+        start_url = self.canonicalize(IMPORTER_START_URL)
+        if not self.owns(start_url):
+            # only the disallow rules and the crawl delay, the owner of the start url reads the sitemaps
+            if IMPORTER_OBEY_ROBOTS:
+                self.load_robots()
+            return
+        self.queue_pages([start_url])
+        super().seed()
+
+    def receive(self, urls: list):
+        pages = collections.defaultdict(list)
+        assets = []
+        for kind, url, depth in urls:
+            if kind == "page":
+                pages[depth].append(url)
+            else:
+                assets.append(url)
+        for depth, batch in pages.items():
+            super().add_page_links(batch, depth)
+        super().add_asset_links(assets)
+        with self.outbox_lock:
+            self.received += len(urls)
+
+    def peer(self, name: str) -> MessageChannel:
+        with self.peers_lock:
+            if name not in self.peers:
+                self.peers[name] = MessageChannel.connect(self.addresses[name])
+            return self.peers[name]
+
+    def drop_peer(self, name: str):
+        with self.peers_lock:
+            channel = self.peers.pop(name, None)
+        if channel is not None:
+            channel.close()
+
+    def flush(self):
+        """Send the links for other shards to their owners and the changed entries to the coordinator."""
+        # one flush at a time, so the coordinator gets the changes of an entry in order
+        with self.flush_lock:
+            with self.outbox_lock:
+                outbox, self.outbox = self.outbox, collections.defaultdict(list)
+            for owner, urls in outbox.items():
+                try:
+                    self.peer(owner).send({"type": "urls", "urls": urls})
+                except OSError as e:
+                    # sent again with the next flush, over a new connection
+                    print(f'Worker {self.name}: sending {len(urls)} links to {owner} failed: {e}')
+                    self.drop_peer(owner)
+                    with self.outbox_lock:
+                        self.outbox[owner][:0] = urls
+                    continue
+                with self.outbox_lock:
+                    # counted as sent until the owner counts them as received
+                    self.sent += len(urls)
+            for name, site_map in (("site", self.site_map), ("assets", self.assets_map)):
+                with site_map.lock:
+                    changed, site_map.changed = site_map.changed, set()
+                    rows = [site_map.entry_to_row(url, site_map[url]) for url in changed]
+                if rows:
+                    self.coordinator.send({"type": "entries", "map": name, "rows": rows})
+
+    def status(self) -> dict:
+        # not during a flush, its links are neither in the outbox nor counted as sent
+        with self.flush_lock, self.outbox_lock:
+            sent, received = self.sent, self.received
+            forwarding = any(self.outbox.values())
+        busy = any(site_map.count(status) for site_map in (self.site_map, self.assets_map)
+                   for status in (Status.NEW, Status.DISCOVERY, Status.RETRY, Status.IN_PROGRESS))
+        return {"type": "status", "idle": not busy and not forwarding, "sent": sent, "received": received}
+
+    def accept(self, listener: socket.socket):
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.read_peer, args=(MessageChannel(sock),), daemon=True).start()
+
+    def read_peer(self, channel: MessageChannel):
+        for message in channel:
+            if message["type"] == "urls":
+                self.receive(message["urls"])
+
+    def read_coordinator(self, messages):
+        for message in messages:
+            if message["type"] == "poll":
+                self.flush()
+                self.coordinator.send(self.status())
+            elif message["type"] == "stop":
+                break
+        self.stopped.set()
+
+    def flush_periodically(self):
+        while not self.stopped.wait(IMPORTER_SHARD_FLUSH_INTERVAL):
+            self.flush()
+
+    def run(self, main_selector: str = "main"):
+        self.start_telemetry()
+        self.coordinator = MessageChannel.connect(self.coordinator_address)
+        # by default the address this host reaches the coordinator from, which the other workers can reach too
+        host = IMPORTER_WORKER_HOST or self.coordinator.sock.getsockname()[0]
+        listener = socket.create_server((host if IMPORTER_WORKER_BIND_HOST is None else IMPORTER_WORKER_BIND_HOST, 0))
+        threading.Thread(target=self.accept, args=(listener,), daemon=True).start()
+        self.coordinator.send({"type": "hello", "name": self.name, "address": [host, listener.getsockname()[1]]})
+        messages = iter(self.coordinator)
+        start = next(messages)
+        self.addresses = start["workers"]
+        self.ring = ShardRing(self.addresses)
+        print(f'Worker {self.name}: {len(self.site_map)} URLs in state, {len(self.addresses)} workers.')
+        threading.Thread(target=self.read_coordinator, args=(messages,), daemon=True).start()
+        flusher = threading.Thread(target=self.flush_periodically)
+        flusher.start()
+
+        self.seed()
+        # both pools keep waiting for links from the other shards until the coordinator stops the crawl
+        asset_downloads = threading.Thread(target=self.drain_assets, args=(self.stopped, 1))
+        asset_downloads.start()
+        self.drain(self.page_frontier, functools.partial(self.crawl_page, main_selector=main_selector),
+                   "Crawling", "page", self.stopped)
+        asset_downloads.join()
+        flusher.join()
+
+        self.flush()
+        self.coordinator.send({"type": "done"})
+        listener.close()
+        for channel in self.peers.values():
+            channel.close()
+        self.coordinator.close()
+        self.close()
+
+
+class CrawlCoordinator:
+    """
+    Runs a crawl split over `workers` ShardWorker processes. It waits for all of them, hands out
+    the worker addresses, merges the entries they report into the map files and stops them once
+    the crawl is over. That is when, in two consecutive polls, every worker is idle and the
+    numbers of forwarded and received links are equal and unchanged (the four-counter method),
+    so no link is still on its way to a worker.
+    """
+
+    def __init__(self, workers: int, address: tuple = IMPORTER_COORDINATOR_ADDRESS):
+        self.workers = workers
+        self.server = socket.create_server(tuple(address))
+        os.makedirs(os.path.dirname(INPUT_SITE_MAP_CSV), exist_ok=True)
+        # every entry, the start url too, comes from the worker that owns it
+        self.site_map = open_sitemap(INPUT_SITE_MAP_CSV, INPUT_SITE_MAP_DB, None)
+        self.assets_map = open_sitemap(INPUT_ASSETS_MAP_CSV, INPUT_ASSETS_MAP_DB, None)
+        self.channels: dict[str, MessageChannel] = {}
+        self.statuses = queue.Queue()
+
+    def merge(self, message: dict):
+        site_map = self.site_map if message["map"] == "site" else self.assets_map
+        with site_map.lock:
+            for row in message["rows"]:
+                site_map.put(row["url"], site_map.entry_from_row(row), persist=False)
+
+    def read(self, name: str, messages):
+        for message in messages:
+            if message["type"] == "entries":
+                self.merge(message)
+            elif message["type"] == "status":
+                self.statuses.put((name, message))
+            elif message["type"] == "done":
+                return
+        self.statuses.put((name, None))
+
+    def poll(self) -> dict:
+        for name, channel in self.channels.items():
+            try:
+                channel.send({"type": "poll"})
+            except OSError as e:
+                raise RuntimeError(f'Lost the connection to worker {name}') from e
+        statuses = {}
+        while len(statuses) < len(self.channels):
+            try:
+                name, status = self.statuses.get(timeout=IMPORTER_TIMEOUT * 3)
+            except queue.Empty:
+                raise RuntimeError(f'Workers {", ".join(set(self.channels) - set(statuses))} stopped responding')
+            if status is None:
+                raise RuntimeError(f'Lost the connection to worker {name}')
+            statuses[name] = status
+        return statuses
+
+    def wait_for_termination(self):
+        previous = None
+        checkpoint_at = time.monotonic() + IMPORTER_SHARD_CHECKPOINT_INTERVAL
+        while True:
+            time.sleep(IMPORTER_SHARD_POLL_INTERVAL)
+            statuses = self.poll()
+            counts = (sum(status["sent"] for status in statuses.values()),
+                      sum(status["received"] for status in statuses.values()))
+            idle = all(status["idle"] for status in statuses.values())
+            if idle and counts[0] == counts[1] and counts == previous:
+                return
+            previous = counts if idle else None
+            if time.monotonic() >= checkpoint_at:
+                self.site_map.persist()
+                self.assets_map.persist()
+                checkpoint_at = time.monotonic() + IMPORTER_SHARD_CHECKPOINT_INTERVAL
+                print(f'{self.site_map.count(Status.DOWNLOADED)} pages and {self.assets_map.count(Status.DOWNLOADED)} '
+                      f'assets downloaded, {counts[0] - counts[1]} links in transit.')
+
+    def run(self):
+        print(f'Waiting for {self.workers} workers on {self.server.getsockname()}...')
+        addresses = {}
+        readers = []
+        while len(self.channels) < self.workers:
+            sock, _ = self.server.accept()
+            channel = MessageChannel(sock)
+            messages = iter(channel)
+            hello = next(messages)
+            self.channels[hello["name"]] = channel
+            addresses[hello["name"]] = hello["address"]
+            readers.append(threading.Thread(target=self.read, args=(hello["name"], messages)))
+            print(f'Worker {hello["name"]} joined from {hello["address"]}.')
+        for channel in self.channels.values():
+            channel.send({"type": "start", "workers": addresses})
+        for reader in readers:
+            reader.start()
+
+        failure = None
+        try:
+            self.wait_for_termination()
+        except RuntimeError as e:
+            failure = e
+        for channel in self.channels.values():
+            try:
+                channel.send({"type": "stop"})
+            except OSError:
+                pass  # the lost worker
+        # every worker sends its last entries before "done", a worker that stopped responding may never do
+        for reader in readers:
+            reader.join(None if failure is None else IMPORTER_TIMEOUT * 3)
+        for channel in self.channels.values():
+            channel.close()
+        self.server.close()
+        self.close()
+        if failure is not None:
+            print(f'Distributed crawl failed: {failure}. Stopped the other workers, the state they reported is saved.')
+            raise failure
+        print('Distributed crawl finished.')
+        self.site_map.print_summary()
+        self.assets_map.print_summary()
+
+    def close(self):
+        self.site_map.close()
+        self.assets_map.close()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Importer CLI")
     parser.add_argument(
         "command",
         nargs="?",
-        choices=["crawl-pages", "extract-assets", "download-assets"],
+        choices=["seed", "crawl-pages", "recrawl", "extract-assets", "download-assets", "import-state", "export-state",
+                 "export-pack", "compact-pack", "coordinate", "work"],
         help="Command to run"
     )
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "asyncio"],
+        default="threads",
+        help="Fetch pages and assets with a thread pool or with asyncio"
+    )
+    parser.add_argument("--workers", type=int, default=2, help="coordinate: number of workers to wait for")
+    parser.add_argument("--name", help="work: name of this worker, it keeps its shard across restarts")
+    parser.add_argument(
+        "--coordinator",
+        default=":".join(map(str, IMPORTER_COORDINATOR_ADDRESS)),
+        help="coordinate: address to listen on, work: address of the coordinator (host:port)"
+    )
     args = parser.parse_args()
 
-    importer = Importer()
+    if args.command == "import-state":
+        import_state()
+        sys.exit()
+    elif args.command == "export-state":
+        export_state()
+        sys.exit()
+    elif args.command == "export-pack":
+        export_pack()
+        sys.exit()
+    elif args.command == "compact-pack":
+        compact_pack()
+        sys.exit()
+    elif args.command in ("coordinate", "work"):
+        host, port = args.coordinator.rsplit(":", 1)
+        if args.command == "coordinate":
+            CrawlCoordinator(args.workers, (host, int(port))).run()
+        else:
+            ShardWorker(args.name or socket.gethostname(), (host, int(port))).run()
+        sys.exit()
+
+    importer = Importer(engine=args.engine)
 
-    if args.command == "crawl-pages":
+    if args.command == "seed":
+        importer.seed(from_sitemaps=True)
+    elif args.command == "crawl-pages":
         importer.crawl_pages()
+    elif args.command == "recrawl":
+        importer.recrawl()
     elif args.command == "extract-assets":
         importer.extract_assets()
     elif args.command == "download-assets":
         importer.download_assets()
     else:
         importer.crawl_pages()
-        importer.extract_assets()
+        if not IMPORTER_DOWNLOAD_ASSETS_WHILE_CRAWLING:
+            importer.extract_assets()
         importer.download_assets()
+    importer.close()
@@ -9,7 +9,6 @@ from markdownify import markdownify as md
 from tqdm import tqdm
 import os
 import re
-import sys
 from pathlib import Path
 import csv
 from datetime import datetime
@@ -17,11 +16,11 @@ import yaml  # <-- add this import
 
 from tqdm import tqdm
 
-from config import INPUT_DIR, INPUT_ASSETS_PATH, INPUT_SITE_MAP_CSV, INPUT_ASSETS_MAP_CSV, \
+from config import INPUT_SITE_MAP_CSV, INPUT_ASSETS_MAP_CSV, \
     TRANSFORMED_IGNORED_ELEMENT_SELECTORS, BROKEN_LINKS_MAP, TRANSFORMED_IGNORED_URLS, TRANSFORMED_REMAP_URLS, \
     TRANSFORMED_DIR, TRANSFORMED_ASSETS_DIR, IMPORTER_DOMAIN, IMPORTER_START_URL, TRANSFORMER_TITLE_ADJUSTER, \
-    TRANSFORMED_BROKEN_LINKS_CSV, FIXED_DIR
-from app_01_importer import Sitemap
+    TRANSFORMED_BROKEN_LINKS_CSV, FIXED_DIR, INPUT_SITE_MAP_DB, INPUT_ASSETS_MAP_DB
+from app_01_importer import open_content_store, open_sitemap, read_page, UrlCanonicalizer
 
 
 def backup_file(file_to_backup):
@@ -36,15 +35,21 @@ def backup_file(file_to_backup):
 class Transformer:
 
     def __init__(self):
-        self.site_map = Sitemap(INPUT_SITE_MAP_CSV, None)
-        self.assets_map = Sitemap(INPUT_ASSETS_MAP_CSV, None)
+        self.site_map = open_sitemap(INPUT_SITE_MAP_CSV, INPUT_SITE_MAP_DB, None, read_only=True)
+        self.assets_map = open_sitemap(INPUT_ASSETS_MAP_CSV, INPUT_ASSETS_MAP_DB, None, read_only=True)
         self.report_from = []
         self.report_to = []
+        self.canonicalize = UrlCanonicalizer(IMPORTER_START_URL)
+        self.store = open_content_store()
 
         self.url_to_md = {}
         for url, entry in tqdm(self.site_map.items(), desc="Building url to md map"):
             if entry.status.name == "DOWNLOADED" and entry.path:
                 self.url_to_md[url] = self.url_to_md_path(url, base_dir=TRANSFORMED_DIR)
+        # links to a near-duplicate point to the page it duplicates
+        for url, entry in self.site_map.items():
+            if entry.status.name == "DUPLICATE" and entry.duplicate_of in self.url_to_md:
+                self.url_to_md[url] = self.url_to_md[entry.duplicate_of]
         self.asset_to_local = {}
         for url, entry in tqdm(self.assets_map.items(), desc="Building asset to local map"):
             if entry.status.name == "DOWNLOADED" and entry.path:
@@ -92,6 +97,11 @@ class Transformer:
                 return
             # Fix broken links using BROKEN_LINKS_MAP
             link = self.fix_broken_link(link)
+            # State keys are canonical URLs, so look up variants like "page/#comments" by their canonical form
+            if link not in self.url_to_md and link not in self.asset_to_local:
+                canonical_link = self.canonicalize(link)
+                if canonical_link in self.url_to_md or canonical_link in self.asset_to_local:
+                    link = canonical_link
             # Convert page links
             if link in self.url_to_md:
                 rel_path = self.get_relative_path(current_md_path, self.url_to_md[link])
@@ -103,11 +113,10 @@ class Transformer:
                 dst_abs_path = os.path.join(TRANSFORMED_ASSETS_DIR, asset_subfolder, asset_name)
                 rel_path = self.get_relative_path(current_md_path, dst_abs_path)
 
-                src = os.path.join(INPUT_ASSETS_PATH, asset_name)
                 os.makedirs(os.path.dirname(dst_abs_path), exist_ok=True)  # Ensure deep structure exists
 
-                if os.path.exists(src):
-                    shutil.copy2(src, dst_abs_path)
+                if self.store.exists(asset_name):
+                    self.store.copy_to(asset_name, dst_abs_path)
                     tag[attr] = rel_path
                     asset = assets.get(rel_path, {
                         'tag': tag.name,
@@ -163,6 +172,17 @@ class Transformer:
     def get_to_process_entries(self):
         out = []
         for url, entry in tqdm(self.site_map.items(), desc="Collecting pages"):
+            if entry.status.name == "VISITED":
+                # fetched by the importer for its links only, see IMPORTER_PRUNE_MODE
+                self.report_from.append((url,None,'ignored'))
+                continue
+            if entry.status.name == "DUPLICATE":
+                self.report_from.append((url,self.url_to_md.get(url),'duplicate'))
+                continue
+            if entry.status.name == "ASSET":
+                # served a file rather than a page, linked through the assets map
+                self.report_from.append((url,self.asset_to_local.get(url),'asset'))
+                continue
             if entry.status.name != "DOWNLOADED" or not entry.path:
                 self.report_from.append((url,None,'broken'))
                 continue
@@ -199,9 +219,7 @@ class Transformer:
     def transform(self):
         self.create_workspace()
         for url, entry, md_path in tqdm(self.get_to_process_entries(), desc="Processing pages"):
-            html_path = os.path.join(INPUT_ASSETS_PATH, entry.path)
-            with open(html_path, "r", encoding="utf-8") as f:
-                soup = BeautifulSoup(f.read(), "html.parser")
+            soup = BeautifulSoup(read_page(self.store, entry.path), "html.parser")
             # Extract <main>
             self.remove_ignored_elements(soup)
             main_elem = soup.find("main")
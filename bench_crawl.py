@@ -0,0 +1,342 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app_01_importer
+from app_01_importer import CrawlCoordinator, Importer, ShardWorker, Status
+
+# forked: the server, the workers and the measured crawls see the settings patched in run()
+FORK = multiprocessing.get_context("fork")
+
+
+class SyntheticSite:
+    """
+    Deterministic WordPress-like site: dated posts with images and attachments, a paginated
+    home page, monthly date archives and categories with pagination, and a sitemap.xml.
+    The same arguments always produce the same URLs and bodies.
+    """
+
+    def __init__(self, posts: int, page_size: int, asset_size: int, per_page: int = 10, categories: int = 8,
+                 seed: int = 1):
+        self.posts = posts
+        self.page_size = page_size
+        self.asset_size = asset_size
+        self.per_page = per_page
+        self.categories = [f"category-{i}" for i in range(categories)]
+        self.random = random.Random(seed)
+        syllables = ["lo", "rem", "ip", "sum", "do", "lor", "sit", "am", "et", "szko", "la", "ucz", "nio", "wie"]
+        self.vocabulary = ["".join(self.random.choices(syllables, k=3)) for _ in range(5000)]
+        first_day = date(2015, 9, 1)
+        self.days = [first_day + timedelta(days=i * 2) for i in range(posts)]
+
+    def post_path(self, i: int) -> str:
+        day = self.days[i]
+        return f"/{day.year}/{day.month:02d}/{day.day:02d}/post-{i}/"
+
+    def category(self, i: int) -> str:
+        return self.categories[i % len(self.categories)]
+
+    def image_path(self, i: int) -> str:
+        day = self.days[i]
+        return f"/wp-content/uploads/{day.year}/{day.month:02d}/post-{i}.jpg"
+
+    def document_path(self, i: int) -> str:
+        return f"/wp-content/uploads/documents/post-{i}.pdf"
+
+    def layout(self, title: str, main: str) -> bytes:
+        nav = "".join(f'<li><a href="/category/{category}/">{category}</a></li>' for category in self.categories)
+        body = (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{title}</title></head><body>"
+                f"<header><a href='/'>Home</a><ul>{nav}</ul></header><main><h1>{title}</h1>{main}</main>"
+                f"<footer><a href='/#top'>Top</a></footer></body></html>")
+        padding = max(self.page_size - len(body), 0)
+        # every page gets its own text, so the near-duplicate check keeps them apart when it is enabled
+        filler = " ".join(random.Random(title).choices(self.vocabulary, k=padding // 6 + 1))[:padding]
+        return body.replace("</main>", f"<p>{filler}</p></main>", 1).encode("utf-8")
+
+    def listing(self, title: str, base: str, indexes: list[int], page: int) -> bytes:
+        pages = max((len(indexes) + self.per_page - 1) // self.per_page, 1)
+        if page > pages:
+            return None
+        shown = indexes[(page - 1) * self.per_page:page * self.per_page]
+        items = "".join(f'<article><a href="{self.post_path(i)}">Post {i}</a>'
+                        f'<img src="{self.image_path(i)}"></article>' for i in shown)
+        pagination = "".join(f'<a href="{base}page/{n}/">{n}</a>' for n in range(1, pages + 1) if n != page)
+        return self.layout(f"{title} - page {page}", items + f"<nav>{pagination}</nav>")
+
+    def post(self, i: int) -> bytes:
+        day = self.days[i]
+        links = [f'<a href="/category/{self.category(i)}/">{self.category(i)}</a>',
+                 f'<a href="/{day.year}/{day.month:02d}/">{day.year}-{day.month:02d}</a>',
+                 f'<img src="{self.image_path(i)}">',
+                 f'<a href="{self.post_path(i)}#comments">Comments</a>']
+        if i:
+            links.append(f'<a href="{self.post_path(i - 1)}">Previous</a>')
+        if i + 1 < self.posts:
+            links.append(f'<a href="{self.post_path(i + 1)}">Next</a>')
+        if i % 5 == 0:
+            links.append(f'<a href="{self.document_path(i)}">Download</a>')
+        return self.layout(f"Post {i}", "".join(links))
+
+    def asset(self, path: str) -> bytes:
+        block = hashlib.sha256(path.encode("utf-8")).digest()
+        return (block * (self.asset_size // len(block) + 1))[:self.asset_size]
+
+    def sitemap(self, base_url: str) -> bytes:
+        urls = "".join(f"<url><loc>{base_url}{self.post_path(i)}</loc></url>" for i in range(self.posts))
+        return (f'<?xml version="1.0" encoding="UTF-8"?>'
+                f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>').encode("utf-8")
+
+    def render(self, path: str, base_url: str) -> tuple[str, bytes]:
+        """Content type and body for a path, None when the site has no such page."""
+        parts = [part for part in path.split("/") if part]
+        page = 1
+        if len(parts) >= 2 and parts[-2] == "page" and parts[-1].isdigit():
+            page = int(parts[-1])
+            parts = parts[:-2]
+        newest_first = list(range(self.posts - 1, -1, -1))
+        if path == "/robots.txt":
+            return "text/plain", f"User-agent: *\nDisallow: /wp-admin/\nSitemap: {base_url}/sitemap.xml\n".encode()
+        if path == "/sitemap.xml":
+            return "application/xml", self.sitemap(base_url)
+        if path.startswith("/wp-content/uploads/"):
+            if path.endswith(".pdf"):
+                return "application/pdf", self.asset(path)
+            return "image/jpeg", self.asset(path)
+        if not parts:
+            body = self.listing("Home", "/", newest_first, page)
+        elif parts[0] == "category" and len(parts) == 2 and parts[1] in self.categories:
+            category = self.categories.index(parts[1])
+            indexes = [i for i in newest_first if i % len(self.categories) == category]
+            body = self.listing(parts[1], f"/category/{parts[1]}/", indexes, page)
+        elif len(parts) == 2 and all(part.isdigit() for part in parts):
+            month = (int(parts[0]), int(parts[1]))
+            indexes = [i for i in newest_first if (self.days[i].year, self.days[i].month) == month]
+            body = self.listing(f"{parts[0]}-{parts[1]}", f"/{parts[0]}/{parts[1]}/", indexes, page) if indexes else None
+        elif len(parts) == 4 and parts[3].startswith("post-") and parts[3][5:].isdigit():
+            i = int(parts[3][5:])
+            body = self.post(i) if i < self.posts and self.post_path(i) == path else None
+        else:
+            body = None
+        return ("text/html; charset=UTF-8", body) if body is not None else None
+
+
+class SyntheticHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    site: SyntheticSite = None
+    latency = 0.0
+    error_rate = 0.0
+    failed = set()  # paths that already answered with an injected error
+    lock = threading.Lock()
+    sent_bytes = None  # multiprocessing.Value shared with the benchmark
+    requests = None
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.path.split("?", 1)[0]
+        with self.lock:
+            # a fixed share of the URLs fails once with a 503, the retry succeeds
+            inject = (self.error_rate and path not in self.failed
+                      and int(hashlib.md5(path.encode()).hexdigest(), 16) % 10000 < self.error_rate * 10000)
+            if inject:
+                self.failed.add(path)
+        page = None if inject else self.site.render(path, f"http://{self.headers['Host']}")
+        if inject:
+            status, content_type, body = 503, "text/plain", b"injected error"
+        elif page is None:
+            status, content_type, body = 404, "text/plain", b"not found"
+        else:
+            status, (content_type, body) = 200, page
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+        with self.sent_bytes.get_lock():
+            self.sent_bytes.value += len(body)
+        with self.requests.get_lock():
+            self.requests.value += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(site: SyntheticSite, latency: float, error_rate: float, sent_bytes, requests, ports):
+    SyntheticHandler.site = site
+    SyntheticHandler.latency = latency
+    SyntheticHandler.error_rate = error_rate
+    SyntheticHandler.sent_bytes = sent_bytes
+    SyntheticHandler.requests = requests
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SyntheticHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 256
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def disk_writes() -> int:
+    with open("/proc/self/io") as f:
+        return int(dict(line.split(": ") for line in f.read().splitlines())["write_bytes"])
+
+
+def stored_bytes(directory: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+def run_worker(name: str, coordinator_address: tuple):
+    ShardWorker(name, coordinator_address).run()
+
+
+def crawl(args) -> tuple:
+    """Crawl with one importer, or with a coordinator and args.workers worker processes."""
+    if not args.workers:
+        importer = Importer(engine=args.engine)
+        started = time.perf_counter()
+        importer.crawl_pages()
+        crawled = time.perf_counter()
+        if not app_01_importer.IMPORTER_DOWNLOAD_ASSETS_WHILE_CRAWLING:
+            importer.extract_assets()
+        importer.download_assets()
+        importer.close()
+        return importer.site_map, importer.assets_map, started, crawled, time.perf_counter()
+
+    coordinator = CrawlCoordinator(args.workers, ("127.0.0.1", 0))
+    workers = [FORK.Process(target=run_worker, args=(f"worker-{i}", coordinator.server.getsockname()))
+               for i in range(args.workers)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    coordinator.run()
+    for worker in workers:
+        worker.join()
+    finished = time.perf_counter()
+    # workers download assets while they crawl
+    return coordinator.site_map, coordinator.assets_map, started, finished, finished
+
+
+def run(args, parser_processes: int) -> dict:
+    site = SyntheticSite(args.posts, args.page_size * 1024, args.asset_size * 1024, seed=args.seed)
+    sent_bytes = FORK.Value("q", 0)
+    requests = FORK.Value("q", 0)
+    ports = FORK.Queue()
+    # the server gets its own process, so it neither competes for the GIL nor counts towards RSS
+    server = FORK.Process(target=serve, daemon=True,
+                                     args=(site, args.latency / 1000, args.error_rate, sent_bytes, requests, ports))
+    server.start()
+    start_url = f"http://127.0.0.1:{ports.get(timeout=10)}"
+
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench-crawl-") as work_dir:
+        os.chdir(work_dir)  # the build/ paths of config.py are relative
+        app_01_importer.IMPORTER_START_URL = start_url
+        app_01_importer.IMPORTER_STATE_BACKEND = args.backend
+        app_01_importer.IMPORTER_SEED_FROM_SITEMAPS = args.sitemap
+        app_01_importer.IMPORTER_PARSER_PROCESSES = parser_processes
+
+        writes_before = disk_writes()
+        site_map, assets_map, started, crawled, finished = crawl(args)
+        writes = disk_writes() - writes_before
+        content = stored_bytes(app_01_importer.INPUT_ASSETS_PATH)
+        os.chdir(previous_dir)
+    # the parser processes and workers have been waited for, the server has not
+    children_peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    server.terminate()
+
+    pages = site_map.count(Status.DOWNLOADED)
+    elapsed = finished - started
+    return {
+        "engine": f"{args.workers} workers" if args.workers else args.engine,
+        "backend": args.backend,
+        "parser_processes": parser_processes,
+        "posts": args.posts,
+        "pages": pages,
+        "assets": assets_map.count(Status.DOWNLOADED),
+        "errors": site_map.count(Status.ERROR) + assets_map.count(Status.ERROR),
+        "requests": requests.value,
+        "crawl_seconds": crawled - started,
+        "total_seconds": elapsed,
+        "pages_per_second": pages / (crawled - started),
+        "requests_per_second": requests.value / elapsed,
+        "bytes_per_second": sent_bytes.value / elapsed,
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        # of the largest parser or worker process
+        "children_peak_rss_bytes": children_peak_rss,
+        "disk_write_bytes": writes,
+        # everything written besides the stored pages and assets: sitemaps, telemetry, temp files
+        "state_write_bytes": max(writes - content, 0),
+    }
+
+
+def run_measured(args, parser_processes: int, results):
+    results.put(run(args, parser_processes))
+
+
+def measure(args, parser_processes: int) -> dict:
+    """run() in a fresh process, so its peak RSS is not one of an earlier configuration."""
+    results = FORK.Queue()
+    process = FORK.Process(target=run_measured, args=(args, parser_processes, results))
+    process.start()
+    process.join()
+    if process.exitcode:
+        sys.exit(f"The crawl with {parser_processes} parser processes failed")
+    return results.get()
+
+
+def report(results: list[dict]):
+    first = results[0]
+    print(f"{first['pages']} pages and {first['assets']} assets ({first['errors']} errors) "
+          f"with {first['engine']} and the {first['backend']} state backend")
+    print(f"{'parsers':>7} {'crawl s':>8} {'total s':>8} {'pages/s':>8} {'req/s':>8} {'MB/s':>6} {'peak RSS MB':>12} "
+          f"{'child RSS MB':>13} {'disk writes MB':>15} {'state writes MB':>16}")
+    for result in results:
+        # 0 parser processes: pages are parsed on the fetching threads
+        print(f"{result['parser_processes'] or '-':>7} {result['crawl_seconds']:>8.2f} "
+              f"{result['total_seconds']:>8.2f} {result['pages_per_second']:>8.1f} "
+              f"{result['requests_per_second']:>8.1f} {result['bytes_per_second'] / 2 ** 20:>6.1f} "
+              f"{result['peak_rss_bytes'] / 2 ** 20:>12.1f} {result['children_peak_rss_bytes'] / 2 ** 20:>13.1f} "
+              f"{result['disk_write_bytes'] / 2 ** 20:>15.1f} "
+              f"{result['state_write_bytes'] / 2 ** 20:>16.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl a local synthetic WordPress-like site and measure the importer")
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--page-size", type=int, default=60, help="Page size in KB")
+    parser.add_argument("--asset-size", type=int, default=200, help="Asset size in KB")
+    parser.add_argument("--latency", type=float, default=0.0, help="Server latency per request in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Share of URLs that fail once with a 503 before they succeed")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="sqlite")
+    parser.add_argument("--no-sitemap", dest="sitemap", action="store_false", help="Do not seed from sitemap.xml")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Run a distributed crawl with this many local worker processes over sockets. "
+                             "Disk writes then only cover the coordinator, child RSS is the largest worker.")
+    parser.add_argument("--parser-processes", type=int, nargs="+", default=[0],
+                        help="Crawl once per value with that many parser processes, e.g. 0 1 2 4 8 "
+                             "(0 parses on the fetching threads)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--fail-below", type=float, help="Exit with status 1 below this many pages/s, for CI")
+    args = parser.parse_args()
+
+    results = [measure(args, parser_processes) for parser_processes in args.parser_processes]
+    report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results if len(results) > 1 else results[0], f, indent=2)
+    if args.fail_below is not None and min(result["pages_per_second"] for result in results) < args.fail_below:
+        print(f"Throughput below {args.fail_below} pages/s")
+        sys.exit(1)
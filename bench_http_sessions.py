@@ -0,0 +1,86 @@
+import argparse
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from app_01_importer import Importer
+from config import IMPORTER_HEADERS, IMPORTER_MAX_WORKERS
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Keep-alive HTTPS origin serving a fixed ~50 KB page for every path."""
+    protocol_version = "HTTP/1.1"
+    body = (b"<html><body><main>" + b"<p>lorem ipsum</p>" * 2800 + b"</main></body></html>")
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_https_server(cert_dir: str):
+    cert_file = os.path.join(cert_dir, "cert.pem")
+    key_file = os.path.join(cert_dir, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+         "-addext", "subjectAltName=IP:127.0.0.1",
+         "-keyout", key_file, "-out", cert_file],
+        check=True, capture_output=True
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, cert_file
+
+
+def run_requests(fetch, urls, workers: int) -> float:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for r in executor.map(fetch, urls):
+            r.raise_for_status()
+    return time.perf_counter() - started
+
+
+def run(count: int, workers: int):
+    with tempfile.TemporaryDirectory() as cert_dir:
+        server, cert_file = start_https_server(cert_dir)
+        base_url = f"https://127.0.0.1:{server.server_address[1]}"
+        urls = [f"{base_url}/page-{i}/" for i in range(count)]
+
+        fresh = run_requests(lambda url: requests.get(url, headers=IMPORTER_HEADERS, timeout=20, verify=cert_file),
+                             urls, workers)
+
+        session = Importer.create_session()
+        pooled = run_requests(lambda url: session.get(url, timeout=20, verify=cert_file), urls, workers)
+        adapter = session.get_adapter(base_url)
+        session.close()
+        server.shutdown()
+
+    print(f"{'mode':<22} {'total s':>8} {'ms/request':>11} {'req/s':>8}")
+    for mode, elapsed in (("requests.get", fresh), ("pooled session", pooled)):
+        print(f"{mode:<22} {elapsed:>8.2f} {elapsed / count * 1000:>11.2f} {count / elapsed:>8.1f}")
+    print(f"speed-up: {fresh / pooled:.1f}x, pooled session opened {adapter.connections} connections "
+          f"for {adapter.requests} requests")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep-alive session benchmark against a local HTTPS server")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=IMPORTER_MAX_WORKERS)
+    args = parser.parse_args()
+    run(args.requests, args.workers)
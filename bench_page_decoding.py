@@ -0,0 +1,73 @@
+import argparse
+import hashlib
+import time
+
+import requests
+
+from app_01_importer import Importer, compress_page, decode_page, encode_page, open_content_store, page_file_name, \
+    read_page
+
+# the same stored bodies as served with and without a charset, and without a Content-Type at all
+CONTENT_TYPES = {
+    "charset": "text/html; charset=UTF-8",
+    "no charset": "text/html",
+    "no header": "",
+}
+
+
+def load_bodies(limit: int) -> list[bytes]:
+    store = open_content_store()
+    names = sorted(name for name in store.names() if ".html" in name)[:limit]
+    return [read_page(store, name).encode("utf-8") for name in names]
+
+
+def legacy_pipeline(content: bytes, content_type: str) -> tuple[str, str, bytes]:
+    """The importer before: decoded like Response.text, then encoded again for the checksum and for the store."""
+    encoding = requests.utils.get_encoding_from_headers({"content-type": content_type} if content_type else {})
+    if encoding is None:
+        encoding = requests.compat.chardet.detect(content)["encoding"]
+    try:
+        html = str(content, encoding, errors="replace")
+    except (LookupError, TypeError):
+        html = str(content, errors="replace")
+    checksum = hashlib.sha256(html.encode("utf-8")).hexdigest()
+    return html, checksum, encode_page(html, page_file_name(checksum))
+
+
+def bytes_pipeline(content: bytes, content_type: str) -> tuple[str, str, bytes]:
+    html, data = decode_page(content, content_type)
+    checksum = Importer.get_checksum(data)
+    return html, checksum, compress_page(data, page_file_name(checksum))
+
+
+def measure(pipeline, bodies: list[bytes], content_type: str, rounds: int):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        results = [pipeline(body, content_type) for body in bodies]
+    return (time.perf_counter() - started) / rounds, results
+
+
+def run(limit: int, rounds: int):
+    bodies = load_bodies(limit)
+    if not bodies:
+        print("No stored pages found, run the importer first.")
+        return
+    size = sum(len(body) for body in bodies)
+    print(f"{len(bodies)} pages, {size / 2 ** 20:.1f} MB of HTML")
+
+    print(f"{'Content-Type':<14} {'legacy pages/s':>15} {'bytes pages/s':>14} {'speed-up':>9} {'text differs':>13}")
+    for case, content_type in CONTENT_TYPES.items():
+        legacy, legacy_results = measure(legacy_pipeline, bodies, content_type, rounds)
+        current, results = measure(bytes_pipeline, bodies, content_type, rounds)
+        # differences are pages the legacy decoding got wrong, e.g. UTF-8 read as ISO-8859-1
+        differs = sum(1 for expected, actual in zip(legacy_results, results) if expected[0] != actual[0])
+        print(f"{case:<14} {len(bodies) / legacy:>15.1f} {len(bodies) / current:>14.1f} "
+              f"{legacy / current:>8.1f}x {differs:>13}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Page decoding, checksum and encoding benchmark over stored pages")
+    parser.add_argument("--limit", type=int, default=2000, help="Maximum number of stored pages to process")
+    parser.add_argument("--rounds", type=int, default=1)
+    args = parser.parse_args()
+    run(args.limit, args.rounds)
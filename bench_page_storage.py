@@ -0,0 +1,108 @@
+import argparse
+import os
+import tempfile
+import time
+
+from bs4 import BeautifulSoup
+from markdownify import markdownify as md
+
+from app_01_importer import PAGE_SUFFIXES, FileStore, PackStore, encode_page, open_content_store, read_page
+from config import BUILD_DIR
+
+STORES = {"files": FileStore, "pack": PackStore}
+
+
+def load_pages(limit: int) -> list[str]:
+    store = open_content_store()
+    names = sorted(name for name in store.names() if ".html" in name)[:limit]
+    return [read_page(store, name) for name in names]
+
+
+def store_pages(pages: list[str], store: FileStore, codec: str) -> list[str]:
+    names = []
+    for i, page in enumerate(pages):
+        name = f"{i}.html{PAGE_SUFFIXES[codec]}"
+        store.write(name, encode_page(page, name))
+        names.append(name)
+    return names
+
+
+def disk_usage(directory: str) -> tuple[int, int]:
+    """Sum of file sizes and of the blocks they occupy, which is what small files really cost."""
+    size = blocks = 0
+    for entry in os.scandir(directory):
+        stat = entry.stat()
+        size += stat.st_size
+        blocks += stat.st_blocks * 512
+    return size, blocks
+
+
+def evict(directory: str):
+    # ask the kernel to drop the files from the page cache, so reads hit the disk
+    for entry in os.scandir(directory):
+        fd = os.open(entry.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def transform(store: FileStore, names: list[str]) -> tuple[float, float]:
+    """Seconds spent reading the pages and seconds spent on the transformer's parse + markdown step."""
+    reading = converting = 0.0
+    for name in names:
+        started = time.perf_counter()
+        html = read_page(store, name)
+        read_done = time.perf_counter()
+        main = BeautifulSoup(html, "html.parser").find("main")
+        if main:
+            md(str(main))
+        reading += read_done - started
+        converting += time.perf_counter() - read_done
+    return reading, converting
+
+
+def run(stores: list[str], codecs: list[str], limit: int, cold: bool):
+    pages = load_pages(limit)
+    if not pages:
+        print("No stored pages found, run the importer first.")
+        return
+    print(f"{len(pages)} pages, {sum(len(page) for page in pages) / 2 ** 20:.1f} MB of HTML"
+          f"{', cold page cache' if cold else ''}")
+    print(f"{'store':<6} {'codec':<6} {'files':>6} {'size MB':>8} {'on disk MB':>11} {'ratio':>6} "
+          f"{'write s':>8} {'read s':>7} {'transform s':>12}")
+    baseline = None
+    for store_name in stores:
+        for name in codecs:
+            codec = None if name == "none" else name
+            with tempfile.TemporaryDirectory(dir=BUILD_DIR) as directory:
+                store = STORES[store_name](directory)
+                started = time.perf_counter()
+                try:
+                    names = store_pages(pages, store, codec)
+                except ImportError as e:
+                    print(f"{store_name:<6} {name:<6} skipped: {e}")
+                    continue
+                written = time.perf_counter() - started
+                store.close()
+                files = len(os.listdir(directory))
+                size, blocks = disk_usage(directory)
+                if cold:
+                    evict(directory)
+                store = STORES[store_name](directory)
+                reading, converting = transform(store, names)
+                store.close()
+            baseline = baseline or blocks
+            print(f"{store_name:<6} {name:<6} {files:>6} {size / 2 ** 20:>8.1f} {blocks / 2 ** 20:>11.1f} "
+                  f"{baseline / blocks:>5.1f}x {written:>8.2f} {reading:>7.2f} {reading + converting:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Disk footprint and transform time of page stores and codecs")
+    parser.add_argument("--stores", nargs="+", default=["files", "pack"], choices=list(STORES))
+    parser.add_argument("--codecs", nargs="+", default=["none", "gzip", "zstd"], choices=["none", "gzip", "zstd"])
+    parser.add_argument("--limit", type=int, default=5000, help="Maximum number of stored pages to use")
+    parser.add_argument("--cold", action="store_true", help="Drop the pages from the page cache before reading")
+    args = parser.parse_args()
+    run(args.stores, args.codecs, args.limit, args.cold)
@@ -0,0 +1,52 @@
+import argparse
+import time
+
+from app_01_importer import PARSER_BACKENDS, open_content_store, read_page
+
+
+def load_pages(limit: int) -> list[str]:
+    store = open_content_store()
+    names = sorted(name for name in store.names() if ".html" in name)[:limit]
+    return [read_page(store, name) for name in names]
+
+
+def run(backends: list[str], limit: int, rounds: int):
+    pages = load_pages(limit)
+    if not pages:
+        print("No stored pages found, run the importer first.")
+        return
+    size = sum(len(page) for page in pages)
+    print(f"{len(pages)} pages, {size / 2 ** 20:.1f} MB of HTML")
+
+    # BeautifulSoup is the reference the streaming extractors must agree with
+    reference = [PARSER_BACKENDS["bs4"](page) for page in pages]
+
+    print(f"{'backend':<12} {'pages/s':>9} {'MB/s':>7} {'speed-up':>9} {'mismatching pages':>18}")
+    baseline = None
+    for backend in backends:
+        extract = PARSER_BACKENDS[backend]
+        try:
+            extract("<a href='x'></a>")
+        except ImportError as e:
+            print(f"{backend:<12} skipped: {e}")
+            continue
+        started = time.perf_counter()
+        for _ in range(rounds):
+            results = [extract(page) for page in pages]
+        elapsed = (time.perf_counter() - started) / rounds
+        mismatches = sum(
+            1 for expected, actual in zip(reference, results)
+            if set(expected.links) != set(actual.links) or set(expected.media) != set(actual.media)
+        )
+        baseline = baseline or elapsed
+        print(f"{backend:<12} {len(pages) / elapsed:>9.1f} {size / 2 ** 20 / elapsed:>7.1f} "
+              f"{baseline / elapsed:>8.1f}x {mismatches:>18}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Link extraction benchmark over stored pages")
+    parser.add_argument("--backends", nargs="+", default=["bs4", "html.parser", "lxml"], choices=list(PARSER_BACKENDS))
+    parser.add_argument("--limit", type=int, default=5000, help="Maximum number of stored pages to parse")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    run(args.backends, args.limit, args.rounds)
@@ -8,20 +8,135 @@ INPUT_ASSETS_DIR = "assets"
 INPUT_ASSETS_PATH = os.path.join(BUILD_DIR, INPUT_DIR, INPUT_ASSETS_DIR)
 INPUT_SITE_MAP_CSV = os.path.join(BUILD_DIR, INPUT_DIR, "map.site.csv")
 INPUT_ASSETS_MAP_CSV = os.path.join(BUILD_DIR, INPUT_DIR, "map.assets.csv")
+INPUT_SITE_MAP_DB = os.path.join(BUILD_DIR, INPUT_DIR, "map.site.sqlite")
+INPUT_ASSETS_MAP_DB = os.path.join(BUILD_DIR, INPUT_DIR, "map.assets.sqlite")
+INPUT_PACK_PATH = os.path.join(BUILD_DIR, INPUT_DIR, "pack")
+INPUT_PARTIAL_PATH = os.path.join(BUILD_DIR, INPUT_DIR, "partial")  # interrupted asset downloads, resumed later
+INPUT_TELEMETRY_JSON = os.path.join(BUILD_DIR, INPUT_DIR, "telemetry.json")
+INPUT_TELEMETRY_PROM = os.path.join(BUILD_DIR, INPUT_DIR, "telemetry.prom")
+INPUT_SEED_JSON = os.path.join(BUILD_DIR, INPUT_DIR, "seed.json")  # when the sitemaps were last read
+INPUT_SHARDS_PATH = os.path.join(BUILD_DIR, INPUT_DIR, "shards")  # state of each worker of a distributed crawl
+
+# "csv" rewrites the whole map file, "sqlite" keeps the state in a WAL-mode database
+IMPORTER_STATE_BACKEND = "csv"
+IMPORTER_STATE_BATCH_SIZE = 500  # sqlite only: number of changes committed in one transaction
+# seconds between writes of the changes, a killed run loses at most this much work
+IMPORTER_STATE_FLUSH_INTERVAL = 5.0
 
 IMPORTER_ASSETS_EXTENSIONS = (
     ".jpg", ".jpeg", ".png", ".gif", ".svg", ".bmp", ".webp", ".ico",
     ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".zip", ".tar", ".gz", ".ppt", ".pptx",
     ".mp4", ".mp3", ".avi", ".mov", ".wmv", ".flv", ".mkv", ".jpe", ".odt"
 )
+IMPORTER_MAX_WORKERS = 32  # fetch threads used by crawl-pages and download-assets
+# per-host AIMD concurrency: grows by one per healthy window, halves on 429/5xx, errors or rising latency
+IMPORTER_INITIAL_CONCURRENCY = 8
+IMPORTER_MIN_CONCURRENCY = 1
+IMPORTER_CONCURRENCY_WINDOW = 50  # requests used for the p95 latency and error rate
+IMPORTER_CONCURRENCY_BACKOFF = 0.5
+IMPORTER_CONCURRENCY_MAX_ERROR_RATE = 0.05
+IMPORTER_CONCURRENCY_LATENCY_TOLERANCE = 2.0  # back off when p95 exceeds the best p95 seen times this factor
+IMPORTER_SUBMISSION_WINDOW = IMPORTER_MAX_WORKERS * 2  # max requests submitted to the pool at once
+IMPORTER_FRONTIER_SIZE = 10000  # queued URLs kept in memory, the rest waits in the state as NEW
+IMPORTER_IDLE_POLL = 0.1  # seconds an idle asset pool waits for pages to reference new assets
+# transient failures (DNS, timeouts, connection errors, 429, 5xx) are retried with jittered exponential backoff
+IMPORTER_MAX_ATTEMPTS = 5
+IMPORTER_RETRY_BASE_DELAY = 2.0  # seconds, doubled on every attempt
+IMPORTER_RETRY_MAX_DELAY = 600.0
+# URLs handed to a worker are IN_PROGRESS for this many seconds. When a killed run leaves them behind, the
+# next run fetches them again once the lease has expired, and counts that as a failed attempt. The lease
+# is renewed while a body downloads, so large files can take longer.
+IMPORTER_LEASE_DURATION = 60.0
+IMPORTER_ASYNC_CONCURRENCY = 200  # requests in flight with --engine asyncio, per-host limits still apply
+# upper bound of a single host's AIMD limit per engine, a host can use all requests the engine has in flight
+IMPORTER_MAX_CONCURRENCY = {"threads": IMPORTER_MAX_WORKERS, "asyncio": IMPORTER_ASYNC_CONCURRENCY}
+IMPORTER_POOL_CONNECTIONS = 4  # distinct hosts kept in the keep-alive connection pool
+IMPORTER_TIMEOUT = 20
+IMPORTER_DOWNLOAD_ASSETS_WHILE_CRAWLING = True  # start asset downloads as soon as pages reference them
+IMPORTER_CHUNK_SIZE = 256 * 1024  # asset bodies are streamed to disk in chunks of this size
+# largest asset downloaded per extension, in bytes. Checked against Content-Length before the body is read and
+# again while it is streamed, larger assets are recorded as ERROR ("too-large"). Other extensions have no limit.
+IMPORTER_ASSET_MAX_SIZE = {
+    ".mp4": 2 * 1024 ** 3, ".avi": 2 * 1024 ** 3, ".mov": 2 * 1024 ** 3, ".mkv": 2 * 1024 ** 3,
+    ".wmv": 2 * 1024 ** 3, ".flv": 2 * 1024 ** 3, ".zip": 1024 ** 3, ".tar": 1024 ** 3, ".gz": 1024 ** 3,
+}
+# assets with these extensions are downloaded by their own IMPORTER_LARGE_ASSET_WORKERS, so a few huge files
+# never hold all the workers the images are waiting for
+IMPORTER_LARGE_ASSET_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".wmv", ".flv", ".zip", ".tar", ".gz")
+IMPORTER_LARGE_ASSET_WORKERS = 2
+# link extraction: "html.parser" (streaming, stdlib), "lxml" (streaming, needs lxml, keeps the first of
+# duplicated attributes where BeautifulSoup keeps the last) or "bs4" (full BeautifulSoup tree)
+IMPORTER_PARSER_BACKEND = "html.parser"
+# near-duplicate pages, off with None: a 64-bit SimHash of the main content text is stored with every page.
+# A page within IMPORTER_SIMHASH_DISTANCE bits of an already stored one is marked DUPLICATE and not stored,
+# its links are not followed unless IMPORTER_FOLLOW_DUPLICATE_LINKS. Pages with fewer than
+# IMPORTER_SIMHASH_MIN_WORDS words are never duplicates.
+# 3 is a good start for sites serving the same article under several URLs.
+IMPORTER_SIMHASH_DISTANCE = None
+IMPORTER_SIMHASH_MIN_WORDS = 50
+# links and assets of duplicates are usually the original's again, or the print and reply variants of it
+IMPORTER_FOLLOW_DUPLICATE_LINKS = False
+# processes that decode, parse, fingerprint and compress fetched pages, so large pages do not hold the GIL
+# the fetching threads need. The state is still only updated by the importer process. 0 parses on the
+# fetching threads.
+IMPORTER_PARSER_PROCESSES = 0
+# distributed crawl: `coordinate --workers N` waits for N `work --name <name>` processes, possibly on other hosts,
+# splits the URLs between them on a consistent hash ring and merges their state into the map files. Workers
+# must share INPUT_ASSETS_PATH (files store).
+IMPORTER_COORDINATOR_ADDRESS = ("127.0.0.1", 8765)
+# the other workers send a worker links on IMPORTER_WORKER_HOST, None is the address the worker reaches the
+# coordinator from. It listens on IMPORTER_WORKER_BIND_HOST, None is IMPORTER_WORKER_HOST; e.g. "0.0.0.0" behind
+# NAT, where the advertised address is not one of the host's own.
+IMPORTER_WORKER_HOST = None
+IMPORTER_WORKER_BIND_HOST = None
+IMPORTER_SHARD_REPLICAS = 64  # points of every worker on the hash ring
+IMPORTER_SHARD_FLUSH_INTERVAL = 0.2  # seconds between batches of forwarded links and state changes
+IMPORTER_SHARD_POLL_INTERVAL = 1.0  # seconds between termination checks of the coordinator
+IMPORTER_SHARD_CHECKPOINT_INTERVAL = 30.0  # seconds between writes of the merged state
+# request phase timings, sizes and statuses, written to INPUT_TELEMETRY_JSON and, for a node_exporter
+# textfile collector, INPUT_TELEMETRY_PROM every IMPORTER_TELEMETRY_INTERVAL seconds while the importer fetches
+IMPORTER_TELEMETRY = True
+IMPORTER_TELEMETRY_INTERVAL = 15
+IMPORTER_TELEMETRY_TIMELINE = 5760  # throughput timeline points kept, a day at the default interval
+# stored pages: None (<sha>.html), "gzip" (<sha>.html.gz) or "zstd" (<sha>.html.zst, needs zstandard).
+# The codec is part of each entry's path, so pages stored with another setting stay readable.
+IMPORTER_PAGE_COMPRESSION = None
+# where pages and assets are stored: "files" (one file each in INPUT_ASSETS_PATH) or "pack" (append-only
+# segment files in INPUT_PACK_PATH, files already in INPUT_ASSETS_PATH stay readable)
+IMPORTER_CONTENT_STORE = "files"
+IMPORTER_PACK_SEGMENT_SIZE = 1024 ** 3
 IMPORTER_HEADERS = {
     "User-Agent": "Crawler/1.0"
 }
+# before crawling, add every page listed by the sitemaps named in robots.txt (or /sitemap.xml) as NEW.
+# The seed command reads them regardless.
+IMPORTER_SEED_FROM_SITEMAPS = False
+IMPORTER_SITEMAP_MAX_DEPTH = 3  # nesting of sitemap indexes that is followed
+IMPORTER_SEED_MAX_AGE = 24 * 3600  # seconds before a crawl reads the sitemaps again, None reads them only once
+IMPORTER_SITEMAP_MAX_SIZE = 50 * 1024 ** 2  # bytes of a single sitemap once decompressed, as in the sitemaps.org limit
+IMPORTER_SITEMAP_MAX_URLS = 1000000  # sitemap entries read in total
+# skip URLs disallowed by robots.txt for IMPORTER_HEADERS["User-Agent"] and honour its Crawl-delay
+IMPORTER_OBEY_ROBOTS = False
+# evaluate TRANSFORMED_IGNORED_URLS while crawling: None fetches and stores these pages like any other,
+# "discover" fetches them after all other pages only to find links, without storing their HTML,
+# "skip" does not fetch them at all
+IMPORTER_PRUNE_MODE = None
+IMPORTER_DISCOVERY_DEPTH = 3  # chained "discover" pages followed from a stored page (category -> page/2 -> ...)
+# applied to every discovered link before it is deduplicated against the state
+IMPORTER_CANONICAL_RULES = {
+    "drop_fragment": True,  # /page/#comments -> /page/
+    "sort_query": True,  # ?b=2&a=1 -> ?a=1&b=2
+    "drop_query_params": [],  # e.g. ["utm_source", "utm_medium", "replytocom"]
+    "lowercase_host": True,
+    "drop_default_port": True,  # :80 for http, :443 for https
+    "unify_internal_scheme": True,  # internal http/https links take the scheme of IMPORTER_START_URL
+    "trailing_slash": "keep",  # "keep", "add" (only for paths without an extension) or "strip"
+}
+# matched against canonical URLs, so fragments are already gone
 IMPORTER_IGNORE_PATTERNS = [
     r"logout",
     r"/private/",
     r"\?s=$",  # Ignore URLs ending with ?s=
-    r"#top",  # Ignore URLs ending with #top
     # Add more patterns as needed
 ]
 
@@ -0,0 +1,84 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def build_dir(tmp_path, monkeypatch):
+    """The paths in config.py are relative to the working directory, every test gets its own."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def importer(build_dir):
+    from app_01_importer import Importer
+
+    instance = Importer()
+    yield instance
+    instance.close()
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.routes: path -> (status, headers, body), or a callable taking the handler that returns
+    such a tuple, or None when it wrote the response itself. Other paths are 404.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers))
+        if self.path not in self.server.routes:
+            response = (404, {}, b"")
+        else:
+            response = self.server.routes[self.path]
+            if callable(response):
+                response = response(self)
+                if response is None:
+                    return
+        status, headers, body = response
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    server.daemon_threads = True
+    server.routes = {}
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def site_importer(site, build_dir, monkeypatch):
+    """Importers crawling the local site, created with the given engine."""
+    import app_01_importer
+
+    monkeypatch.setattr(app_01_importer, "IMPORTER_START_URL", site.url + "/")
+    instances = []
+
+    def create(engine: str = "threads"):
+        instance = app_01_importer.Importer(engine)
+        instances.append(instance)
+        return instance
+
+    yield create
+    for instance in instances:
+        instance.close()
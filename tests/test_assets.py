@@ -0,0 +1,36 @@
+from app_01_importer import Status
+
+
+def count_persists(site_map, monkeypatch) -> list:
+    calls = []
+    persist = site_map.persist
+    monkeypatch.setattr(site_map, "persist", lambda: (calls.append(1), persist()))
+    return calls
+
+
+def test_page_assets_are_persisted_once(importer, monkeypatch):
+    monkeypatch.setattr(importer.assets_map, "flush_interval", 0)
+    calls = count_persists(importer.assets_map, monkeypatch)
+    new = importer.assets_map.count(Status.NEW)
+    importer.add_asset_links([f"{importer.canonicalize.scheme}://{importer.domain}/img/{i}.png" for i in range(5)]
+                             + ["/about/"])
+    assert len(calls) == 1
+    assert importer.assets_map.count(Status.NEW) == new + 5
+    assert len(importer.asset_frontier) == 5
+
+
+def test_known_assets_are_not_persisted_again(importer, monkeypatch):
+    url = f"{importer.canonicalize.scheme}://{importer.domain}/img/logo.png"
+    importer.add_asset_links([url])
+    calls = count_persists(importer.assets_map, monkeypatch)
+    importer.add_asset_links([url, url])
+    assert calls == []
+    assert len(importer.asset_frontier) == 1
+
+
+def test_extracted_assets_are_left_to_the_caller(importer, monkeypatch):
+    calls = count_persists(importer.assets_map, monkeypatch)
+    url = f"{importer.canonicalize.scheme}://{importer.domain}/a.pdf"
+    importer.add_asset_links([url], persist=False)
+    assert calls == []
+    assert importer.assets_map[url].status == Status.NEW
@@ -0,0 +1,77 @@
+import pytest
+
+import app_01_importer
+from app_01_importer import UrlCanonicalizer
+
+START_URL = "https://Example.com"
+RULES = {
+    "drop_fragment": True,
+    "sort_query": True,
+    "drop_query_params": ["utm_source"],
+    "lowercase_host": True,
+    "drop_default_port": True,
+    "unify_internal_scheme": True,
+    "trailing_slash": "keep",
+}
+
+
+@pytest.fixture
+def canonicalize():
+    return UrlCanonicalizer(START_URL, RULES)
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://example.com/page/#comments", "https://example.com/page/"),
+    ("https://example.com/?b=2&a=1", "https://example.com/?a=1&b=2"),
+    ("https://example.com/?utm_source=x&a=1", "https://example.com/?a=1"),
+    ("https://EXAMPLE.com:443/page/", "https://example.com/page/"),
+    ("http://example.com:80/page/", "https://example.com/page/"),
+    ("http://other.org/page/", "http://other.org/page/"),
+])
+def test_variants(canonicalize, url, expected):
+    assert canonicalize(url) == expected
+
+
+@pytest.mark.parametrize("trailing_slash, url, expected", [
+    ("add", "https://example.com/page", "https://example.com/page/"),
+    ("add", "https://example.com/file.pdf", "https://example.com/file.pdf"),
+    ("strip", "https://example.com/page/", "https://example.com/page"),
+    ("strip", "https://example.com/", "https://example.com/"),
+])
+def test_trailing_slash(trailing_slash, url, expected):
+    assert UrlCanonicalizer(START_URL, dict(RULES, trailing_slash=trailing_slash))(url) == expected
+
+
+@pytest.mark.parametrize("url, internal", [
+    ("https://example.com/", True),
+    ("https://EXAMPLE.COM/", True),
+    ("https://example.com:443/", True),
+    ("http://Example.com:80/", True),
+    ("/relative/", True),
+    ("https://example.com:8443/", False),
+    ("https://sub.example.com/", False),
+])
+def test_is_internal_whatever_the_rules(url, internal):
+    keep_everything = dict(RULES, lowercase_host=False, drop_default_port=False)
+    assert UrlCanonicalizer(START_URL + ":443", keep_everything).is_internal(
+        UrlCanonicalizer(START_URL, keep_everything).split(url)) is internal
+
+
+def test_importer_follows_mixed_case_internal_links(importer):
+    url = importer.canonical_page_url(f"{importer.canonicalize.scheme}://{importer.domain.upper()}:443/page/#top")
+    assert url == f"{importer.canonicalize.scheme}://{importer.domain}/page/"
+    assert importer.is_internal(f"HTTPS://{importer.domain.upper()}/")
+    assert importer.canonical_page_url("https://other.org/") is None
+
+
+def test_duplicate_variants_are_counted(importer):
+    url = f"{importer.canonicalize.scheme}://{importer.domain}/page/"
+    importer.site_map.add_new(url)
+    for variant in (url + "#a", url + "#b", url + "#a", url):
+        importer.count_variant(variant, url, importer.site_map)
+    assert importer.duplicate_variants == 3
+
+
+def test_ignore_patterns_see_canonical_urls():
+    assert all("#" not in pattern for pattern in app_01_importer.IMPORTER_IGNORE_PATTERNS)
+    assert app_01_importer.Importer.matches_ignore_patterns("https://example.com/logout/")
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import app_01_importer
+from app_01_importer import ConcurrencyLimiter, HostConcurrency, Importer, RequestSample
+
+
+def sample(status: int = 200, latency: float = 0.0) -> RequestSample:
+    result = RequestSample()
+    result.status = status
+    result.started = time.monotonic() - latency
+    return result
+
+
+def fill(host: HostConcurrency, kind: str, latency: float, count: int = None):
+    for _ in range(count or app_01_importer.IMPORTER_CONCURRENCY_WINDOW):
+        host.acquire()
+        host.release(sample(latency=latency), False, kind)
+
+
+def test_limit_is_capped_per_engine(build_dir):
+    threads, asyncio_importer = Importer(engine="threads"), Importer(engine="asyncio")
+    try:
+        assert threads.limiter.host("https://example.com/").max_limit == app_01_importer.IMPORTER_MAX_WORKERS
+        assert asyncio_importer.limiter.host("https://example.com/").max_limit \
+            == app_01_importer.IMPORTER_ASYNC_CONCURRENCY
+    finally:
+        threads.close()
+        asyncio_importer.close()
+
+
+def test_limit_grows_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_CONCURRENCY_WINDOW", 4)
+    host = HostConcurrency(10)
+    fill(host, "page", 0.1, 200)
+    assert host.limit == 10
+
+
+def test_slow_assets_do_not_back_off_pages(monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_CONCURRENCY_WINDOW", 4)
+    host = HostConcurrency(100)
+    fill(host, "page", 0.1, 40)
+    limit = host.limit
+    fill(host, "asset", 5.0, 40)
+    assert host.limit > limit
+    assert host.p95("page") < 1.0 < host.p95("asset")
+
+
+def test_rising_page_latency_backs_off(monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_CONCURRENCY_WINDOW", 4)
+    host = HostConcurrency(100)
+    fill(host, "page", 0.1, 40)
+    limit = host.limit
+    fill(host, "page", 5.0, 20)
+    assert host.limit < limit
+
+
+def test_overloaded_response_backs_off():
+    host = HostConcurrency(32)
+    host.acquire()
+    host.release(sample(status=503), False)
+    assert host.limit == app_01_importer.IMPORTER_INITIAL_CONCURRENCY * app_01_importer.IMPORTER_CONCURRENCY_BACKOFF
+
+
+def test_async_waiters_are_woken_on_release():
+    limiter = ConcurrencyLimiter(max_concurrency=1)
+    limiter.host("https://example.com/").limit = 1
+    order = []
+
+    async def request(name: str):
+        async with limiter.track("https://example.com/"):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.05)
+            order.append(f"{name} end")
+
+    async def main():
+        started = time.monotonic()
+        await asyncio.gather(request("a"), request("b"))
+        return time.monotonic() - started
+
+    assert asyncio.run(main()) < 1.0
+    assert order == ["a start", "a end", "b start", "b end"]
+    # a second event loop gets its own condition
+    order.clear()
+    asyncio.run(main())
+    assert order == ["a start", "a end", "b start", "b end"]
@@ -0,0 +1,38 @@
+import os
+import stat
+
+from app_01_importer import FILE_MODE, ContentWriter, FileStore, PartialContentWriter, Sitemap
+
+
+def mode(path) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_file_mode_follows_the_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    assert FILE_MODE == 0o666 & ~umask
+
+
+def test_content_writer_files_get_the_default_mode(build_dir):
+    store = FileStore(str(build_dir / "assets"))
+    with ContentWriter(store) as writer:
+        writer.write(b"body")
+        checksum, file_name = writer.commit(".txt")
+    assert store.read(file_name) == b"body"
+    assert mode(store.path(file_name)) == FILE_MODE
+
+
+def test_partial_content_writer_files_get_the_default_mode(build_dir):
+    store = FileStore(str(build_dir / "assets"))
+    writer = PartialContentWriter(store, "https://example.com/a.pdf", directory=str(build_dir / "partial"))
+    checksum, file_name = writer.save(200, {"Content-Length": "4"}, [b"body"], ".pdf")
+    assert mode(store.path(file_name)) == FILE_MODE
+
+
+def test_state_csv_gets_the_default_mode(build_dir):
+    path = str(build_dir / "map.csv")
+    site_map = Sitemap(path, None)
+    site_map.add_new("https://example.com/")
+    site_map.write_csv(path)
+    assert mode(path) == FILE_MODE
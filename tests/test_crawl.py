@@ -0,0 +1,41 @@
+import collections
+
+import pytest
+
+from app_01_importer import Status, read_page
+
+HTML = {"Content-Type": "text/html; charset=utf-8"}
+
+
+def page(*links: str, text: str = "") -> bytes:
+    anchors = "".join(f'<a href="{link}">{link}</a>' for link in links)
+    return f"<html><body><main><p>{text}</p>{anchors}<img src='/logo.png'></main></body></html>".encode("utf-8")
+
+
+def serve_small_site(site):
+    site.routes.update({
+        "/": (200, HTML, page("/a/", "/b/", text="home")),
+        "/a/": (200, HTML, page("/", "/b/#comments", text="a")),
+        "/b/": (200, HTML, page("/a/", "/missing/", text="b")),
+        "/logo.png": (200, {"Content-Type": "image/png"}, b"\\x89PNG" + bytes(100)),
+    })
+
+
+@pytest.mark.parametrize("engine", ["threads", "asyncio"])
+def test_crawl_downloads_every_page_and_asset(site, site_importer, engine):
+    serve_small_site(site)
+    importer = site_importer(engine)
+    importer.crawl_pages()
+
+    pages = {url: entry.status for url, entry in importer.site_map.items()}
+    assert pages == {
+        site.url + "/": Status.DOWNLOADED,
+        site.url + "/a/": Status.DOWNLOADED,
+        site.url + "/b/": Status.DOWNLOADED,
+        site.url + "/missing/": Status.ERROR,
+    }
+    assert "<p>a</p>" in read_page(importer.store, importer.site_map[site.url + "/a/"].path)
+    assert importer.assets_map[site.url + "/logo.png"].status is Status.DOWNLOADED
+    # every page is fetched once, the fragment variant is not fetched again
+    fetched = collections.Counter(path for path, _ in site.requests)
+    assert fetched["/a/"] == fetched["/b/"] == fetched["/missing/"] == fetched["/logo.png"] == 1
@@ -0,0 +1,58 @@
+from app_01_importer import Frontier, Sitemap, SitemapEntry, Status
+
+
+def new_sitemap(tmp_path, count: int) -> Sitemap:
+    site_map = Sitemap(str(tmp_path / "map.csv"), None)
+    for i in range(count):
+        site_map.put(f"https://example.org/{i}/", SitemapEntry(Status.NEW), persist=False)
+    return site_map
+
+
+def drain(frontier: Frontier) -> list[str]:
+    urls = []
+    while (url := frontier.next({})) is not None:
+        urls.append(url)
+    return urls
+
+
+def test_frontier_refills_from_the_state_when_it_overflows(tmp_path):
+    site_map = new_sitemap(tmp_path, 7)
+    frontier = Frontier(site_map, maxsize=3)
+    assert drain(frontier) == [f"https://example.org/{i}/" for i in range(7)]
+    assert site_map.count(Status.IN_PROGRESS) == 7
+
+
+def test_frontier_skips_urls_that_are_no_longer_new(tmp_path):
+    site_map = new_sitemap(tmp_path, 2)
+    frontier = Frontier(site_map)
+    site_map.put("https://example.org/0/", SitemapEntry(Status.DOWNLOADED), persist=False)
+    assert drain(frontier) == ["https://example.org/1/"]
+
+
+def test_frontier_does_not_hand_out_urls_in_flight(tmp_path):
+    site_map = new_sitemap(tmp_path, 1)
+    frontier = Frontier(site_map)
+    frontier.put("https://example.org/0/")
+    assert frontier.next({object(): "https://example.org/0/"}) is None
+
+
+def test_low_priority_frontier_is_served_last(tmp_path):
+    site_map = new_sitemap(tmp_path, 1)
+    site_map.put("https://example.org/category/", SitemapEntry(Status.DISCOVERY), persist=False)
+    discovery = Frontier(site_map)
+    discovery.status = Status.DISCOVERY
+    frontier = Frontier(site_map, low_priority=discovery)
+    assert drain(frontier) == ["https://example.org/0/", "https://example.org/category/"]
+
+
+def test_failed_redirect_target_is_not_left_new(importer, monkeypatch):
+    url = "https://zspzd-technikum.pl/?p=1"
+    importer.site_map.add_new(url)
+
+    def broken_parse(*args, **kwargs):
+        raise ValueError("unparsable")
+
+    monkeypatch.setattr(importer, "parse", broken_parse)
+    importer.process_page(url, "https://zspzd-technikum.pl/post/", b"<html></html>", {"Content-Type": "text/html"})
+    assert importer.site_map[url].status is Status.ERROR
+    assert "https://zspzd-technikum.pl/post/" not in importer.site_map
@@ -0,0 +1,107 @@
+import time
+
+import pytest
+
+import app_01_importer
+from app_01_importer import FileStore, Frontier, PartialContentWriter, RequestSample, Sitemap, SitemapEntry, Status
+
+
+def leased_sitemap(tmp_path, lease_until: float) -> Sitemap:
+    site_map = Sitemap(str(tmp_path / "map.csv"), None)
+    site_map.put("https://example.org/a/", SitemapEntry(Status.IN_PROGRESS, lease_until=lease_until), persist=False)
+    return site_map
+
+
+def test_live_lease_is_not_handed_out_again(tmp_path):
+    site_map = leased_sitemap(tmp_path, time.time() + 60)
+    assert not site_map.lease("https://example.org/a/", (Status.NEW,))
+
+
+def test_expired_lease_counts_as_an_attempt(tmp_path):
+    site_map = leased_sitemap(tmp_path, time.time() - 1)
+    assert site_map.lease("https://example.org/a/", (Status.NEW,))
+    assert site_map["https://example.org/a/"].attempts == 1
+
+
+def test_expired_leases_give_up_after_max_attempts(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_MAX_ATTEMPTS", 1)
+    site_map = leased_sitemap(tmp_path, time.time() - 1)
+    assert not site_map.lease("https://example.org/a/", (Status.NEW,))
+    assert site_map["https://example.org/a/"].status is Status.ERROR
+
+
+def test_interrupted_urls_are_fetched_once_their_lease_expires(tmp_path):
+    site_map = leased_sitemap(tmp_path, time.time() + 0.2)
+    frontier = Frontier(site_map)
+    assert frontier.next({}) is None
+    assert 0 < frontier.next_due_in() <= 0.2
+    time.sleep(0.25)
+    assert frontier.next({}) == "https://example.org/a/"
+
+
+def test_lease_is_renewed_once_half_of_it_has_passed(tmp_path):
+    lease_until = time.time() + app_01_importer.IMPORTER_LEASE_DURATION
+    site_map = leased_sitemap(tmp_path, lease_until)
+    site_map.renew_lease("https://example.org/a/")
+    assert site_map["https://example.org/a/"].lease_until == lease_until
+    site_map["https://example.org/a/"].lease_until = time.time() + 1
+    site_map.renew_lease("https://example.org/a/")
+    assert site_map["https://example.org/a/"].lease_until >= lease_until
+
+
+def test_finished_urls_are_not_leased_again(tmp_path):
+    site_map = Sitemap(str(tmp_path / "map.csv"), None)
+    site_map.put("https://example.org/a/", SitemapEntry(Status.DOWNLOADED), persist=False)
+    site_map.renew_lease("https://example.org/a/")
+    assert site_map["https://example.org/a/"].status is Status.DOWNLOADED
+
+
+def test_long_downloads_keep_their_lease(tmp_path):
+    site_map = leased_sitemap(tmp_path, time.time() + 1)
+    writer = PartialContentWriter(FileStore(str(tmp_path / "assets")), "https://example.org/a/",
+                                  directory=str(tmp_path / "partial"), leases=site_map)
+    writer.save(200, {}, [b"chunk"] * 3, ".bin")
+    assert site_map["https://example.org/a/"].lease_until > time.time() + 30
+
+
+@pytest.mark.parametrize("engine", ["threads", "asyncio"])
+def test_lease_is_renewed_once_the_host_slot_is_acquired(site, site_importer, monkeypatch, engine):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_LEASE_DURATION", 0.3)
+    leased = []
+
+    def leased_in(site_map: Sitemap, body: bytes, content_type: str):
+        def respond(handler):
+            leased.append(site_map[site.url + handler.path].lease_until > time.time())
+            return 200, {"Content-Type": content_type}, body
+        return respond
+
+    importer = site_importer(engine)
+    site.routes["/"] = leased_in(importer.site_map, b"<html><body><main><p>Hello</p></main></body></html>",
+                                 "text/html")
+    site.routes["/image.png"] = leased_in(importer.assets_map, b"png", "image/png")
+    importer.assets_map.put(site.url + "/", SitemapEntry(Status.DOWNLOADED), persist=False)
+    importer.assets_map.add_new(site.url + "/image.png")
+    # a request just went out, every next one has to wait for the Crawl-delay, longer than the lease
+    importer.limiter.set_crawl_delay(site.url + "/", 0.6)
+    host = importer.limiter.host(site.url + "/")
+    host.acquire()
+    sample = RequestSample()
+    sample.started = time.monotonic()
+    host.release(sample, False)
+    importer.crawl_pages()
+    assert leased == [True, True]
+    assert importer.site_map[site.url + "/"].status is Status.DOWNLOADED
+    assert importer.assets_map[site.url + "/image.png"].status is Status.DOWNLOADED
+
+
+def test_changes_are_written_at_most_every_flush_interval(tmp_path):
+    path = tmp_path / "map.csv"
+    site_map = Sitemap(str(path), None, flush_interval=60)
+    site_map.persist()
+    written = path.read_text()
+    for i in range(100):
+        site_map.add_new(f"https://example.org/{i}/")
+    assert path.read_text() == written
+    site_map.flush_interval = 0
+    site_map.add_new("https://example.org/last/")
+    assert len(Sitemap(str(path), None)) == 101
@@ -0,0 +1,54 @@
+import app_01_importer
+from app_01_importer import SimHashIndex, Status
+
+HTML = {"Content-Type": "text/html; charset=utf-8"}
+ARTICLE = " ".join(f"word{i}" for i in range(200))
+
+
+def test_index_finds_fingerprints_within_the_distance():
+    index = SimHashIndex(3)
+    assert index.find_or_add(0b1011 << 40, "https://example.org/a/") is None
+    assert index.find_or_add((0b1011 << 40) ^ 0b111, "https://example.org/b/") == "https://example.org/a/"
+    assert index.find_or_add((0b1011 << 40) ^ 0b1111, "https://example.org/c/") is None
+
+
+def test_off_by_default(site, site_importer):
+    assert app_01_importer.IMPORTER_SIMHASH_DISTANCE is None
+    site.routes["/"] = (200, HTML, f"<html><main>{ARTICLE}</main></html>".encode())
+    importer = site_importer()
+    assert importer.near_duplicates is None
+    importer.crawl_pages()
+    assert importer.site_map[site.url + "/"].simhash is None
+
+
+def crawl_with_print_view(site, site_importer):
+    site.routes.update({
+        "/": (200, HTML, f"<html><main>{ARTICLE}<a href='/print/'>print</a></main></html>".encode()),
+        "/print/": (200, HTML, f"<html><main>{ARTICLE}<a href='/only-here/'>x</a>"
+                               f"<img src='/only-here.png'></main></html>".encode()),
+        "/only-here/": (200, HTML, b"<html><main>unique</main></html>"),
+        "/only-here.png": (200, {"Content-Type": "image/png"}, b"png"),
+    })
+    importer = site_importer()
+    importer.crawl_pages()
+    duplicate = importer.site_map[site.url + "/print/"]
+    assert duplicate.status is Status.DUPLICATE
+    assert duplicate.duplicate_of == site.url + "/"
+    assert duplicate.path is None
+    return importer
+
+
+def test_duplicates_are_not_stored_nor_followed(site, site_importer, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_SIMHASH_DISTANCE", 3)
+    importer = crawl_with_print_view(site, site_importer)
+    assert site.url + "/only-here/" not in importer.site_map
+    assert site.url + "/only-here.png" not in importer.assets_map
+    assert "/only-here/" not in [path for path, _ in site.requests]
+
+
+def test_duplicate_links_can_be_followed(site, site_importer, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_SIMHASH_DISTANCE", 3)
+    monkeypatch.setattr(app_01_importer, "IMPORTER_FOLLOW_DUPLICATE_LINKS", True)
+    importer = crawl_with_print_view(site, site_importer)
+    assert importer.site_map[site.url + "/only-here/"].status is Status.DOWNLOADED
+    assert site.url + "/only-here.png" in importer.assets_map
@@ -0,0 +1,105 @@
+import fcntl
+import os
+
+import pytest
+
+import app_01_importer
+from app_01_importer import ContentWriter, FileStore, PackStore
+
+
+def test_round_trip_and_reopen(build_dir):
+    pack = PackStore(str(build_dir / "pack"))
+    pack.write("a.html", b"first")
+    pack.write("b.png", b"second")
+    assert bytes(pack.read("a.html")) == b"first"
+    pack.close()
+    pack = PackStore(str(build_dir / "pack"))
+    assert sorted(pack.names()) == ["a.html", "b.png"]
+    assert bytes(pack.read("b.png")) == b"second"
+    pack.close()
+
+
+def test_blobs_are_stored_once(build_dir):
+    pack = PackStore(str(build_dir / "pack"))
+    pack.write("a.html", b"first")
+    pack.write("a.html", b"first")
+    assert os.path.getsize(pack.segment_path(0)) == len(b"first")
+    pack.close()
+
+
+def test_segments_roll_over(build_dir):
+    pack = PackStore(str(build_dir / "pack"), segment_size=10)
+    for i in range(3):
+        pack.write(f"{i}.bin", bytes([i]) * 8)
+    # a blob goes to the current segment while that is under the segment size
+    assert [pack.index[f"{i}.bin"][0] for i in range(3)] == [0, 0, 1]
+    assert [bytes(pack.read(f"{i}.bin")) for i in range(3)] == [bytes([i]) * 8 for i in range(3)]
+    pack.close()
+
+
+def test_torn_index_record_is_dropped(build_dir):
+    pack = PackStore(str(build_dir / "pack"))
+    pack.write("a.html", b"first")
+    pack.close()
+    with open(pack.index_path, "ab") as f:
+        f.write(b"\x00\x01")
+    pack = PackStore(str(build_dir / "pack"))
+    assert pack.names() == ["a.html"]
+    pack.write("b.html", b"second")
+    pack.close()
+    assert sorted(PackStore(str(build_dir / "pack")).names()) == ["a.html", "b.html"]
+
+
+def test_fallback_and_content_writer(build_dir):
+    files = FileStore(str(build_dir / "assets"))
+    files.write("old.html", b"old")
+    pack = PackStore(str(build_dir / "pack"), fallback=files)
+    with ContentWriter(pack) as writer:
+        writer.write(b"new")
+        _, name = writer.commit(".txt")
+    assert bytes(pack.read(name)) == b"new"
+    assert pack.exists("old.html") and bytes(pack.read("old.html")) == b"old"
+    assert not any(name.endswith(".tmp") for name in os.listdir(files.directory))
+    pack.close()
+
+
+def test_compact_keeps_referenced_blobs(build_dir):
+    pack = PackStore(str(build_dir / "pack"))
+    pack.write("keep.html", b"keep")
+    pack.write("drop.html", b"dropped")
+    assert pack.compact({"keep.html"}) == (1, len(b"dropped"))
+    pack = PackStore(str(build_dir / "pack"))
+    assert pack.names() == ["keep.html"]
+    assert bytes(pack.read("keep.html")) == b"keep"
+    pack.close()
+
+
+def test_pack_open_elsewhere_is_not_compacted(build_dir):
+    pack = PackStore(str(build_dir / "pack"))
+    pack.write("a.html", b"a")
+    crawl = PackStore(str(build_dir / "pack"))
+    with pytest.raises(RuntimeError):
+        pack.compact(set())
+    crawl.close()
+    assert pack.compact({"a.html"}) == (0, 0)
+
+
+def test_pack_being_compacted_is_not_opened(build_dir):
+    pack = PackStore(str(build_dir / "pack"))
+    # what compact() holds while it rewrites the pack
+    fcntl.flock(pack.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    with pytest.raises(RuntimeError):
+        PackStore(str(build_dir / "pack"))
+    pack.close()
+
+
+def test_compact_pack_without_state_keeps_the_pack(build_dir, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "INPUT_PACK_PATH", str(build_dir / "pack"))
+    pack = PackStore(str(build_dir / "pack"))
+    pack.write("a.html", b"a")
+    pack.close()
+    with pytest.raises(RuntimeError):
+        app_01_importer.compact_pack()
+    pack = PackStore(str(build_dir / "pack"))
+    assert pack.names() == ["a.html"]
+    pack.close()
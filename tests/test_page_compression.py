@@ -0,0 +1,43 @@
+import pytest
+
+import app_01_importer
+from app_01_importer import PAGE_SUFFIXES, FileStore, Importer, encode_page, page_file_name, read_page
+
+HTML = "<html><main>Zażółć gęślą jaźń\n</main></html>"
+
+
+@pytest.mark.parametrize("compression", sorted(PAGE_SUFFIXES, key=str))
+def test_round_trip(build_dir, monkeypatch, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    monkeypatch.setattr(app_01_importer, "IMPORTER_PAGE_COMPRESSION", compression)
+    store = FileStore(str(build_dir / "assets"))
+    name = page_file_name(Importer.get_checksum(HTML.encode("utf-8")))
+    assert name.endswith(".html" + PAGE_SUFFIXES[compression])
+    store.write(name, encode_page(HTML, name))
+    assert read_page(store, name) == HTML
+
+
+def test_pages_stored_with_another_setting_stay_readable(build_dir, monkeypatch):
+    store = FileStore(str(build_dir / "assets"))
+    store.write("plain.html", encode_page(HTML, "plain.html"))
+    monkeypatch.setattr(app_01_importer, "IMPORTER_PAGE_COMPRESSION", "gzip")
+    store.write("packed.html.gz", encode_page(HTML, "packed.html.gz"))
+    assert read_page(store, "plain.html") == read_page(store, "packed.html.gz") == HTML
+
+
+def test_old_pages_keep_the_text_mode_newlines(build_dir):
+    store = FileStore(str(build_dir / "assets"))
+    store.write("crlf.html", b"<p>a\r\nb\rc</p>")
+    assert read_page(store, "crlf.html") == "<p>a\nb\nc</p>"
+
+
+def test_checksum_does_not_depend_on_the_codec(site, site_importer, monkeypatch):
+    site.routes["/"] = (200, {"Content-Type": "text/html; charset=utf-8"}, HTML.encode("utf-8"))
+    monkeypatch.setattr(app_01_importer, "IMPORTER_PAGE_COMPRESSION", "gzip")
+    importer = site_importer()
+    importer.crawl_pages()
+    entry = importer.site_map[site.url + "/"]
+    assert entry.path == entry.hash + ".html.gz"
+    assert entry.hash == Importer.get_checksum(HTML.encode("utf-8"))
+    assert read_page(importer.store, entry.path) == HTML
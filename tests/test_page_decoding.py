@@ -0,0 +1,65 @@
+import codecs
+
+import pytest
+
+from app_01_importer import META_PRESCAN_BYTES, decode_page, declared_encoding
+
+TEXT = "<html><body><p>Crème brûlée, Größe, naïve café</p></body></html>"
+
+
+def test_utf8_body_is_stored_as_received():
+    content = TEXT.encode("utf-8")
+    html, data = decode_page(content, "text/html; charset=UTF-8")
+    assert html == TEXT
+    assert data is content
+
+
+def test_header_charset():
+    html, data = decode_page(TEXT.encode("iso-8859-1"), "text/html; charset=ISO-8859-1")
+    assert html == TEXT
+    assert data == TEXT.encode("utf-8")
+
+
+@pytest.mark.parametrize("meta", ['<meta charset="windows-1252">',
+                                  '<meta http-equiv="Content-Type" content="text/html; charset=windows-1252">'])
+def test_meta_charset_without_header_charset(meta):
+    page = TEXT.replace("<body>", f"<head>{meta}</head><body>")
+    html, data = decode_page(page.encode("cp1252"), "text/html")
+    assert html == page
+    assert data == page.encode("utf-8")
+
+
+def test_header_charset_wins_over_meta():
+    page = TEXT.replace("<body>", '<head><meta charset="utf-8"></head><body>')
+    assert decode_page(page.encode("iso-8859-1"), "text/html; charset=iso-8859-1")[0] == page
+
+
+def test_unknown_header_charset_falls_back_to_meta():
+    page = TEXT.replace("<body>", '<head><meta charset="iso-8859-1"></head><body>')
+    assert declared_encoding(page.encode("iso-8859-1"), "text/html; charset=x-no-such-charset") == "iso8859-1"
+
+
+def test_byte_order_mark_wins_over_header():
+    for content in (codecs.BOM_UTF8 + TEXT.encode("utf-8"), TEXT.encode("utf-16")):
+        html, data = decode_page(content, "text/html; charset=iso-8859-1")
+        assert html == TEXT
+        assert data == TEXT.encode("utf-8")
+
+
+def test_meta_after_the_prescan_is_ignored():
+    page = "<html><!--" + " " * META_PRESCAN_BYTES + '--><meta charset="koi8-r"></html>'
+    assert declared_encoding(page.encode("ascii"), "") is None
+
+
+def test_undeclared_body_that_is_not_utf8_is_detected():
+    page = "<html><body>" + " ".join([TEXT[15:-18]] * 20) + "</body></html>"
+    html, data = decode_page(page.encode("cp1252"), "text/html")
+    # detection picks a single-byte charset instead of replacing every non-ASCII byte, which one is a guess
+    assert "\ufffd" not in html and "Größe" in html
+    assert data == html.encode("utf-8")
+
+
+def test_invalid_bytes_of_a_declared_charset_are_replaced():
+    html, data = decode_page(b"<p>caf\xe9</p>", "text/html; charset=utf-8")
+    assert html == "<p>caf�</p>"
+    assert data == html.encode("utf-8")
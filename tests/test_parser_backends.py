@@ -0,0 +1,57 @@
+import pytest
+
+from app_01_importer import PARSER_BACKENDS, Importer
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Title</title><script>var a = "<a href='/script/'>";</script><style>p {}</style></head>
+<body>
+<nav><a href="/nav/">Nav</a></nav>
+<main>
+  <h1>Heading &amp; more</h1>
+  <p>First <a href="/a/?x=1&amp;y=2">link</a> and <a href="b.html">second</a>.</p>
+  <img src="/img/a.png"><img alt="no source"><video><source src="clip.mp4"></video>
+  <a>no href</a><a href="">empty</a>
+</main>
+<footer><a href="https://example.org/out">Out</a></footer>
+</body></html>
+"""
+
+
+@pytest.fixture(params=sorted(PARSER_BACKENDS))
+def backend(request):
+    return PARSER_BACKENDS[request.param]
+
+
+def test_links_and_media(backend):
+    page_links = backend(PAGE, "main")
+    assert page_links.links == ["/nav/", "/a/?x=1&y=2", "b.html", "https://example.org/out"]
+    assert page_links.media == ["/img/a.png", "clip.mp4"]
+
+
+def test_main_text_skips_scripts_and_styles(backend):
+    assert " ".join(backend(PAGE, "main").text.split()) == "Heading & more First link and second . no href empty"
+
+
+def test_page_text_without_main(backend):
+    text = " ".join(backend("<p>Only <b>text</b></p><script>skipped()</script>", "main").text.split())
+    assert text == "Only text"
+
+
+def test_duplicated_attributes_match_bs4():
+    page = '<a href="/first/" href="/last/">x</a>'
+    assert PARSER_BACKENDS["html.parser"](page).links == PARSER_BACKENDS["bs4"](page).links == ["/last/"]
+
+
+def test_backends_agree():
+    results = {name: backend(PAGE, "main") for name, backend in PARSER_BACKENDS.items()}
+    expected = results.pop("html.parser")
+    for page_links in results.values():
+        assert (page_links.links, page_links.media, page_links.text.split()) \
+            == (expected.links, expected.media, expected.text.split())
+
+
+def test_extract_links_resolves_against_the_base_url(monkeypatch):
+    monkeypatch.setattr("app_01_importer.IMPORTER_PARSER_BACKEND", "lxml")
+    links, assets, _ = Importer.extract_links(PAGE, "https://example.com/dir/page.html")
+    assert links[:3] == ["https://example.com/nav/", "https://example.com/a/?x=1&y=2", "https://example.com/dir/b.html"]
+    assert assets[:2] == ["https://example.com/img/a.png", "https://example.com/dir/clip.mp4"]
@@ -0,0 +1,49 @@
+import pytest
+
+import app_01_importer
+from app_01_importer import compile_patterns, configure_parser_process, parse_page, settings_snapshot
+
+PAGE = ("<html><main>" + " ".join(f"word{i}" for i in range(60)) +
+        "<a href='/a/'>a</a><img src='/b.xyz'><img src='/c.png'></main></html>").encode()
+
+
+@pytest.fixture
+def changed_settings(monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_PARSER_BACKEND", "lxml")
+    monkeypatch.setattr(app_01_importer, "IMPORTER_PAGE_COMPRESSION", "gzip")
+    monkeypatch.setattr(app_01_importer, "IMPORTER_SIMHASH_MIN_WORDS", 10)
+    monkeypatch.setattr(app_01_importer, "ASSET_EXTENSIONS", frozenset({".xyz"}))
+    monkeypatch.setattr(app_01_importer, "IGNORE_PATTERN", compile_patterns([r"/nothing/"]))
+
+
+def test_snapshot_has_the_settings_and_what_is_built_from_them(changed_settings):
+    settings = settings_snapshot()
+    assert settings["IMPORTER_PARSER_BACKEND"] == "lxml"
+    assert settings["ASSET_EXTENSIONS"] == frozenset({".xyz"})
+    assert settings["IGNORE_PATTERN"].pattern == "(?:/nothing/)"
+    assert "IMPORTER_START_URL" in settings and "TRANSFORMED_IGNORED_URLS" in settings
+    assert not any(callable(value) for value in settings.values())
+
+
+def test_configure_applies_the_snapshot(changed_settings, monkeypatch):
+    settings = settings_snapshot()
+    monkeypatch.setattr(app_01_importer, "IMPORTER_PARSER_BACKEND", "bs4")
+    configure_parser_process(settings)
+    assert app_01_importer.IMPORTER_PARSER_BACKEND == "lxml"
+
+
+def test_parser_processes_parse_like_the_importer(changed_settings, monkeypatch, build_dir):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_PARSER_PROCESSES", 1)
+    monkeypatch.setattr(app_01_importer, "IMPORTER_SIMHASH_DISTANCE", 3)
+    importer = app_01_importer.Importer()
+    try:
+        assert importer.parser_pool is not None
+        headers = {"Content-Type": "text/html; charset=utf-8"}
+        remote = importer.parse(PAGE, headers, "https://example.com/", "main", True)
+    finally:
+        importer.close()
+    local = parse_page(PAGE, headers["Content-Type"], "https://example.com/", "main", True, True)
+    assert remote.assets == local.assets == ["https://example.com/b.xyz"]
+    assert remote.file_name == local.file_name and remote.file_name.endswith(".html.gz")
+    assert remote.links == local.links
+    assert remote.simhash is not None and remote.simhash == local.simhash
@@ -0,0 +1,61 @@
+import pytest
+
+import app_01_importer
+from app_01_importer import Status, compile_patterns
+
+HTML = {"Content-Type": "text/html; charset=utf-8"}
+
+
+@pytest.fixture
+def pruned_site(site, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "PRUNE_PATTERN", compile_patterns([r"/category/"]))
+    monkeypatch.setattr(app_01_importer, "IMPORTER_SEED_FROM_SITEMAPS", False)
+    site.routes.update({
+        "/": (200, HTML, b"<html><main><a href='/category/'>c</a><a href='/keep/'>k</a></main></html>"),
+        "/keep/": (200, HTML, b"<html><main>keep</main></html>"),
+        "/category/": (200, HTML, b"<html><main><a href='/category/2/'>next</a><a href='/post/'>p</a></main></html>"),
+        "/category/2/": (200, HTML, b"<html><main><a href='/category/3/'>next</a></main></html>"),
+        "/category/3/": (200, HTML, b"<html><main>last</main></html>"),
+        "/post/": (200, HTML, b"<html><main>post</main></html>"),
+    })
+    return site
+
+
+def paths(site) -> list[str]:
+    return [path for path, _ in site.requests if path != "/robots.txt" and path != "/sitemap.xml"]
+
+
+def test_discover_fetches_pruned_pages_for_their_links(pruned_site, site_importer, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_PRUNE_MODE", "discover")
+    monkeypatch.setattr(app_01_importer, "IMPORTER_DOWNLOAD_ASSETS_WHILE_CRAWLING", False)
+    importer = site_importer()
+    importer.crawl_pages()
+    url = pruned_site.url
+    assert importer.site_map[url + "/category/"].status is Status.VISITED
+    assert importer.site_map[url + "/category/"].path is None
+    assert importer.site_map[url + "/post/"].status is Status.DOWNLOADED
+
+
+def test_discovery_chains_are_limited(pruned_site, site_importer, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_PRUNE_MODE", "discover")
+    monkeypatch.setattr(app_01_importer, "IMPORTER_DISCOVERY_DEPTH", 2)
+    monkeypatch.setattr(app_01_importer, "IMPORTER_DOWNLOAD_ASSETS_WHILE_CRAWLING", False)
+    importer = site_importer()
+    importer.crawl_pages()
+    assert importer.site_map[pruned_site.url + "/category/2/"].status is Status.VISITED
+    assert pruned_site.url + "/category/3/" not in importer.site_map
+
+
+def test_skip_never_fetches_pruned_pages(pruned_site, site_importer, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_PRUNE_MODE", "skip")
+    monkeypatch.setattr(app_01_importer, "IMPORTER_DOWNLOAD_ASSETS_WHILE_CRAWLING", False)
+    importer = site_importer()
+    importer.crawl_pages()
+    assert importer.site_map[pruned_site.url + "/category/"].status is Status.IGNORED
+    assert "/category/" not in paths(pruned_site)
+    assert pruned_site.url + "/post/" not in importer.site_map
+
+
+def test_no_pruning_by_default(pruned_site, site_importer):
+    importer = site_importer()
+    assert not importer.is_pruned(pruned_site.url + "/category/")
@@ -0,0 +1,74 @@
+import pytest
+
+from app_01_importer import PartialContentWriter, Status
+
+BODY = bytes(range(256)) * 40
+ETAG = '"v1"'
+
+
+def keep_partial(importer, url: str, size: int):
+    """What an interrupted download leaves behind: the first size bytes and the validator."""
+    writer = PartialContentWriter(importer.store, url)
+    writer.start(200, {"ETag": ETAG, "Content-Length": str(len(BODY))})
+    writer.write(BODY[:size])
+    writer.file.close()
+
+
+def ranged(status_for_range=None, first_byte=None, headers: dict = None):
+    """
+    Serves BODY with headers, Range requests get a 206 from first_byte (the requested one by default) or
+    status_for_range.
+    """
+    headers = dict(headers or {}, ETag=ETAG)
+
+    def respond(handler):
+        value = handler.headers.get("Range")
+        if value is None or handler.headers.get("If-Range") != ETAG:
+            return 200, headers, BODY
+        if status_for_range is not None:
+            return status_for_range, {}, b""
+        start = int(value[len("bytes="):-1]) if first_byte is None else first_byte
+        return 206, dict(headers, **{"Content-Range": f"bytes {start}-{len(BODY) - 1}/{len(BODY)}"}), BODY[start:]
+
+    return respond
+
+
+def download(site, site_importer, engine: str, route, kept: int):
+    site.routes["/file.pdf"] = route
+    importer = site_importer(engine)
+    url = site.url + "/file.pdf"
+    keep_partial(importer, url, kept)
+    importer.assets_map.add_new(url)
+    importer.download_assets()
+    entry = importer.assets_map[url]
+    assert entry.status is Status.DOWNLOADED
+    assert importer.store.read(entry.path) == BODY
+    return [headers.get("Range") for path, headers in site.requests if path == "/file.pdf"]
+
+
+@pytest.mark.parametrize("engine", ["threads", "asyncio"])
+def test_missing_bytes_are_requested(site, site_importer, engine):
+    assert download(site, site_importer, engine, ranged(), 1000) == ["bytes=1000-"]
+
+
+@pytest.mark.parametrize("engine", ["threads", "asyncio"])
+def test_complete_part_that_gets_416_is_downloaded_again(site, site_importer, engine):
+    assert download(site, site_importer, engine, ranged(status_for_range=416), len(BODY)) \
+        == [f"bytes={len(BODY)}-", None]
+
+
+@pytest.mark.parametrize("engine", ["threads", "asyncio"])
+def test_unexpected_content_range_is_downloaded_again(site, site_importer, engine):
+    assert download(site, site_importer, engine, ranged(first_byte=0), 1000) == ["bytes=1000-", None]
+
+
+def test_changed_body_starts_over(site, site_importer):
+    # the validator no longer matches, so the server sends the whole body in one response
+    site.routes["/file.pdf"] = (200, {"ETag": '"v2"'}, BODY)
+    importer = site_importer()
+    url = site.url + "/file.pdf"
+    keep_partial(importer, url, 1000)
+    importer.assets_map.add_new(url)
+    importer.download_assets()
+    assert importer.store.read(importer.assets_map[url].path) == BODY
+    assert [path for path, _ in site.requests].count("/file.pdf") == 1
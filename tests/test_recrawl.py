@@ -0,0 +1,30 @@
+from app_01_importer import Status, read_page
+
+HTML = {"Content-Type": "text/html; charset=utf-8"}
+
+
+def test_recrawl_rewrites_only_changed_pages(site, site_importer):
+    def with_etag(handler):
+        if handler.headers.get("If-None-Match") == '"b1"':
+            return 304, {"ETag": '"b1"'}, b""
+        return 200, {**HTML, "ETag": '"b1"'}, b"<html><main>b</main></html>"
+
+    site.routes.update({
+        "/": (200, HTML, b"<html><main><a href='/a/'>a</a><a href='/b/'>b</a></main></html>"),
+        "/a/": (200, HTML, b"<html><main>a</main></html>"),
+        "/b/": with_etag,
+    })
+    importer = site_importer()
+    importer.crawl_pages()
+    home = importer.site_map[site.url + "/"]
+
+    site.routes["/a/"] = (200, HTML, b"<html><main>a, edited</main></html>")
+    importer.recrawl()
+
+    assert importer.recrawl_stats == {"changed": 1, "unchanged": 1, "not modified": 1}
+    assert importer.site_map[site.url + "/"] == home
+    entry = importer.site_map[site.url + "/a/"]
+    assert entry.status is Status.DOWNLOADED
+    assert "a, edited" in read_page(importer.store, entry.path)
+    conditional = [headers.get("If-None-Match") for path, headers in site.requests if path == "/b/"]
+    assert conditional == [None, '"b1"']
@@ -0,0 +1,113 @@
+import socket
+import ssl
+import threading
+import time
+
+import pytest
+import requests
+
+import app_01_importer
+from app_01_importer import ErrorKind, Importer, Sitemap, Status, classify_error, exception_chain
+
+
+def raised(url: str) -> Exception:
+    try:
+        requests.get(url, timeout=5)
+    except Exception as e:
+        return e
+    pytest.fail(f"{url} did not fail")
+
+
+def test_ssl_error_chain(site):
+    # TLS against a plain HTTP server, the ssl.SSLError at the end of the chain has a str reason
+    e = raised(site.url.replace("http://", "https://") + "/")
+    chain = list(exception_chain(e))
+    assert any(isinstance(cause, ssl.SSLError) for cause in chain)
+    assert all(isinstance(cause, BaseException) for cause in chain)
+    assert classify_error(e) == ErrorKind.CONNECTION
+
+
+def test_failed_ssl_fetch_is_retried(site, build_dir):
+    site_map = Sitemap(str(build_dir / "map.csv"), None)
+    frontier = app_01_importer.Frontier(site_map)
+    url = site.url.replace("http://", "https://") + "/"
+    site_map.add_new(url)
+    Importer.fail(site_map, frontier, url, raised(url))
+    assert site_map[url].status == Status.RETRY
+    assert frontier.next_due_in() is not None
+
+
+def test_connection_refused():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    assert classify_error(raised(f"http://127.0.0.1:{port}/")) == ErrorKind.CONNECTION
+
+
+def test_dns_error():
+    assert classify_error(raised("http://name-that-does-not-resolve.invalid/")) == ErrorKind.DNS
+
+
+@pytest.mark.parametrize("status, kind", [(429, ErrorKind.THROTTLED), (503, ErrorKind.SERVER_ERROR),
+                                          (404, ErrorKind.CLIENT_ERROR)])
+def test_http_errors(site, status, kind):
+    site.routes["/"] = (status, {}, b"")
+    r = requests.get(site.url + "/")
+    with pytest.raises(requests.HTTPError) as e:
+        r.raise_for_status()
+    assert classify_error(e.value) == kind
+
+
+class DueRetries:
+    """Frontier stand-in whose remaining URLs are all retries that are already due."""
+
+    def __init__(self, urls: list[str]):
+        self.urls = urls
+        self.polls = 0
+
+    def next(self, in_flight) -> str:
+        return self.urls.pop() if self.urls else None
+
+    def next_due_in(self) -> float:
+        self.polls += 1
+        return 0.0 if self.urls else None
+
+    def __len__(self):
+        return len(self.urls)
+
+
+def test_drain_does_not_spin_while_the_window_is_full():
+    frontier = DueRetries(["a", "b", "c"])
+    done = []
+
+    def task(url):
+        time.sleep(0.2)
+        done.append(url)
+
+    Importer.drain(frontier, task, "test", "url", workers=1)
+    assert sorted(done) == ["a", "b", "c"]
+    assert frontier.polls < 10
+
+
+def test_drain_async_does_not_spin_while_the_window_is_full():
+    import asyncio
+
+    frontier = DueRetries(["a", "b", "c"])
+    done = []
+
+    async def task(url):
+        await asyncio.sleep(0.2)
+        done.append(url)
+
+    asyncio.run(Importer.drain_async(frontier, task, "test", "url", concurrency=2))
+    assert sorted(done) == ["a", "b", "c"]
+    assert frontier.polls < 10
+
+
+def test_drain_waits_for_the_producer():
+    frontier = DueRetries([])
+    producer_done = threading.Event()
+    threading.Timer(0.3, producer_done.set).start()
+    started = time.monotonic()
+    Importer.drain(frontier, lambda url: None, "test", "url", producer_done)
+    assert time.monotonic() - started >= 0.3
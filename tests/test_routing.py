@@ -0,0 +1,65 @@
+import pytest
+
+from app_01_importer import PartialContentWriter, Status, read_page
+from test_crawl import HTML, page
+from test_range_resume import BODY, ETAG, keep_partial, ranged
+
+PDF = {"Content-Type": "application/pdf", "ETag": ETAG}
+
+
+@pytest.mark.parametrize("engine", ["threads", "asyncio"])
+def test_non_html_body_of_a_page_url_is_stored_as_an_asset(site, site_importer, engine):
+    site.routes.update({
+        "/": (200, HTML, page("/download?id=1", "/get/")),
+        "/download?id=1": (200, dict(PDF, **{"Content-Disposition": 'attachment; filename="report.pdf"'}), BODY),
+        "/get/": (302, {"Location": "/files/report"}, b""),
+        "/files/report": (200, PDF, BODY),
+    })
+    importer = site_importer(engine)
+    importer.crawl_pages()
+
+    for url in ("/download?id=1", "/get/", "/files/report"):
+        assert importer.site_map[site.url + url].status is Status.ASSET
+        entry = importer.assets_map[site.url + url]
+        assert entry.status is Status.DOWNLOADED
+        assert entry.path.endswith(".pdf")
+        assert importer.store.read(entry.path) == BODY
+    # nothing was left to resume, so no page fetch asked for a range
+    assert all(headers.get("Range") is None for _, headers in site.requests)
+
+
+@pytest.mark.parametrize("engine", ["threads", "asyncio"])
+def test_interrupted_non_html_body_is_resumed(site, site_importer, engine):
+    site.routes["/"] = (200, HTML, page("/download/"))
+    site.routes["/download/"] = ranged(headers={"Content-Type": "application/pdf"})
+    importer = site_importer(engine)
+    keep_partial(importer, site.url + "/download/", 1000)
+    importer.crawl_pages()
+
+    entry = importer.assets_map[site.url + "/download/"]
+    assert importer.store.read(entry.path) == BODY
+    assert [headers.get("Range") for path, headers in site.requests if path == "/download/"] == ["bytes=1000-"]
+    assert all(headers.get("Range") is None for path, headers in site.requests if path != "/download/")
+
+
+@pytest.mark.parametrize("engine", ["threads", "asyncio"])
+def test_kept_body_of_a_url_that_serves_a_page_now_is_dropped(site, site_importer, engine):
+    # the server answers the range with a part of the page, which must not be parsed as the page
+    text = page(text="the whole page " * 100)
+
+    def respond(handler):
+        if handler.headers.get("Range"):
+            return 206, dict(HTML, **{"Content-Range": f"bytes 1000-{len(text) - 1}/{len(text)}"}), text[1000:]
+        return 200, HTML, text
+
+    site.routes["/"] = (200, HTML, page("/moved/"))
+    site.routes["/moved/"] = respond
+    importer = site_importer(engine)
+    keep_partial(importer, site.url + "/moved/", 1000)
+    importer.crawl_pages()
+
+    entry = importer.site_map[site.url + "/moved/"]
+    assert entry.status is Status.DOWNLOADED
+    assert read_page(importer.store, entry.path) == text.decode("utf-8")
+    assert [headers.get("Range") for path, headers in site.requests if path == "/moved/"] == ["bytes=1000-", None]
+    assert not PartialContentWriter.kept(site.url + "/moved/")
@@ -0,0 +1,108 @@
+import gzip
+
+import pytest
+
+import app_01_importer
+from app_01_importer import Status, parse_sitemap_xml
+
+NS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+
+
+def urlset(urls: list[str]) -> bytes:
+    return f'<urlset {NS}>{"".join(f"<url><loc>{url}</loc></url>" for url in urls)}</urlset>'.encode()
+
+
+def sitemap_index(urls: list[str]) -> bytes:
+    return f'<sitemapindex {NS}>{"".join(f"<sitemap><loc>{url}</loc></sitemap>" for url in urls)}</sitemapindex>'.encode()
+
+
+@pytest.fixture
+def sitemaps(site, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_SEED_FROM_SITEMAPS", True)
+    monkeypatch.setattr(app_01_importer, "IMPORTER_OBEY_ROBOTS", True)
+    site.routes.update({
+        "/robots.txt": (200, {}, f"User-agent: *\nDisallow: /private/\nSitemap: {site.url}/index.xml\n".encode()),
+        "/index.xml": (200, {}, sitemap_index([f"{site.url}/pages.xml.gz"])),
+        "/pages.xml.gz": (200, {}, gzip.compress(urlset([f"{site.url}/a/", "/b/", f"{site.url}/private/x/",
+                                                          "https://other.org/c/"]))),
+    })
+    return site
+
+
+def sitemap_requests(site) -> list[str]:
+    return [path for path, _ in site.requests if path.endswith((".xml", ".gz"))]
+
+
+def test_parse_gzipped_index():
+    assert parse_sitemap_xml(gzip.compress(sitemap_index(["https://example.com/s.xml"]))) \
+        == (True, ["https://example.com/s.xml"])
+
+
+def test_decompressed_size_is_capped():
+    content = gzip.compress(urlset(["https://example.com/"] * 1000))
+    with pytest.raises(ValueError):
+        parse_sitemap_xml(content, max_size=1000)
+    assert len(parse_sitemap_xml(content)[1]) == 1000
+
+
+def test_seed_queues_internal_crawlable_pages(sitemaps, site_importer):
+    importer = site_importer()
+    importer.seed()
+    new = set(importer.site_map.by_status[Status.NEW])
+    assert {sitemaps.url + "/a/", sitemaps.url + "/b/"} <= new
+    assert sitemaps.url + "/private/x/" not in new and "https://other.org/c/" not in new
+
+
+def test_sitemaps_are_read_once(sitemaps, site_importer):
+    importer = site_importer()
+    importer.seed()
+    importer.seed()
+    assert sitemap_requests(sitemaps) == ["/index.xml", "/pages.xml.gz"]
+    importer.close()
+    # a later run reuses the seeding recorded in the state, robots.txt is read for its rules
+    site_importer().seed()
+    assert sitemap_requests(sitemaps) == ["/index.xml", "/pages.xml.gz"]
+    assert [path for path, _ in sitemaps.requests].count("/robots.txt") == 2
+
+
+def test_sitemaps_are_read_again_once_the_seeding_is_old(sitemaps, site_importer, monkeypatch):
+    site_importer().seed()
+    monkeypatch.setattr(app_01_importer, "IMPORTER_SEED_MAX_AGE", 0)
+    site_importer().seed()
+    assert sitemap_requests(sitemaps) == ["/index.xml", "/pages.xml.gz"] * 2
+
+
+def test_entries_are_capped(sitemaps, site_importer, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_SITEMAP_MAX_URLS", 1)
+    importer = site_importer()
+    assert importer.read_sitemaps([sitemaps.url + "/index.xml"]) == [sitemaps.url + "/a/"]
+
+
+def test_oversized_sitemaps_are_skipped(sitemaps, site_importer, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_SITEMAP_MAX_SIZE", 100)
+    importer = site_importer()
+    assert importer.read_sitemaps([sitemaps.url + "/index.xml"]) == []
+
+
+def test_no_robots_or_sitemaps_by_default(site, site_importer):
+    site.routes["/"] = (200, {"Content-Type": "text/html"}, b"<html><main>home</main></html>")
+    site_importer().crawl_pages()
+    assert [path for path, _ in site.requests if path != "/"] == []
+
+
+def test_robots_rules_without_sitemaps(sitemaps, site_importer, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_SEED_FROM_SITEMAPS", False)
+    importer = site_importer()
+    importer.seed()
+    assert [path for path, _ in sitemaps.requests] == ["/robots.txt"]
+    assert not importer.is_crawlable(sitemaps.url + "/private/x/")
+
+
+def test_seed_command_reads_the_sitemaps(sitemaps, site_importer, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_SEED_FROM_SITEMAPS", False)
+    monkeypatch.setattr(app_01_importer, "IMPORTER_OBEY_ROBOTS", False)
+    importer = site_importer()
+    importer.seed(from_sitemaps=True)
+    assert sitemap_requests(sitemaps) == ["/index.xml", "/pages.xml.gz"]
+    # the rules are read, not obeyed
+    assert importer.robots is None
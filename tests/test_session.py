@@ -0,0 +1,16 @@
+from app_01_importer import IMPORTER_HEADERS, IMPORTER_MAX_WORKERS
+
+
+def test_session_sends_the_importer_headers_and_reuses_its_connection(site, importer):
+    site.routes["/page/"] = (200, {"Content-Type": "text/html"}, b"<html></html>")
+    for _ in range(5):
+        importer.get(site.url + "/page/").raise_for_status()
+
+    assert all(headers["User-Agent"] == IMPORTER_HEADERS["User-Agent"] for _, headers in site.requests)
+    stats = importer.get_connection_stats()
+    assert stats == {"requests": 5, "connections": 1, "reused": 4}
+
+
+def test_session_pool_holds_a_connection_per_worker(importer):
+    adapter = importer.session.get_adapter("https://example.org/")
+    assert adapter._pool_maxsize == IMPORTER_MAX_WORKERS
@@ -0,0 +1,148 @@
+import socket
+import threading
+
+import pytest
+
+import app_01_importer
+from app_01_importer import CrawlCoordinator, MessageChannel, ShardRing, ShardWorker, Status
+from test_crawl import serve_small_site
+
+
+class Recorder:
+    """Coordinator channel stand-in."""
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message: dict):
+        self.messages.append(message)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def foreign_url(worker: ShardWorker) -> str:
+    return next(url for url in (f"https://example.com/{i}/" for i in range(100)) if not worker.owns(url))
+
+
+@pytest.fixture
+def worker(build_dir):
+    instance = ShardWorker("a")
+    instance.ring = ShardRing(["a", "b"])
+    instance.coordinator = Recorder()
+    yield instance
+    for channel in instance.peers.values():
+        channel.close()
+    instance.close()
+
+
+def test_links_that_could_not_be_sent_are_sent_with_the_next_flush(worker):
+    url = foreign_url(worker)
+    worker.addresses = {"b": ["127.0.0.1", free_port()]}
+    worker.forward(url, "page", 2)
+    worker.flush()
+    # still waiting to be sent, so the worker is not idle and the coordinator keeps polling
+    assert worker.sent == 0
+    assert worker.status()["idle"] is False
+
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        worker.addresses = {"b": ["127.0.0.1", listener.getsockname()[1]]}
+        worker.flush()
+        sock, _ = listener.accept()
+        channel = MessageChannel(sock)
+        assert next(iter(channel)) == {"type": "urls", "urls": [["page", url, 2]]}
+        channel.close()
+    assert worker.sent == 1
+    assert worker.status() == {"type": "status", "idle": True, "sent": 1, "received": 0}
+
+
+def test_truncated_message_is_not_read(build_dir):
+    a, b = socket.socketpair()
+    a.sendall(b'{"type": "urls", "urls": []}\n{"type": "ur')
+    a.close()
+    assert list(MessageChannel(b)) == [{"type": "urls", "urls": []}]
+
+
+def test_distributed_crawl_terminates(site, build_dir, monkeypatch):
+    serve_small_site(site)
+    monkeypatch.setattr(app_01_importer, "IMPORTER_START_URL", site.url + "/")
+    monkeypatch.setattr(app_01_importer, "IMPORTER_SHARD_POLL_INTERVAL", 0.1)
+    coordinator = CrawlCoordinator(2, ("127.0.0.1", 0))
+    address = coordinator.server.getsockname()
+    workers = [threading.Thread(target=ShardWorker(name, address).run) for name in ("a", "b")]
+    for thread in workers:
+        thread.start()
+    coordinator.run()
+    for thread in workers:
+        thread.join(10)
+        assert not thread.is_alive()
+
+    assert {url: entry.status for url, entry in coordinator.site_map.items()} == {
+        site.url + "/": Status.DOWNLOADED,
+        site.url + "/a/": Status.DOWNLOADED,
+        site.url + "/b/": Status.DOWNLOADED,
+        site.url + "/missing/": Status.ERROR,
+    }
+    assert coordinator.assets_map[site.url + "/logo.png"].status is Status.DOWNLOADED
+
+
+def test_lost_worker_stops_the_others(build_dir, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_SHARD_POLL_INTERVAL", 0.05)
+    coordinator = CrawlCoordinator(2, ("127.0.0.1", 0))
+    address = coordinator.server.getsockname()
+    failure = []
+
+    def run():
+        try:
+            coordinator.run()
+        except RuntimeError as e:
+            failure.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    live, lost = MessageChannel.connect(address), MessageChannel.connect(address)
+    live.send({"type": "hello", "name": "live", "address": ["127.0.0.1", 1]})
+    lost.send({"type": "hello", "name": "lost", "address": ["127.0.0.1", 2]})
+    messages = iter(live)
+    assert next(messages)["type"] == "start"
+    lost.close()
+    while (message := next(messages))["type"] == "poll":
+        live.send({"type": "status", "idle": False, "sent": 0, "received": 0})
+    assert message == {"type": "stop"}
+    live.send({"type": "done"})
+    thread.join(10)
+    live.close()
+    assert "lost" in str(failure[0])
+
+
+def test_worker_advertises_a_reachable_address(site, build_dir, monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_START_URL", site.url + "/")
+    coordinator = socket.create_server(("127.0.0.1", 0))
+
+    def hello(worker_host, bind_host) -> list:
+        monkeypatch.setattr(app_01_importer, "IMPORTER_WORKER_HOST", worker_host)
+        monkeypatch.setattr(app_01_importer, "IMPORTER_WORKER_BIND_HOST", bind_host)
+        worker = ShardWorker("a", coordinator.getsockname())
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        sock, _ = coordinator.accept()
+        channel = MessageChannel(sock)
+        messages = iter(channel)
+        address = next(messages)["address"]
+        # the listener is up before the hello
+        socket.create_connection(tuple(address), timeout=5).close()
+        channel.send({"type": "start", "workers": {"a": address}})
+        channel.send({"type": "stop"})
+        assert any(message["type"] == "done" for message in messages)
+        thread.join(10)
+        channel.close()
+        return address
+
+    # the address the worker reaches the coordinator from
+    assert hello(None, None)[0] == "127.0.0.1"
+    # listening on every interface, the other workers are told the configured name
+    assert hello("localhost", "0.0.0.0")[0] == "localhost"
+    coordinator.close()
@@ -0,0 +1,111 @@
+import sqlite3
+
+import pytest
+
+import app_01_importer as importer
+from app_01_importer import ErrorKind, Sitemap, SitemapEntry, SqliteSitemap, Status
+
+START_URL = "https://example.org/"
+
+
+def sample_entries() -> dict:
+    checksum = "ab" * 32
+    return {
+        "https://example.org/a/": SitemapEntry(Status.DOWNLOADED, checksum, f"{checksum}.html", "text/html",
+                                               etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT",
+                                               simhash=0x0123456789ABCDEF),
+        "https://example.org/b/": SitemapEntry(Status.RETRY, error="timed out", error_kind=ErrorKind.READ_TIMEOUT,
+                                               attempts=2, next_attempt_at=1700000000.5),
+        "https://example.org/c/": SitemapEntry(Status.DUPLICATE, mimetype="text/html",
+                                               duplicate_of="https://example.org/a/"),
+    }
+
+
+def row(url: str, entry: SitemapEntry) -> dict:
+    # CSV has no None, empty strings read back as empty strings
+    return {name: value or None for name, value in Sitemap.entry_to_row(url, entry).items()}
+
+
+def fill(site_map: Sitemap):
+    for url, entry in sample_entries().items():
+        site_map.put(url, entry, persist=False)
+    site_map.persist()
+
+
+def test_csv_sitemap_round_trip(tmp_path):
+    path = str(tmp_path / "map.csv")
+    fill(Sitemap(path, START_URL))
+
+    loaded = Sitemap(path, START_URL)
+    for url, entry in sample_entries().items():
+        assert row(url, loaded[url]) == row(url, entry)
+    assert loaded[START_URL].status is Status.NEW
+
+
+def test_sqlite_sitemap_round_trip(tmp_path):
+    path = str(tmp_path / "map.sqlite")
+    site_map = SqliteSitemap(path, START_URL)
+    fill(site_map)
+    site_map.close()
+
+    loaded = SqliteSitemap(path, START_URL)
+    for url, entry in sample_entries().items():
+        assert loaded[url] == entry
+    assert loaded.count(Status.NEW) == 1
+    loaded.close()
+
+
+def test_sqlite_sitemap_commits_in_batches(tmp_path):
+    path = str(tmp_path / "map.sqlite")
+    site_map = SqliteSitemap(path, None, batch_size=3, flush_interval=3600)
+    site_map.add_new("https://example.org/1/")
+    site_map.add_new("https://example.org/2/")
+    assert len(site_map.dirty) == 2
+    site_map.add_new("https://example.org/3/")
+    assert not site_map.dirty
+    site_map.close()
+
+
+def test_sqlite_sitemap_imports_csv_once(tmp_path):
+    csv_path = str(tmp_path / "map.csv")
+    fill(Sitemap(csv_path, START_URL))
+
+    site_map = SqliteSitemap(str(tmp_path / "map.sqlite"), START_URL, csv_path)
+    assert set(site_map) == set(sample_entries()) | {START_URL}
+    site_map.close()
+
+
+def test_open_sitemap_follows_the_backend_setting(tmp_path, monkeypatch):
+    csv_path, db_path = str(tmp_path / "map.csv"), str(tmp_path / "map.sqlite")
+    monkeypatch.setattr(importer, "IMPORTER_STATE_BACKEND", "sqlite")
+    site_map = importer.open_sitemap(csv_path, db_path, START_URL)
+    assert isinstance(site_map, SqliteSitemap)
+    site_map.close()
+    monkeypatch.setattr(importer, "IMPORTER_STATE_BACKEND", "csv")
+    assert type(importer.open_sitemap(csv_path, db_path, START_URL)) is Sitemap
+
+
+def test_read_only_sitemap_leaves_the_state_as_it_is(tmp_path, monkeypatch):
+    csv_path, db_path = str(tmp_path / "map.csv"), str(tmp_path / "map.sqlite")
+    fill(Sitemap(csv_path, START_URL))
+    monkeypatch.setattr(importer, "IMPORTER_STATE_BACKEND", "sqlite")
+
+    # no database yet: the CSV is read, not imported
+    site_map = importer.open_sitemap(csv_path, db_path, None, read_only=True)
+    assert set(site_map) == set(sample_entries()) | {START_URL}
+    assert not (tmp_path / "map.sqlite").exists()
+
+    importer.open_sitemap(csv_path, db_path, START_URL).close()
+    site_map = importer.open_sitemap(csv_path, db_path, None, read_only=True)
+    assert isinstance(site_map, SqliteSitemap)
+    assert set(site_map) == set(sample_entries()) | {START_URL}
+    site_map.close()
+
+
+def test_importer_close_closes_the_database(build_dir, monkeypatch):
+    monkeypatch.setattr(importer, "IMPORTER_STATE_BACKEND", "sqlite")
+    instance = importer.Importer()
+    instance.close()
+    for site_map in (instance.site_map, instance.assets_map):
+        with pytest.raises(sqlite3.ProgrammingError):
+            site_map.connection.execute("SELECT 1")
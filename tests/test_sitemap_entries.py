@@ -0,0 +1,62 @@
+import copy
+
+from app_01_importer import Sitemap, SitemapEntry, Status
+
+CHECKSUM = "0f" * 32
+
+
+def test_entry_keeps_only_the_extension_of_content_addressed_paths():
+    entry = SitemapEntry(Status.DOWNLOADED, CHECKSUM, f"{CHECKSUM}.html", "text/html")
+    assert entry.digest == bytes.fromhex(CHECKSUM)
+    assert entry.stored_path == ".html"
+    assert entry.path == f"{CHECKSUM}.html"
+    assert entry.hash == CHECKSUM
+
+
+def test_entry_keeps_other_paths_as_they_are():
+    entry = SitemapEntry(Status.DOWNLOADED, CHECKSUM, "legacy/page.html")
+    assert entry.path == "legacy/page.html"
+
+
+def test_entry_copy_is_independent():
+    entry = SitemapEntry(Status.NEW)
+    copied = copy.copy(entry)
+    copied.status = Status.DOWNLOADED
+    assert entry.status is Status.NEW
+    assert copied != entry
+
+
+def test_by_status_follows_every_change(tmp_path):
+    site_map = Sitemap(str(tmp_path / "map.csv"), None)
+    site_map.put("https://example.org/a/", SitemapEntry(Status.NEW), persist=False)
+    site_map.put("https://example.org/b/", SitemapEntry(Status.NEW), persist=False)
+    site_map.put("https://example.org/a/", SitemapEntry(Status.DOWNLOADED), persist=False)
+    assert site_map.get_new_entries() == ["https://example.org/b/"]
+    assert site_map.count(Status.DOWNLOADED) == 1
+
+    del site_map["https://example.org/b/"]
+    assert site_map.count(Status.NEW) == 0
+    site_map.clear()
+    assert site_map.count(Status.DOWNLOADED) == 0
+
+
+def test_get_entries_limit_and_filter(tmp_path):
+    site_map = Sitemap(str(tmp_path / "map.csv"), None)
+    for i in range(5):
+        site_map.put(f"https://example.org/{i}.jpg" if i % 2 else f"https://example.org/{i}/",
+                     SitemapEntry(Status.NEW), persist=False)
+    assert site_map.get_entries(Status.NEW, 2) == ["https://example.org/0/", "https://example.org/1.jpg"]
+    assert site_map.get_entries(Status.NEW, where=lambda url: url.endswith(".jpg")) == [
+        "https://example.org/1.jpg", "https://example.org/3.jpg"]
+
+
+def test_only_frontier_statuses_are_indexed(tmp_path):
+    site_map = Sitemap(str(tmp_path / "map.csv"), None)
+    for i, status in enumerate([Status.NEW, Status.DOWNLOADED, Status.IGNORED, Status.DOWNLOADED]):
+        site_map.put(f"https://example.org/{i}/", SitemapEntry(status), persist=False)
+    assert set(site_map.by_status) == set(Sitemap.indexed_statuses)
+    assert site_map.count(Status.DOWNLOADED) == 2
+    assert site_map.get_entries(Status.DOWNLOADED) == ["https://example.org/1/", "https://example.org/3/"]
+    assert [url for url, _ in site_map.get_downloaded_entries()] == ["https://example.org/1/", "https://example.org/3/"]
+    site_map.put("https://example.org/1/", SitemapEntry(Status.ERROR), persist=False)
+    assert site_map.count(Status.DOWNLOADED) == 1 and site_map.count(Status.ERROR) == 1
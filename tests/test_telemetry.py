@@ -0,0 +1,51 @@
+import app_01_importer
+from app_01_importer import RequestSample, Telemetry
+
+
+def observed(host: str, content_type: str, status: int = 200) -> Telemetry:
+    telemetry = Telemetry()
+    sample = RequestSample()
+    sample.headers_received(status, {"Content-Type": content_type})
+    sample.size = 10
+    telemetry.observe_request(host, sample)
+    return telemetry
+
+
+def test_prometheus_label_values_are_escaped():
+    telemetry = observed('evil"host\\\n', 'text/"html')
+    with telemetry.lock:
+        text = telemetry.prometheus()
+    assert 'importer_responses_total{host="evil\\"host\\\\\\n",status="200"} 1' in text
+    assert 'content_type="text/\\"html"' in text
+    # every sample is on one line
+    assert all(line.startswith(("#", "importer_")) for line in text.splitlines())
+
+
+def test_timeline_is_bounded(monkeypatch):
+    monkeypatch.setattr(app_01_importer, "IMPORTER_TELEMETRY_TIMELINE", 3)
+    telemetry = observed("example.com", "text/html")
+    for _ in range(5):
+        summary, _ = telemetry.snapshot()
+    assert len(summary["timeline"]) == 3
+
+
+def test_writer_starts_only_for_fetch_commands(site, site_importer):
+    importer = site_importer()
+    assert importer.telemetry.writer is None
+    importer.seed()
+    importer.extract_assets()
+    assert importer.telemetry.writer is None
+    importer.download_assets()
+    writer = importer.telemetry.writer
+    assert writer is not None and writer.is_alive()
+    importer.start_telemetry()
+    assert importer.telemetry.writer is writer
+
+
+def test_write(build_dir):
+    telemetry = observed("example.com", "text/html")
+    telemetry.json_path = str(build_dir / "telemetry.json")
+    telemetry.prom_path = str(build_dir / "telemetry.prom")
+    telemetry.write()
+    assert "importer_responses_total" in (build_dir / "telemetry.prom").read_text()
+    assert '"requests": 1' in (build_dir / "telemetry.json").read_text()